@@ -0,0 +1,144 @@
+# 多相机融合的可重复检查，不需要相机：合成参考相机和第二个相机（已知外参）看到同一段标定板运动的两个录像，
+# 分别用 Camera（只用参考相机的录像）和 MultiCamera（两个录像，逐帧同步）求位姿，
+# 检查每帧融合后的位姿与单相机位姿一致，并打印两者相对合成真值的误差；
+# 再在运行中反复修改 selected_indices（界面或配置文件热加载），检查各相机的工作线程不受影响、仍然两个相机都参与融合
+#
+# 用法（可在任意目录下运行）：
+#   python check_multi_camera.py
+#   python check_multi_camera.py --frames 60 --max-rotation-deg 0.2 --max-translation-mm 1
+# 有帧不一致或未检测到标定板时退出码为 1
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+import synthetic
+
+DATA_DIR = os.path.join(BENCH_DIR, '..', 'temp', 'benchmarks', 'data')
+RESOLUTION = (1280, 720)
+
+
+def second_camera_extrinsic() -> np.ndarray:
+    '''第二个相机：在参考相机右侧 3 厘米、绕 y 轴转 3 度，与参考相机看到的标定板几乎相同'''
+    E = np.eye(4)
+    E[:3, :3] = cv2.Rodrigues(np.array([0.0, np.radians(3), 0.0]))[0]
+    E[:3, 3] = [0.03, 0.0, 0.0]
+    return E
+
+
+def pose_difference(a: np.ndarray, b: np.ndarray):
+    '''两个 4x4 位姿的旋转差(度)和平移差(毫米)'''
+    R = a[:3, :3].T @ b[:3, :3]
+    angle = np.degrees(np.arccos(np.clip((np.trace(R) - 1) / 2, -1.0, 1.0)))
+    return angle, np.linalg.norm(a[:3, 3] - b[:3, 3]) * 1000
+
+
+def opencv_pose(rvec: np.ndarray, tvec: np.ndarray) -> np.ndarray:
+    T = np.eye(4)
+    T[:3, :3] = cv2.Rodrigues(rvec)[0]
+    T[:3, 3] = tvec.reshape(3)
+    return T
+
+
+def check_config_reload(multi, config, frames: int) -> list:
+    '''每隔几帧在两组角点之间切换 selected_indices，按 ImageGenerator 的方式把变化交给 MultiCamera'''
+    index_sets = [list(config.selected_indices), list(range(config.chessboard_size[0] * config.chessboard_size[1]))]
+    changes = set()
+    config.add_listener(changes.update)
+    failures = []
+    for k in range(frames):
+        if k % 3 == 0:
+            config.apply({'selected_indices': index_sets[(k // 3) % 2]})
+        if changes:
+            multi.apply_config_changes(set(changes))
+            changes.clear()
+        ret, observations = multi.detect_chessboard(multi.capture_frame())
+        if ret:
+            multi.solve_pose(observations)
+            multi.last_result()
+        if not ret or len(observations) != 2:
+            failures.append(f"热加载帧 {k}: 融合使用了 {len(observations)} 个相机")
+    stopped = [f"相机 {worker.index} 的工作线程已停止: {worker.error}" for worker in multi.workers
+               if worker.error is not None]
+    print(f"热加载 selected_indices：{frames - len(failures)}/{frames} 帧两个相机参与融合")
+    return failures + stopped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用录像文件检查多相机融合的位姿")
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--max-rotation-deg', type=float, default=0.5, help="融合位姿与单相机位姿允许的旋转差")
+    parser.add_argument('--max-translation-mm', type=float, default=2.0, help="融合位姿与单相机位姿允许的平移差")
+    args = parser.parse_args()
+    # src 中的模块按运行目录的相对路径读取配置，benchmarks 目录下没有 deploy_config.json，使用默认参数
+    os.chdir(BENCH_DIR)
+    from camera import Camera
+    from config import Config
+    from multi_camera import MultiCamera
+
+    config = Config(camera_test=False)
+    config.camera_resolution = RESOLUTION
+    extrinsic = second_camera_extrinsic()
+    video_args = (DATA_DIR, RESOLUTION, config.chessboard_size, config.chessboard_square_size, config.fy, args.frames)
+    paths = [synthetic.chessboard_video(*video_args), synthetic.chessboard_video(*video_args, extrinsic=extrinsic)]
+    truth = synthetic.board_poses(args.frames)
+
+    single = Camera(config, None, paths[0])
+    single_poses, single_cv = [], []
+    try:
+        for _ in range(args.frames):
+            ret, corners = single.detect_chessboard(single.capture_frame())
+            if not ret:
+                single_poses.append(None)
+                single_cv.append(None)
+                continue
+            single_poses.append(single.solve_pose(corners)[0])
+            single_cv.append(opencv_pose(single.rvec, single.tvec))
+    finally:
+        single.release()
+
+    config.camera_sources = paths
+    config.camera_extrinsics = np.stack([np.eye(4), extrinsic])
+    multi = MultiCamera(config)
+    failures = []
+    rows = []
+    try:
+        for k in range(args.frames):
+            ret, observations = multi.detect_chessboard(multi.capture_frame())
+            if not ret or single_poses[k] is None or len(observations) != 2:
+                failures.append(f"帧 {k}: 单相机{'未' if single_poses[k] is None else '已'}检测到，"
+                                f"融合使用了 {len(observations)} 个相机")
+                continue
+            fused = multi.solve_pose(observations)[0]
+            rotation, translation = pose_difference(fused, single_poses[k])
+            fused_truth = pose_difference(opencv_pose(multi.rvec, multi.tvec), truth[k])
+            single_truth = pose_difference(single_cv[k], truth[k])
+            rows.append((rotation, translation) + fused_truth + single_truth)
+            if rotation > args.max_rotation_deg or translation > args.max_translation_mm:
+                failures.append(f"帧 {k}: 融合与单相机相差 {rotation:.3f} 度, {translation:.2f} mm")
+        failures += check_config_reload(multi, config, args.frames * 2)
+    finally:
+        multi.release()
+
+    if rows:
+        rows = np.array(rows)
+        print(f"{len(rows)}/{args.frames} 帧融合（两个相机）")
+        for name, columns in (('融合 vs 单相机', (0, 1)), ('融合 vs 真值', (2, 3)), ('单相机 vs 真值', (4, 5))):
+            rotation, translation = rows[:, columns[0]], rows[:, columns[1]]
+            print(f"{name:<12} 旋转 最大 {rotation.max():.3f} 度 平均 {rotation.mean():.3f} 度   "
+                  f"平移 最大 {translation.max():.2f} mm 平均 {translation.mean():.2f} mm")
+    for failure in failures:
+        print(failure)
+    if failures:
+        print(f"{len(failures)} 帧未通过")
+        sys.exit(1)
+    print("通过")
+
+
+if __name__ == '__main__':
+    main()
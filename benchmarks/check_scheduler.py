@@ -0,0 +1,80 @@
+# ViewScheduler 的帧率检查，不需要相机和GL：用假时钟模拟主循环（相机帧按 camera_fps 到达并带抖动，
+# 每帧先检测，再按调度结果渲染各视图），检查 achieved_rates() 接近 view_target_fps（不超过相机帧率）
+#
+# 用法（可在任意目录下运行）：
+#   python check_scheduler.py
+#   python check_scheduler.py --seconds 20 --jitter-ms 3 --tolerance 0.05
+# 有视图的实际帧率偏离目标超过容差时退出码为 1
+import argparse
+import os
+import sys
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+DETECT_MS = 3.0
+# 各视图的渲染耗时(毫秒)，与实际测得的量级相同
+VIEW_COST_MS = {'camera': 5.0, 'tooth': 3.0, 'front': 2.0, 'top': 2.0, 'side': 2.0, 'debug': 1.0}
+
+
+class FakeClock:
+    '''代替 scheduler 模块中的 time，只提供 perf_counter_ns'''
+    def __init__(self):
+        self.now_ns = 0
+
+    def perf_counter_ns(self) -> int:
+        return self.now_ns
+
+    def advance_ms(self, ms: float) -> None:
+        self.now_ns += int(ms * 1e6)
+
+
+def simulate(config, seconds: float, jitter_ms: float, seed: int = 0) -> dict:
+    '''按 ImageGenerator._process_frame 的顺序运行调度器，所有视图每帧都是候选（位姿一直在变），返回实际帧率'''
+    import scheduler
+    clock = FakeClock()
+    scheduler.time = clock
+    view_scheduler = scheduler.ViewScheduler(config)
+    rng = np.random.default_rng(seed)
+    views = range(len(config.view_names))
+    for k in range(int(seconds * config.camera_fps)):
+        clock.now_ns = max(clock.now_ns, int((k / config.camera_fps + rng.uniform(-jitter_ms, jitter_ms) / 1e3) * 1e9))
+        view_scheduler.begin_cycle()
+        clock.advance_ms(DETECT_MS)
+        for view in view_scheduler.due_views(views):
+            if not view_scheduler.fits(view):
+                continue
+            cost_ms = VIEW_COST_MS[config.view_names[view]]
+            clock.advance_ms(cost_ms)
+            view_scheduler.record_run(view, int(cost_ms * 1e6))
+    return view_scheduler.achieved_rates()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用假时钟检查视图调度达到的帧率")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--jitter-ms', type=float, default=2.0, help="相机帧到达时间的抖动（均匀分布的最大值）")
+    parser.add_argument('--tolerance', type=float, default=0.05, help="实际帧率与目标的相对偏差上限")
+    args = parser.parse_args()
+    from config import Config
+    config = Config(camera_test=False)
+    failures = 0
+    for jitter_ms in sorted({0.0, args.jitter_ms}):
+        rates = simulate(config, args.seconds, jitter_ms)
+        print(f"相机 {config.camera_fps} fps，抖动 ±{jitter_ms:g} ms")
+        for name, rate in rates.items():
+            target = config.view_target_fps.get(name, 0)
+            target = min(target, config.camera_fps) if target > 0 else config.camera_fps
+            ok = abs(rate - target) <= args.tolerance * target
+            failures += not ok
+            print(f"  {name:<8}{rate:6.2f} Hz  目标 {target:g}  {'ok' if ok else '偏离'}")
+    if failures:
+        print(f"{failures} 项未通过")
+        sys.exit(1)
+    print("通过")
+
+
+if __name__ == '__main__':
+    main()
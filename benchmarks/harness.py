@@ -0,0 +1,166 @@
+# 基准测试的计时、结果记录和与基线的比较
+# 结果键为 "<模块>/<名称>[<参数>]"，比较使用中位数；阈值按模块配置（thresholds.json），超过即视为性能回退
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+
+def result_key(group: str, name: str, params: Optional[dict] = None) -> str:
+    if not params:
+        return f"{group}/{name}"
+    return f"{group}/{name}[{','.join(f'{k}={v}' for k, v in params.items())}]"
+
+
+def quietly(fn: Callable, *args, **kwargs):
+    '''调用 fn 并丢弃其输出（预处理函数的进度信息）'''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    '''先运行 warmup 次（建立缓存、上传GPU缓冲等），再计时 repeat 次，返回毫秒统计'''
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter_ns()
+        fn()
+        samples[i] = (time.perf_counter_ns() - start) / 1e6
+    return {'runs': repeat,
+            'median_ms': float(np.median(samples)),
+            'mean_ms': float(samples.mean()),
+            'min_ms': float(samples.min()),
+            'p95_ms': float(np.percentile(samples, 95)),
+            'std_ms': float(samples.std())}
+
+
+class BenchmarkRunner:
+    '''收集各基准的结果；repeat_scale 统一缩放重复次数（--quick 时减少）'''
+    def __init__(self, repeat_scale: float = 1.0):
+        self.repeat_scale = repeat_scale
+        self.results: Dict[str, dict] = {}
+        self.errors: Dict[str, str] = {}
+
+    def run(self, group: str, name: str, fn: Callable[[], object], params: Optional[dict] = None,
+            repeat: int = 20, warmup: int = 1, quiet: bool = False) -> Optional[dict]:
+        '''计时一个基准并打印一行结果；quiet=True 时丢弃被测函数的输出（如预处理的进度信息）'''
+        key = result_key(group, name, params)
+        if quiet:
+            inner = fn
+
+            def fn():
+                return quietly(inner)
+        # 缩减后至少保留 3 次（原本就少于 3 次的除外），中位数才有意义
+        stats = measure(fn, max(min(repeat, 3), int(round(repeat * self.repeat_scale))), warmup)
+        self.results[key] = {'group': group, 'name': name, 'params': params or {}, **stats}
+        print(f"{key:<56}{stats['median_ms']:10.3f} ms  p95 {stats['p95_ms']:9.3f}  n={stats['runs']}")
+        return stats
+
+    def fail(self, group: str, error: BaseException) -> None:
+        '''记录一个模块的基准无法运行（缺少依赖、没有GL等），比较时该模块的结果显示为 missing'''
+        self.errors[group] = f"{type(error).__name__}: {error}"
+        print(f"{group}: 跳过 ({self.errors[group]})")
+
+
+def environment(gl_platform: Optional[str] = None) -> dict:
+    '''记录运行环境，不同机器的结果不能直接比较'''
+    import cv2
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': commit,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'system': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'gl_platform': gl_platform}
+
+
+def save_results(path: str, runner: BenchmarkRunner, env: dict) -> None:
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': env, 'results': runner.results, 'errors': runner.errors}, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def load_thresholds(path: str, overrides: Optional[List[str]] = None) -> Dict[str, float]:
+    '''
+    读取各模块允许的相对变慢比例，如 {"default": 0.15, "render": 0.2}；
+    overrides 为命令行的 "模块=比例"，也可以是完整的结果键，优先于文件中的值
+    '''
+    thresholds = {'default': 0.15}
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            thresholds.update(json.load(f))
+    for item in overrides or ():
+        name, _, value = item.rpartition('=')
+        if not name:
+            raise ValueError(f"阈值应写为 模块=比例: {item}")
+        thresholds[name] = float(value)
+    return thresholds
+
+
+class Comparison(NamedTuple):
+    key: str
+    baseline_ms: Optional[float]
+    current_ms: Optional[float]
+    change: Optional[float]     # 相对变化，+0.2 表示慢了 20%
+    threshold: Optional[float]
+    status: str                 # 'ok' / 'regression' / 'improved' / 'new' / 'missing'
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], thresholds: Dict[str, float],
+            noise_ms: float = 0.02) -> List[Comparison]:
+    '''
+    按中位数与基线比较。变慢超过阈值、且绝对差超过 noise_ms（亚毫秒级基准的计时噪声）时为回退；
+    变快超过阈值为 improved，提示更新基线
+    '''
+    rows = []
+    for key in sorted(set(results) | set(baseline)):
+        current, base = results.get(key), baseline.get(key)
+        if current is None or base is None:
+            rows.append(Comparison(key, base and base['median_ms'], current and current['median_ms'], None, None,
+                                   'missing' if current is None else 'new'))
+            continue
+        group = current['group']
+        threshold = thresholds.get(key, thresholds.get(group, thresholds['default']))
+        b, c = base['median_ms'], current['median_ms']
+        change = (c - b) / b if b > 0 else 0.0
+        if change > threshold and c - b > noise_ms:
+            status = 'regression'
+        elif change < -threshold and b - c > noise_ms:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append(Comparison(key, b, c, change, threshold, status))
+    return rows
+
+
+def format_comparison(rows: List[Comparison]) -> str:
+    lines = [f"{'benchmark':<56}{'baseline':>10}{'current':>10}{'change':>9}  status"]
+    for row in rows:
+        base = f'{row.baseline_ms:10.3f}' if row.baseline_ms is not None else f"{'-':>10}"
+        current = f'{row.current_ms:10.3f}' if row.current_ms is not None else f"{'-':>10}"
+        change = f'{row.change:+8.1%}' if row.change is not None else f"{'':>8}"
+        limit = f' (>{row.threshold:.0%})' if row.status == 'regression' else ''
+        lines.append(f'{row.key:<56}{base}{current} {change}  {row.status}{limit}')
+    return '\n'.join(lines)
@@ -0,0 +1,262 @@
+# 性能回归基准：相机检测/位姿求解、牙齿和相机视图渲染、相机视图合成、轴视图、网格加载、预处理的 SDF 流程
+# 输入全部是合成数据（synthetic.py，已知位姿的棋盘格录像、指定面数的牙齿网格），不需要相机和界面，
+# 可以在只有CPU的机器上用 OSMesa 无界面运行；有GPU驱动时可用 --gl-platform egl
+#
+# 用法（可在任意目录下运行，相对路径参数按当前目录解析）：
+#   python run_benchmarks.py --save-baseline ../temp/benchmarks/baseline.json     # 在目标机器上建立基线
+#   python run_benchmarks.py --baseline ../temp/benchmarks/baseline.json          # 之后每次改动后比较
+#   python run_benchmarks.py --groups camera render --quick --threshold render=0.25
+# 结果写入 --output (JSON)，每个基准记录参数、中位数/均值/p95 等（毫秒）和运行环境；
+# 与基线比较时按模块的阈值（thresholds.json，可用 --threshold 覆盖）判断回退，有回退或有模块无法运行时退出码为 1
+# 基线与机器相关，不要跨机器比较
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'preprocessing'))
+
+from harness import (BenchmarkRunner, compare, environment, format_comparison, load_results, load_thresholds, quietly,
+                     save_results)
+import synthetic
+
+GROUPS = ('camera', 'composite', 'axis', 'mesh_load', 'render', 'sdf')
+# 参数网格：相机分辨率、渲染尺寸、牙齿网格面数、SDF 体素分辨率
+FULL_GRID = {
+    'camera_resolutions': [(640, 480), (1280, 720), (1920, 1080)],
+    'render_sizes': [(320, 240), (640, 480), (1280, 960)],
+    'mesh_faces': [5000, 25000, 100000],
+    'sdf_resolutions': [32, 64],
+    'sdf_faces': [5000, 25000],
+}
+QUICK_GRID = {
+    'camera_resolutions': [(640, 480), (1920, 1080)],
+    'render_sizes': [(640, 480)],
+    'mesh_faces': [5000, 25000],
+    'sdf_resolutions': [32],
+    'sdf_faces': [5000],
+}
+DATA_DIR = os.path.join(BENCH_DIR, '..', 'temp', 'benchmarks', 'data')
+FRAME_COUNT = 30
+_renderers = []     # bench_render 创建的渲染器，见其中的说明
+
+
+def make_config(**overrides):
+    '''默认配置加上覆盖项；benchmarks 目录下没有 deploy_config.json，结果不受现场校准参数影响'''
+    from config import Config
+    config = Config(camera_test=False)
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    return config
+
+
+def _size(size):
+    return f'{size[0]}x{size[1]}'
+
+
+def bench_camera(runner: BenchmarkRunner, grid: dict) -> None:
+    '''采集(MJPG解码)、棋盘格检测（含灰度转换和亚像素）、PnP 位姿求解，按相机分辨率'''
+    from camera import Camera, CapturedFrame
+    from metrics import FrameStamp
+    for resolution in grid['camera_resolutions']:
+        config = make_config(camera_resolution=tuple(resolution))
+        path = synthetic.chessboard_video(DATA_DIR, resolution, config.chessboard_size, config.chessboard_square_size,
+                                          config.fy, FRAME_COUNT)
+        camera = Camera(config, None, path)
+        params = {'res': _size(resolution)}
+        try:
+            runner.run('camera', 'capture_frame', camera.capture_frame, params, repeat=FRAME_COUNT)
+            # 池中的缓冲区会被复用，先复制出所有帧；每次检测用新的 CapturedFrame，灰度图不会被缓存
+            frames = [camera.capture_frame().bgr.copy() for _ in range(FRAME_COUNT)]
+
+            def wrap(bgr):
+                return CapturedFrame(camera.frame_pool, camera.frame_pool.next_slot(), bgr, FrameStamp(0, 0))
+            corners = []
+            for bgr in frames:
+                ret, points = camera.detect_chessboard(wrap(bgr))
+                if ret:
+                    corners.append(points)
+            if len(corners) < len(frames):
+                raise RuntimeError(f"{_size(resolution)}: {len(frames) - len(corners)}/{len(frames)} 帧未检测到标定板")
+            frame_cycle, corner_cycle = itertools.cycle(frames), itertools.cycle(corners)
+            runner.run('camera', 'detect_chessboard', lambda: camera.detect_chessboard(wrap(next(frame_cycle))),
+                       params, repeat=FRAME_COUNT)
+            runner.run('camera', 'solve_pose', lambda: camera.solve_pose(next(corner_cycle)), params, repeat=200)
+        finally:
+            camera.release()
+
+
+def bench_composite(runner: BenchmarkRunner, grid: dict) -> None:
+    '''相机视图的合成（相机模型渲染结果叠加到面部混合图像上），按渲染尺寸'''
+    from compositing import composite_camera_view
+    rng = np.random.default_rng(0)
+    for width, height in grid['render_sizes']:
+        rendering = np.full((height, width, 3), 255, np.uint8)
+        # 相机模型大约占画面的四分之一，其余是白色背景
+        rendering[height // 4:height * 3 // 4, width // 4:width * 3 // 4] = rng.integers(0, 250, (height // 2, width // 2, 3))
+        face = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        runner.run('composite', 'camera_view', lambda: composite_camera_view(rendering, face),
+                   {'size': _size((width, height))}, repeat=50)
+
+
+def bench_axis(runner: BenchmarkRunner, grid: dict) -> None:
+    '''三个轴视图（matplotlib Agg 绘制），画布尺寸固定'''
+    import logging
+    import cv2
+    from axis_view_generator import AxisViewGenerator
+    from camera import pose_matrices
+    import warnings
+    # 没有装中文字体时每次绘制都会警告
+    logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+    warnings.filterwarnings('ignore', message='Glyph .* missing from font')
+    generator = AxisViewGenerator(make_config())
+    poses = itertools.cycle([pose_matrices(cv2.Rodrigues(T[:3, :3])[0], T[:3, 3])[1]
+                             for T in synthetic.board_poses(FRAME_COUNT)])
+    runner.run('axis', 'create_axis', lambda: generator.create_axis(next(poses)), repeat=30)
+    runner.run('axis', 'create_axis_view', lambda: generator.create_axis_view(next(poses), 'front'), repeat=30)
+
+
+def bench_mesh_load(runner: BenchmarkRunner, grid: dict) -> None:
+    '''读取 .obj：单个文件，以及启动时 load_meshes 并行读取全部运行时模型（牙齿、腐蚀牙齿、头部）'''
+    import trimesh
+    from renderer import PyrenderRenderer
+    for faces in grid['mesh_faces']:
+        path = synthetic.mesh_file(DATA_DIR, faces)
+        params = {'faces': faces}
+        runner.run('mesh_load', 'load_mesh', lambda: trimesh.load_mesh(path), params, repeat=5)
+        renderer_class = type('BenchRenderer', (PyrenderRenderer,),
+                              {'MESH_PATHS': {'teeth': path, 'teeth_eroded': path, 'head': synthetic.HEAD_MESH}})
+        runner.run('mesh_load', 'load_meshes', lambda: renderer_class.load_meshes(with_lods=False), params, repeat=5)
+
+
+def bench_render(runner: BenchmarkRunner, grid: dict) -> None:
+    '''
+    牙齿视图和相机视图的渲染（相机视图含瞄准射线检测和合成），按渲染尺寸和牙齿网格面数。
+    不使用 LOD 和距离场，渲染的总是指定面数的网格，瞄准点用网格射线检测
+    '''
+    import cv2
+    import trimesh
+    from camera import pose_matrices
+    from renderer import MeshLod, PyrenderRenderer
+    head = trimesh.load_mesh(synthetic.HEAD_MESH)
+    poses = [pose_matrices(cv2.Rodrigues(T[:3, :3])[0], T[:3, 3])[0] for T in synthetic.board_poses(FRAME_COUNT)]
+    for faces in grid['mesh_faces']:
+        teeth = synthetic.teeth_mesh(faces)
+        meshes = {'teeth': [MeshLod(teeth, 0.0)], 'teeth_eroded': [MeshLod(teeth, 0.0)], 'head': [MeshLod(head, 0.0)]}
+        for size in grid['render_sizes']:
+            config = make_config(render_size=tuple(size), lod_enabled=False, sdf_enabled=False)
+            # 各渲染器保留到进程结束：pyrender 的 EGL 后端删除上下文（cleanup 或对象被回收）时会 eglTerminate
+            # 共用的 display，其他还在用的上下文随之失效
+            renderer = PyrenderRenderer(config, None, meshes)
+            _renderers.append(renderer)
+            params = {'size': _size(size), 'faces': faces}
+            # 每个基准都从第一个位姿开始，各次运行渲染的画面相同
+            tooth_poses, camera_poses = itertools.cycle(poses), itertools.cycle(poses)
+            runner.run('render', 'render_tooth', lambda: renderer.render_tooth(next(tooth_poses)), params, repeat=20)
+            runner.run('render', 'render_camera', lambda: renderer.render_camera(next(camera_poses)), params, repeat=20)
+
+
+def bench_sdf(runner: BenchmarkRunner, grid: dict) -> None:
+    '''
+    预处理的 SDF 流程（process_teeth.py）：体素化（不使用缓存）、平滑、等值面提取、导出运行时 SDF，按体素分辨率；
+    体素化另按网格面数。体素化只用一个进程，结果与核数无关
+    '''
+    import process_teeth
+    os.makedirs(DATA_DIR, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix='sdf_', dir=os.path.dirname(DATA_DIR))
+    try:
+        for resolution in grid['sdf_resolutions']:
+            voxels = None
+            for faces in grid['sdf_faces']:
+                mesh = synthetic.teeth_mesh(faces)
+
+                def voxelize():
+                    cache = tempfile.mkdtemp(dir=scratch)
+                    try:
+                        return process_teeth.compute_sdf(mesh, resolution, workers=1, cache_dir=cache)
+                    finally:
+                        shutil.rmtree(cache)
+                runner.run('sdf', 'voxelize', voxelize, {'res': resolution, 'faces': faces}, repeat=3, warmup=0, quiet=True)
+                if voxels is None:
+                    voxels = np.array(quietly(voxelize))
+            params = {'res': resolution}
+            runner.run('sdf', 'smooth', lambda: process_teeth.smooth_voxels(voxels), params, repeat=5, quiet=True)
+            smoothed = quietly(process_teeth.smooth_voxels, voxels)
+            runner.run('sdf', 'extract_levels', lambda: process_teeth.extract_teeth(smoothed), params, repeat=3)
+            teeth, eroded = process_teeth.extract_teeth(smoothed)
+            centroid, scale_factor = process_teeth.normalize_teeth(teeth, eroded)
+            runner.run('sdf', 'export_sdf',
+                       lambda: process_teeth.export_sdf(smoothed, centroid, scale_factor, resolution, scratch),
+                       params, repeat=3, quiet=True)
+    finally:
+        shutil.rmtree(scratch)
+
+
+BENCHMARKS = {'camera': bench_camera, 'composite': bench_composite, 'axis': bench_axis,
+              'mesh_load': bench_mesh_load, 'render': bench_render, 'sdf': bench_sdf}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能回归基准")
+    parser.add_argument('--groups', nargs='+', default=list(GROUPS), choices=GROUPS, help="只运行这些模块")
+    parser.add_argument('--quick', action='store_true', help="缩小参数网格、减少重复次数")
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, '..', 'temp', 'benchmarks', 'results.json'))
+    parser.add_argument('--baseline', default=None, help="与该结果文件比较")
+    parser.add_argument('--save-baseline', default=None, help="把本次结果另存为基线")
+    parser.add_argument('--thresholds', default=os.path.join(BENCH_DIR, 'thresholds.json'),
+                        help="各模块允许的相对变慢比例")
+    parser.add_argument('--threshold', nargs='+', default=[], metavar='GROUP=RATIO', help="覆盖阈值，如 render=0.25")
+    parser.add_argument('--noise-ms', type=float, default=0.02, help="小于该绝对差的变化不算回退")
+    parser.add_argument('--gl-platform', default='osmesa', choices=('osmesa', 'egl'))
+    args = parser.parse_args()
+    for name in ('output', 'baseline', 'save_baseline', 'thresholds'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    # src 中的模块按运行目录的相对路径（../data、../temp）读取配置和模型，与从 src 运行时相同
+    os.chdir(BENCH_DIR)
+
+    # PYOPENGL_PLATFORM 必须在导入 pyrender 之前设置；mesh_to_sdf 必须在 pyrender 之前导入
+    os.environ.setdefault('PYOPENGL_PLATFORM', args.gl_platform)
+    if 'sdf' in args.groups:
+        try:
+            import process_teeth  # noqa: F401
+        except ImportError as e:
+            print(f"sdf: 无法导入预处理模块 ({e})")
+    thresholds = load_thresholds(args.thresholds, args.threshold)
+    grid = QUICK_GRID if args.quick else FULL_GRID
+    runner = BenchmarkRunner(repeat_scale=0.5 if args.quick else 1.0)
+    for group in GROUPS:
+        if group not in args.groups:
+            continue
+        try:
+            BENCHMARKS[group](runner, grid)
+        except Exception as e:
+            runner.fail(group, e)
+
+    env = environment(os.environ['PYOPENGL_PLATFORM'])
+    save_results(args.output, runner, env)
+    print(f"结果已写入 {args.output}")
+    if args.save_baseline:
+        save_results(args.save_baseline, runner, env)
+        print(f"基线已写入 {args.save_baseline}")
+    failed = bool(runner.errors)
+    if args.baseline:
+        rows = compare(runner.results, load_results(args.baseline), thresholds, args.noise_ms)
+        # 只比较本次运行的模块，没有运行的模块不算 missing
+        rows = [row for row in rows if row.key.split('/')[0] in args.groups]
+        print(format_comparison(rows))
+        regressions = [row for row in rows if row.status == 'regression']
+        if regressions:
+            print(f"{len(regressions)} 项性能回退")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
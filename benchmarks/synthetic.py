@@ -0,0 +1,102 @@
+# 基准测试用的合成数据：已知位姿的棋盘格录像、指定面数的网格
+# 生成结果缓存在数据目录中，参数不变时直接复用，各次运行使用完全相同的输入
+import os
+import zlib
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+import trimesh
+
+MESH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'mesh')
+BASE_MESH = os.path.join(MESH_DIR, 'tooth_mesh.obj')
+HEAD_MESH = os.path.join(MESH_DIR, 'head_mesh.obj')
+RUNTIME_SCALE = 0.05    # 运行时牙齿模型的最大尺寸，与 preprocessing/process_teeth.py 的 MAX_SCALE 相同
+
+
+def board_poses(count: int) -> np.ndarray:
+    '''一段平缓摆动的 标定板->相机 位姿 (count,4,4)，标定板距相机约 0.5 米'''
+    poses = np.tile(np.eye(4), (count, 1, 1))
+    for k in range(count):
+        rvec = np.array([0.1 * np.sin(k / 10), 0.2 + 0.1 * np.cos(k / 7), 0.05])
+        poses[k, :3, :3] = cv2.Rodrigues(rvec)[0]
+        poses[k, :3, 3] = [-0.07 + 0.02 * np.sin(k / 5), -0.05, 0.5]
+    return poses
+
+
+def _board_image(chessboard_size: Tuple[int, int], pixels_per_square: int) -> np.ndarray:
+    '''棋盘格图像：内角点 nx*ny，即 (nx+1)*(ny+1) 个格子，四周留一格白边'''
+    nx, ny = chessboard_size
+    p = pixels_per_square
+    img = np.full(((ny + 3) * p, (nx + 3) * p), 255, np.uint8)
+    for i in range(nx + 1):
+        for j in range(ny + 1):
+            if (i + j) % 2 == 0:
+                img[(j + 1) * p:(j + 2) * p, (i + 1) * p:(i + 2) * p] = 0
+    return img
+
+
+def chessboard_frames(resolution: Tuple[int, int], chessboard_size: Tuple[int, int], square_size: float,
+                      fy: float, poses: np.ndarray) -> np.ndarray:
+    '''按 Camera 的内参模型（fx=fy，主点在图像中心，无畸变）把标定板投影到各帧，(N,H,W) 灰度'''
+    width, height = resolution
+    K = np.array([[fy, 0, width / 2], [0, fy, height / 2], [0, 0, 1]])
+    p = 40
+    board = _board_image(chessboard_size, p)
+    # 标定板图像像素 -> 标定板平面坐标（米），第一个内角点在像素 (2p, 2p)
+    A = np.array([[square_size / p, 0, -2 * square_size], [0, square_size / p, -2 * square_size], [0, 0, 1]])
+    frames = np.empty((len(poses), height, width), np.uint8)
+    for k, T in enumerate(poses):
+        H = K @ np.column_stack([T[:3, 0], T[:3, 1], T[:3, 3]]) @ A
+        cv2.warpPerspective(board, H, (width, height), dst=frames[k], borderValue=180)
+    return frames
+
+
+def chessboard_video(data_dir: str, resolution: Tuple[int, int], chessboard_size: Tuple[int, int],
+                     square_size: float, fy: float, count: int = 30, extrinsic: Optional[np.ndarray] = None) -> str:
+    '''
+    生成（或复用）MJPG 编码的棋盘格录像，与相机的 MJPG 采集格式相同，返回路径。
+    extrinsic 为另一个相机的外参（该相机坐标系 -> 参考相机，与 config.camera_extrinsics 相同），
+    给出时录像是该相机看到的同一段 board_poses
+    '''
+    width, height = resolution
+    name = f'chessboard_{width}x{height}_{chessboard_size[0]}x{chessboard_size[1]}_{square_size:g}_{fy:g}_{count}'
+    poses = board_poses(count)
+    if extrinsic is not None:
+        poses = np.linalg.inv(extrinsic) @ poses
+        name += f'_{zlib.crc32(np.ascontiguousarray(extrinsic, dtype=np.float64).tobytes()):08x}'
+    path = os.path.join(data_dir, f'{name}.avi')
+    if os.path.exists(path):
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    partial = f'{path}.partial.avi'
+    writer = cv2.VideoWriter(partial, cv2.VideoWriter_fourcc(*'MJPG'), 30, (width, height))
+    for frame in chessboard_frames(resolution, chessboard_size, square_size, fy, poses):
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+    writer.release()
+    os.replace(partial, path)
+    return path
+
+
+def teeth_mesh(faces: int) -> trimesh.Trimesh:
+    '''
+    面数约为 faces 的牙齿网格：以牙弓扫描为基础，面数多时先细分（每次面数乘 4），再二次误差简化到目标面数，
+    最后缩放到运行时的尺寸
+    '''
+    mesh = trimesh.load_mesh(BASE_MESH)
+    while len(mesh.faces) < faces:
+        mesh = mesh.subdivide()
+    if faces < len(mesh.faces):
+        mesh = mesh.simplify_quadric_decimation(face_count=faces)
+    mesh.apply_translation(-mesh.bounds.mean(axis=0))
+    mesh.apply_scale(RUNTIME_SCALE / mesh.extents.max())
+    return mesh
+
+
+def mesh_file(data_dir: str, faces: int) -> str:
+    '''teeth_mesh 导出为 .obj（网格加载基准用），返回路径'''
+    path = os.path.join(data_dir, f'teeth_{faces}.obj')
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        teeth_mesh(faces).export(path)
+    return path
@@ -0,0 +1,235 @@
+# 批量预处理：多个病例的头部和牙弓扫描在进程池中并行处理
+#
+# 用法（在 preprocessing 目录下运行）：
+#   python batch_preprocess.py --manifest scans.json --output ../data/patients
+#   python batch_preprocess.py --input-dir ../scans --output ../data/patients --workers 2
+#
+# 清单为 JSON 列表，相对路径相对于清单文件所在目录：
+#   [{"name": "p001", "head": "p001/Head.obj", "teeth": "p001/teeth_down.stl"}, ...]
+# 目录模式下每个子目录是一个病例，文件名含 head 的为头部，含 teeth 或 arch 的为牙弓
+#
+# 每个病例输出到 <output>/<name>/，文件名与运行时使用的一致。输入文件内容和参数都没变、
+# 输出也都存在的任务直接跳过；体素化和平滑另有按内容的缓存（sdf_tools），只改腐蚀量时不会重新体素化。
+# 每个任务每一步的耗时写入 <output>/preprocess_report.json
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+# process_teeth 会导入 mesh_to_sdf，须在任何导入 pyrender 的模块之前
+from process_teeth import process_teeth, teeth_output_paths, sdf_output_path
+from process_face import process_face
+from sdf_tools import DEFAULT_CACHE_DIR
+from lod import lod_sidecar_path, LOD_RATIOS
+
+MESH_EXTENSIONS = ('.obj', '.stl', '.ply', '.off', '.glb')
+STAMP_PREFIX = ".preprocess_stamp"
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(path: str):
+    '''读取 JSON 清单，返回 [{"name", "head", "teeth"}]，相对路径转为绝对路径'''
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    assets = []
+    for entry in entries:
+        asset = {'name': entry['name']}
+        for kind in ('head', 'teeth'):
+            if entry.get(kind):
+                asset[kind] = os.path.normpath(os.path.join(base, entry[kind]))
+        assets.append(asset)
+    return assets
+
+
+def scan_directory(path: str):
+    '''每个子目录一个病例，按文件名识别头部和牙弓扫描'''
+    assets = []
+    for case_dir in sorted(glob.glob(os.path.join(path, '*'))):
+        if not os.path.isdir(case_dir):
+            continue
+        asset = {'name': os.path.basename(case_dir)}
+        for file in sorted(os.listdir(case_dir)):
+            lower = file.lower()
+            if not lower.endswith(MESH_EXTENSIONS):
+                continue
+            if 'head' in lower:
+                asset.setdefault('head', os.path.join(case_dir, file))
+            elif 'teeth' in lower or 'arch' in lower:
+                asset.setdefault('teeth', os.path.join(case_dir, file))
+        if len(asset) > 1:
+            assets.append(asset)
+    return assets
+
+
+def _task_outputs(kind: str, out_dir: str, params: dict):
+    '''任务的主要输出（网格、对应的LOD说明文件，牙齿还有运行时 SDF），用于判断是否需要重新处理'''
+    if kind == 'head':
+        meshes = [os.path.join(out_dir, 'head_mesh.obj')]
+        extra = []
+    else:
+        meshes = teeth_output_paths(out_dir, params['erosion_amounts'])
+        extra = [sdf_output_path(out_dir)]
+    return meshes + [lod_sidecar_path(path) for path in meshes] + extra
+
+
+def _write_stamp(out_dir: str, kind: str, stamp: dict) -> None:
+    # 同一病例的头部和牙齿任务可能在不同进程中同时完成，按任务类型分文件，互不覆盖
+    with open(os.path.join(out_dir, f"{STAMP_PREFIX}.{kind}.json"), 'w', encoding='utf-8') as f:
+        json.dump(stamp, f, indent=2)
+
+
+def _is_current(out_dir: str, kind: str, stamp: dict, outputs) -> bool:
+    '''输入内容、参数与上次相同且输出都在时视为最新'''
+    try:
+        with open(os.path.join(out_dir, f"{STAMP_PREFIX}.{kind}.json"), 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return previous == stamp and all(os.path.exists(path) for path in outputs)
+
+
+def run_task(name: str, kind: str, input_path: str, out_dir: str, params: dict, options: dict, force: bool) -> dict:
+    '''
+    在工作进程中处理一个病例的头部或牙齿，返回报告记录
+    params 决定输出内容，记录在标记文件中用于判断是否最新；options 只影响怎么算（进程数、缓存位置）
+    '''
+    record = {'asset': name, 'kind': kind, 'input': input_path, 'steps': {}, 'pid': os.getpid()}
+    start = time.perf_counter()
+
+    @contextmanager
+    def timer(step):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['steps'][step] = round(time.perf_counter() - t, 3)
+
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        with timer('hash'):
+            stamp = {'input_sha256': file_hash(input_path), 'params': params}
+        outputs = _task_outputs(kind, out_dir, params)
+        if not force and _is_current(out_dir, kind, stamp, outputs):
+            record['status'] = 'skipped'
+        else:
+            if kind == 'head':
+                outputs = process_face(input_path, outputs[0], max_size=params['max_size'],
+                                       lod_ratios=params['lod_ratios'], timer=timer)
+            else:
+                outputs = process_teeth(input_path, out_dir,
+                                        erosion_amounts=params['erosion_amounts'],
+                                        voxel_resolution=params['voxel_resolution'],
+                                        sigma=params['sigma'],
+                                        lod_ratios=params['lod_ratios'],
+                                        sdf_workers=options['sdf_workers'],
+                                        cache_dir=options['cache_dir'],
+                                        timer=timer)
+            _write_stamp(out_dir, kind, stamp)
+            record['status'] = 'done'
+        record['outputs'] = outputs
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = f"{type(e).__name__}: {e}"
+        record['traceback'] = traceback.format_exc()
+    record['total'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def build_tasks(assets, output_root: str, args):
+    '''每个病例的头部和牙齿各是一个任务: (名称, 类型, 输入, 输出目录, 参数, 选项)'''
+    options = {'sdf_workers': args.sdf_workers, 'cache_dir': args.cache_dir}
+    tasks = []
+    for asset in assets:
+        out_dir = os.path.join(output_root, asset['name'])
+        if 'head' in asset:
+            params = {'max_size': args.head_size, 'lod_ratios': args.lod_ratios}
+            tasks.append((asset['name'], 'head', asset['head'], out_dir, params, options))
+        if 'teeth' in asset:
+            params = {'erosion_amounts': args.erosion, 'voxel_resolution': args.resolution,
+                      'sigma': args.sigma, 'lod_ratios': args.lod_ratios}
+            tasks.append((asset['name'], 'teeth', asset['teeth'], out_dir, params, options))
+    return tasks
+
+
+def format_report(records) -> str:
+    steps = []
+    for record in records:
+        for step in record['steps']:
+            if step not in steps:
+                steps.append(step)
+    header = f"{'asset':<16}{'kind':<7}{'status':<9}" + ''.join(f"{s:>13}" for s in steps) + f"{'total':>10}"
+    lines = [header]
+    for r in records:
+        lines.append(f"{r['asset']:<16}{r['kind']:<7}{r['status']:<9}"
+                     + ''.join(f"{r['steps'][s]:>13.2f}" if s in r['steps'] else f"{'-':>13}" for s in steps)
+                     + f"{r['total']:>10.2f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量预处理头部和牙弓扫描")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help="JSON 清单")
+    source.add_argument('--input-dir', help="每个子目录一个病例")
+    parser.add_argument('--output', required=True, help="输出根目录，每个病例一个子目录")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="并行处理的任务数。牙齿任务在 256^3 时约需 1~2GB 内存，按内存而不是核数设置")
+    parser.add_argument('--sdf-workers', type=int, default=1,
+                        help="每个牙齿任务内部体素化的进程数，总进程数约为 workers*sdf-workers")
+    parser.add_argument('--resolution', type=int, default=256)
+    parser.add_argument('--sigma', type=float, default=0.8)
+    parser.add_argument('--erosion', type=float, nargs='+', default=[0.5], help="腐蚀量，可多个")
+    parser.add_argument('--head-size', type=float, default=0.35)
+    parser.add_argument('--lod-ratios', type=float, nargs='*', default=list(LOD_RATIOS),
+                        help="各级 LOD 相对原始网格的面数比例，不给值则不生成")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help="忽略已有输出，全部重新生成")
+    args = parser.parse_args()
+
+    assets = load_manifest(args.manifest) if args.manifest else scan_directory(args.input_dir)
+    tasks = build_tasks(assets, args.output, args)
+    print(f"{len(assets)} assets, {len(tasks)} tasks, {args.workers} workers")
+
+    # 大的牙齿任务先提交，减少最后只剩一个长任务在跑的情况
+    tasks.sort(key=lambda task: task[1] != 'teeth')
+    records = []
+    start = time.perf_counter()
+    # 每个工作进程只处理一个任务就退出，上一个病例的网格、点云不会累积在内存里
+    # (max_tasks_per_child 需要 spawn 启动方式)
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=mp.get_context('spawn'),
+                             max_tasks_per_child=1) as pool:
+        futures = [pool.submit(run_task, *task, args.force) for task in tasks]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            print(f"[{len(records)}/{len(tasks)}] {record['asset']} {record['kind']}: {record['status']} ({record['total']:.1f}s)")
+            if record['status'] == 'failed':
+                print(record['traceback'])
+
+    records.sort(key=lambda r: (r['asset'], r['kind']))
+    os.makedirs(args.output, exist_ok=True)
+    report_path = os.path.join(args.output, 'preprocess_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'wall_time': round(time.perf_counter() - start, 3),
+                   'workers': args.workers,
+                   'records': records}, f, indent=2, ensure_ascii=False)
+    print(format_report(records))
+    print(f"Report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
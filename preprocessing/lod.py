@@ -0,0 +1,68 @@
+# 生成多级细节(LOD)网格：二次误差简化，并记录每一级相对原始网格的几何误差
+#
+# 用法（在 preprocessing 目录下运行）：
+#   python lod.py ../data/mesh/teeth_double_layer.obj ../data/mesh/head_mesh.obj
+#
+# 对 xxx.obj 生成 xxx.lod1.obj、xxx.lod2.obj ... 和说明文件 xxx.lod.json：
+#   {"source": "xxx.obj", "faces": 原始面数,
+#    "levels": [{"file": "xxx.lod1.obj", "faces": 面数, "ratio": 0.5, "error": 最大误差, "rms_error": 均方根误差}, ...]}
+# 误差为两个表面之间双向采样的最近距离（近似 Hausdorff 距离），单位与模型相同，
+# 运行时按投影到屏幕上的像素误差选择级别（renderer.py）
+import argparse
+import json
+import os
+
+import numpy as np
+import trimesh
+
+# 每一级相对原始网格的面数比例
+LOD_RATIOS = (0.5, 0.25, 0.1)
+MIN_FACES = 500     # 面数太少的级别没有意义
+ERROR_SAMPLES = 20000
+
+
+def lod_sidecar_path(mesh_path: str) -> str:
+    return f"{os.path.splitext(mesh_path)[0]}.lod.json"
+
+
+def surface_error(original: trimesh.Trimesh, simplified: trimesh.Trimesh, samples: int = ERROR_SAMPLES):
+    '''两个表面之间双向采样的最近距离，返回 (最大值, 均方根)'''
+    distances = []
+    for source, target in ((original, simplified), (simplified, original)):
+        points = source.sample(samples)
+        _, distance, _ = trimesh.proximity.closest_point(target, points)
+        distances.append(distance)
+    distances = np.concatenate(distances)
+    return float(distances.max()), float(np.sqrt(np.mean(distances ** 2)))
+
+
+def generate_lods(mesh_path: str, ratios=LOD_RATIOS, min_faces: int = MIN_FACES) -> str:
+    '''为一个网格文件生成各级简化网格和说明文件，返回说明文件路径'''
+    mesh = trimesh.load_mesh(mesh_path)
+    stem = os.path.splitext(mesh_path)[0]
+    levels = []
+    for i, ratio in enumerate(ratios, start=1):
+        face_count = int(len(mesh.faces) * ratio)
+        if face_count < min_faces:
+            break
+        simplified = mesh.simplify_quadric_decimation(face_count=face_count)
+        error, rms_error = surface_error(mesh, simplified)
+        path = f"{stem}.lod{i}.obj"
+        simplified.export(path)
+        levels.append({'file': os.path.basename(path), 'faces': len(simplified.faces), 'ratio': ratio,
+                       'error': error, 'rms_error': rms_error})
+        print(f"  {os.path.basename(path)}: {len(simplified.faces)} faces, error {error:.3g} (rms {rms_error:.3g})")
+    sidecar = lod_sidecar_path(mesh_path)
+    with open(sidecar, 'w', encoding='utf-8') as f:
+        json.dump({'source': os.path.basename(mesh_path), 'faces': len(mesh.faces), 'levels': levels}, f, indent=2)
+    return sidecar
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="生成 LOD 网格")
+    parser.add_argument('meshes', nargs='+')
+    parser.add_argument('--ratios', type=float, nargs='+', default=list(LOD_RATIOS))
+    args = parser.parse_args()
+    for path in args.meshes:
+        print(f"Generating LODs for {path}...")
+        generate_lods(path, args.ratios)
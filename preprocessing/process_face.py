@@ -1,49 +1,71 @@
 # 归一化人头
 import trimesh
-from mesh_to_sdf import mesh_to_voxels
-import imageio
 import numpy as np
-import pyrender
-
-material = pyrender.MetallicRoughnessMaterial(
-    metallicFactor=0.0,
-    roughnessFactor=1.0,
-    baseColorFactor=(0.5, 0.5, 0.5, 1.0)  # 纯白色
-)
-
-mesh = trimesh.load_mesh('../../software/Head.obj',material=material)
-
-# 检查 mesh 是否有效
-print(f"Is the mesh watertight? {mesh.is_watertight}")
-print(f"Number of vertices: {len(mesh.vertices)}")
-print(f"Number of faces: {len(mesh.faces)}")
-
-# 可选：修复 mesh（如果需要）
-if not mesh.is_watertight:
-    mesh.fill_holes()  # 尝试修复非封闭的 mesh
-    print("Attempted to repair mesh.")
-
-
-# 步骤 1: 居中化
-# 计算 mesh 的几何中心（质心）
-centroid = mesh.centroid
-
-# 将 mesh 移动到原点
-mesh.apply_translation(-centroid)
-# 步骤 2: 归一化到单位立方体
-# 计算 mesh 的边界框范围
-bounds = mesh.bounds  # [[min_x, min_y, min_z], [max_x, max_y, max_z]]
-extent = mesh.extents  # [x_range, y_range, z_range]
-# 找到最大范围
-max_extent = np.max(extent)
-# 缩放因子：将最大范围缩放到 0.25
-max_size = 0.35
-scale_factor = max_size / max_extent
-# 应用缩放
-mesh.apply_scale(scale_factor)
-
-mesh.visual.material = trimesh.visual.material.SimpleMaterial(
-    diffuse=[255, 255, 255, 255]  # 白色材质
-)
-
-mesh.export('../data/mesh/head_mesh.obj')
\ No newline at end of file
+from contextlib import nullcontext
+from lod import generate_lods, LOD_RATIOS
+
+# 缩放因子：将最大范围缩放到 0.35
+MAX_SIZE = 0.35
+
+
+def load_head(path: str) -> trimesh.Trimesh:
+    '''加载头部模型并尝试修复'''
+    mesh = trimesh.load_mesh(path)
+
+    # 检查 mesh 是否有效
+    print(f"Is the mesh watertight? {mesh.is_watertight}")
+    print(f"Number of vertices: {len(mesh.vertices)}")
+    print(f"Number of faces: {len(mesh.faces)}")
+
+    # 可选：修复 mesh（如果需要）
+    if not mesh.is_watertight:
+        mesh.fill_holes()  # 尝试修复非封闭的 mesh
+        print("Attempted to repair mesh.")
+    return mesh
+
+
+def normalize_head(mesh: trimesh.Trimesh, max_size: float = MAX_SIZE) -> None:
+    '''居中并把最大范围缩放到 max_size，原地修改'''
+    # 步骤 1: 居中化
+    # 计算 mesh 的几何中心（质心）
+    centroid = mesh.centroid
+
+    # 将 mesh 移动到原点
+    mesh.apply_translation(-centroid)
+    # 步骤 2: 归一化到单位立方体
+    # 计算 mesh 的边界框范围
+    extent = mesh.extents  # [x_range, y_range, z_range]
+    # 找到最大范围
+    max_extent = np.max(extent)
+    scale_factor = max_size / max_extent
+    # 应用缩放
+    mesh.apply_scale(scale_factor)
+
+
+def export_head(mesh: trimesh.Trimesh, output_path: str) -> None:
+    mesh.visual.material = trimesh.visual.material.SimpleMaterial(
+        diffuse=[255, 255, 255, 255]  # 白色材质
+    )
+    mesh.export(output_path)
+
+
+def process_face(input_path: str, output_path: str, max_size: float = MAX_SIZE, lod_ratios=LOD_RATIOS, timer=None):
+    '''
+    完整流程：加载、居中缩放、导出、生成LOD，返回导出的文件路径
+    timer(name) 返回计时上下文，批处理用它统计每一步的耗时
+    '''
+    if timer is None:
+        timer = lambda name: nullcontext()
+    with timer('load'):
+        mesh = load_head(input_path)
+    with timer('normalize'):
+        normalize_head(mesh, max_size)
+    with timer('export'):
+        export_head(mesh, output_path)
+    with timer('lod'):
+        sidecar = generate_lods(output_path, lod_ratios)
+    return [output_path, sidecar]
+
+
+if __name__ == '__main__':
+    process_face('../../software/Head.obj', '../data/mesh/head_mesh.obj')
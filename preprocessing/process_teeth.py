@@ -1,186 +1,248 @@
 # 归一化牙齿
 import trimesh
-from mesh_to_sdf import mesh_to_voxels
-import skimage
-import imageio
+from sdf_tools import voxelize, smooth_sdf, extract_levels, resample_sdf, DEFAULT_CACHE_DIR  # 缓存并行的 SDF、分片平滑和等值面提取（内部导入 mesh_to_sdf，须在 pyrender 之前）
 import numpy as np
-import pyrender
 import os
-from scipy.ndimage import gaussian_filter  # 用于 Voxel 平滑
+from contextlib import nullcontext
 import trimesh.smoothing                  # 用于 Mesh 平滑
-
-# 加载牙齿的 OBJ 文件
-gen_again = False
-mesh = trimesh.load('../data/mesh/teeth_down.stl')
-# 检查 mesh 是否有效
-print(f"Is the mesh watertight? {mesh.is_watertight}")
-print(f"Number of vertices: {len(mesh.vertices)}")
-print(f"Number of faces: {len(mesh.faces)}")
-# 可选：修复 mesh（如果需要）
-if not mesh.is_watertight:
-    print("Attempted to repair mesh.")
-    # # 将原始 mesh 拆分为独立的连通分量（每颗牙齿一个）
-    # teeth_list = mesh.split(only_watertight=False)
-    # print(f"Found {len(teeth_list)} individual teeth.")
-
-    # processed_teeth = []
-    # for i, tooth in enumerate(teeth_list):
-    #     # 过滤掉极其微小的杂质碎块
-    #     if tooth.area < 1e-5: # 根据你的缩放比例调整
-    #         continue
-
-    #     # 强力修复每一颗牙齿
-    #     tooth.remove_infinite_values()
-    #     tooth.fill_holes()  # 封死底部开口
-    #     tooth.fix_normals()
-    #     processed_teeth.append(tooth)
-
-    # # 重新组合
-    # mesh = trimesh.util.concatenate(processed_teeth)
-    mesh.fill_holes()
+from lod import generate_lods, LOD_RATIOS
 
 # 缩放
-max_scale = 0.05 #成年人牙齿约间隔0.05m
-# 定义腐蚀量
-erosion_amount = 0.5  # 调整腐蚀程度，单位与SDF值一致
-
-if gen_again or not os.path.exists("../temp/voxels.npy"):
+MAX_SCALE = 0.05 #成年人牙齿约间隔0.05m
+# 定义腐蚀量，可以一次生成多级腐蚀，单位与SDF值一致
+# 第一级导出为 teeth_double_layer_eroded.obj（运行时使用），其余在文件名后加上腐蚀量
+EROSION_AMOUNTS = [0.5]
+# 垂直位移量：决定上下牙齿之间的间隙大小
+# 因为当前模型总高度约 0.1，向上下各移动 0.06 大约能留出一点空隙
+SHIFT_DISTANCE = 0.007
+
+
+def load_teeth(path: str) -> trimesh.Trimesh:
+    '''加载牙弓扫描并尝试修复'''
+    mesh = trimesh.load(path)
+    # 检查 mesh 是否有效
+    print(f"Is the mesh watertight? {mesh.is_watertight}")
+    print(f"Number of vertices: {len(mesh.vertices)}")
+    print(f"Number of faces: {len(mesh.faces)}")
+    # 可选：修复 mesh（如果需要）
+    if not mesh.is_watertight:
+        print("Attempted to repair mesh.")
+        # # 将原始 mesh 拆分为独立的连通分量（每颗牙齿一个）
+        # teeth_list = mesh.split(only_watertight=False)
+        # print(f"Found {len(teeth_list)} individual teeth.")
+
+        # processed_teeth = []
+        # for i, tooth in enumerate(teeth_list):
+        #     # 过滤掉极其微小的杂质碎块
+        #     if tooth.area < 1e-5: # 根据你的缩放比例调整
+        #         continue
+
+        #     # 强力修复每一颗牙齿
+        #     tooth.remove_infinite_values()
+        #     tooth.fill_holes()  # 封死底部开口
+        #     tooth.fix_normals()
+        #     processed_teeth.append(tooth)
+
+        # # 重新组合
+        # mesh = trimesh.util.concatenate(processed_teeth)
+        mesh.fill_holes()
+    return mesh
+
+
+def compute_sdf(mesh: trimesh.Trimesh, voxel_resolution: int = 256, workers: int = None,
+                cache_dir: str = DEFAULT_CACHE_DIR) -> np.ndarray:
     # 1. 提高分辨率：64 对整排牙齿来说太低了，牙缝会粘连。建议 128 或更高。
     # 2. 更改判定方法：sign_method='depth' 对非闭合或多物体模型更鲁棒。
     # 3. surface_point_method='sample' 在处理独立个体时有时比 scan 更稳。
-
-    voxels = mesh_to_voxels(mesh, 
-                            voxel_resolution=256, 
-                            pad=True, 
-                            sign_method='depth', 
-                            surface_point_method='scan')
-    np.save("../temp/voxels.npy",voxels)
-voxels = np.load("../temp/voxels.npy")
-
-# --- 2. Voxel 级别平滑 (关键：消除方块感的源头) ---
-# sigma 决定平滑程度。0.5~1.0 之间效果最好。
-# 它会让 SDF 的数值过渡更连续，从而让 Marching Cubes 产生更平滑的斜面。
-print("Applying Gaussian filter to voxels...")
-voxels_smoothed = gaussian_filter(voxels, sigma=0.8)
-voxels_modified_smoothed = gaussian_filter(voxels + erosion_amount*max_scale, sigma=0.8)
-
-
-
-
-vertices, faces, normals, _ = skimage.measure.marching_cubes(voxels_modified_smoothed, level=0)
-eroded_mesh = trimesh.Trimesh(vertices=vertices, faces=faces, vertex_normals=normals)
-vertices, faces, normals, _ = skimage.measure.marching_cubes(voxels_smoothed, level=0)
-mesh = trimesh.Trimesh(vertices=vertices, faces=faces, vertex_normals=normals)
-
-
-
-
-
-# 步骤 1: 居中化
-# 计算 mesh 的几何中心（质心）
-centroid = mesh.centroid
-
-# 将 mesh 移动到原点
-mesh.apply_translation(-centroid)
-eroded_mesh.apply_translation(-centroid)
-# 步骤 2: 归一化到0.1单位立方体
-# 计算 mesh 的边界框范围
-bounds = mesh.bounds  # [[min_x, min_y, min_z], [max_x, max_y, max_z]]
-extent = mesh.extents  # [x_range, y_range, z_range]
-# 找到最大范围
-max_extent = np.max(extent)
-# 缩放因子：将最大范围缩放到 0.01
-scale_factor = max_scale / max_extent
-
-
-# 应用缩放
-mesh.apply_scale(scale_factor)
-eroded_mesh.apply_scale(scale_factor)
-
-# ==========================================
-# 新增部分：创建双层牙齿 (Double Layer)
-# ==========================================
-
-print("Creating upper teeth layer...")
-
-# 1. 定义参数
-# 垂直位移量：决定上下牙齿之间的间隙大小
-# 因为当前模型总高度约 0.1，向上下各移动 0.06 大约能留出一点空隙
-shift_distance = 0.007
-
-# 2. 准备下排牙齿（原始）
-# 复制一份作为最终的下排
-lower_mesh_final = mesh.copy()
-lower_eroded_final = eroded_mesh.copy()
-
-# 向下移动 (-Z 方向)
-translation_down = trimesh.transformations.translation_matrix([0, 0, -shift_distance])
-lower_mesh_final.apply_transform(translation_down)
-lower_eroded_final.apply_transform(translation_down)
-
-# 3. 创建上排牙齿（通过镜像和移动）
-upper_mesh_final = mesh.copy()
-upper_eroded_final = eroded_mesh.copy()
-
-# --- 3a. 镜像反射 (Reflection) ---
-# 创建一个沿 Z 轴反射的矩阵 (Z 坐标变为负数)
-reflection_matrix = np.eye(4)
-reflection_matrix[2, 2] = -1
-# 应用反射
-upper_mesh_final.apply_transform(reflection_matrix)
-upper_eroded_final.apply_transform(reflection_matrix)
-
-# [重要] 修复法线：反射变换会导致法线指向内部，必须修复
-upper_mesh_final.fix_normals()
-upper_eroded_final.fix_normals()
-
-# --- 3b. 向上移动 (+Z 方向) ---
-translation_up = trimesh.transformations.translation_matrix([0, 0, shift_distance])
-upper_mesh_final.apply_transform(translation_up)
-upper_eroded_final.apply_transform(translation_up)
-
-# 4. 合并上下排
-print("Combining upper and lower layers...")
-combined_mesh = trimesh.util.concatenate([lower_mesh_final, upper_mesh_final])
-combined_eroded_mesh = trimesh.util.concatenate([lower_eroded_final, upper_eroded_final])
-
-
-# ==========================================
-# 新增：绕 +X 轴顺时针旋转 90 度
-# ==========================================
-# 顺时针 90 度即 -pi/2 弧度
-rotation_matrix = trimesh.transformations.rotation_matrix(
-    angle=np.pi/2, 
-    direction=[1, 0, 0], 
-    point=[0, 0, 0]
-)
-combined_mesh.apply_transform(rotation_matrix)
-combined_eroded_mesh.apply_transform(rotation_matrix)
-# ==========================================
-
-
-# 5. 设置材质（可选，为了 MeshLab 查看方便）
-combined_mesh.visual.material = trimesh.visual.material.SimpleMaterial(
-    diffuse=[200, 200, 200, 255]
-)
-combined_eroded_mesh.visual.material = trimesh.visual.material.SimpleMaterial(
-    diffuse=[255, 100, 100, 255] # 腐蚀版用红色区分
-)
-
-# 6. 导出最终结果
-output_dir = "../data/mesh/"
-os.makedirs(output_dir, exist_ok=True) # 确保目录存在
-
-combined_mesh_path = os.path.join(output_dir, "teeth_double_layer.obj")
-combined_eroded_path = os.path.join(output_dir, "teeth_double_layer_eroded.obj")
-
-print(f"Exporting combined mesh to {combined_mesh_path}...")
-combined_mesh.export(combined_mesh_path)
-
-print(f"Exporting combined eroded mesh to {combined_eroded_path}...")
-combined_eroded_mesh.export(combined_eroded_path)
-
-print("Done!")
-# 打印一下最终信息看看
-print(f"Final combined mesh vertices: {len(combined_mesh.vertices)}")
-print(f"Final combined bounds Z-range: {combined_mesh.bounds[:, 2]}")
\ No newline at end of file
+    # 结果缓存在 cache_dir，键为网格内容和以上全部参数，换模型或改参数会自动重新计算
+    return voxelize(mesh,
+                    voxel_resolution=voxel_resolution,
+                    pad=True,
+                    sign_method='depth',
+                    surface_point_method='scan',
+                    cache_dir=cache_dir,
+                    workers=workers)
+
+
+def smooth_voxels(voxels: np.ndarray, sigma: float = 0.8) -> np.ndarray:
+    # --- 2. Voxel 级别平滑 (关键：消除方块感的源头) ---
+    # sigma 决定平滑程度。0.5~1.0 之间效果最好。
+    # 它会让 SDF 的数值过渡更连续，从而让 Marching Cubes 产生更平滑的斜面。
+    # 分片计算并写入内存映射文件（缓存在体素文件旁边），512^3 也不需要把整个网格放进内存
+    print("Applying Gaussian filter to voxels...")
+    return smooth_sdf(voxels, sigma=sigma)
+
+
+def extract_teeth(voxels_smoothed: np.ndarray, erosion_amounts=EROSION_AMOUNTS, max_scale: float = MAX_SCALE):
+    '''返回 (原始牙齿, [各级腐蚀牙齿])，体素坐标'''
+    # 腐蚀只是等值面平移：平滑(SDF + 腐蚀量) 的 0 等值面 = 平滑(SDF) 的 -腐蚀量 等值面
+    # 一次遍历平滑后的 SDF 得到原始牙齿和所有腐蚀级别
+    levels = [0] + [-amount*max_scale for amount in erosion_amounts]
+    mesh, *eroded_meshes = extract_levels(voxels_smoothed, levels)
+    return mesh, eroded_meshes
+
+
+def normalize_teeth(mesh: trimesh.Trimesh, eroded_meshes, max_scale: float = MAX_SCALE):
+    '''以原始牙齿为准居中、缩放，腐蚀版本使用相同的变换，原地修改，返回 (质心, 缩放因子)'''
+    # 步骤 1: 居中化
+    # 计算 mesh 的几何中心（质心）
+    centroid = mesh.centroid
+
+    # 将 mesh 移动到原点
+    mesh.apply_translation(-centroid)
+    for eroded_mesh in eroded_meshes:
+        eroded_mesh.apply_translation(-centroid)
+    # 步骤 2: 归一化到0.1单位立方体
+    # 计算 mesh 的边界框范围
+    extent = mesh.extents  # [x_range, y_range, z_range]
+    # 找到最大范围
+    max_extent = np.max(extent)
+    # 缩放因子：将最大范围缩放到 0.01
+    scale_factor = max_scale / max_extent
+
+    # 应用缩放
+    mesh.apply_scale(scale_factor)
+    for eroded_mesh in eroded_meshes:
+        eroded_mesh.apply_scale(scale_factor)
+    return centroid, scale_factor
+
+
+def layer_matrices(shift_distance: float = SHIFT_DISTANCE):
+    '''
+    双层牙齿 (Double Layer) 中下排和上排各自的变换（归一化后的牙齿 -> 运行时模型坐标系）：
+    原始牙齿下移作为下排，沿 Z 镜像后上移作为上排，合并后绕 +X 轴旋转 90 度
+    '''
+    # 向下移动 (-Z 方向)
+    translation_down = trimesh.transformations.translation_matrix([0, 0, -shift_distance])
+
+    # --- 镜像反射 (Reflection) ---
+    # 创建一个沿 Z 轴反射的矩阵 (Z 坐标变为负数)
+    reflection_matrix = np.eye(4)
+    reflection_matrix[2, 2] = -1
+    # --- 向上移动 (+Z 方向) ---
+    translation_up = trimesh.transformations.translation_matrix([0, 0, shift_distance])
+
+    # ==========================================
+    # 新增：绕 +X 轴顺时针旋转 90 度
+    # ==========================================
+    # 顺时针 90 度即 -pi/2 弧度
+    rotation_matrix = trimesh.transformations.rotation_matrix(
+        angle=np.pi/2,
+        direction=[1, 0, 0],
+        point=[0, 0, 0]
+    )
+    return rotation_matrix @ translation_down, rotation_matrix @ translation_up @ reflection_matrix
+
+
+def make_double_layer(mesh: trimesh.Trimesh, shift_distance: float = SHIFT_DISTANCE) -> trimesh.Trimesh:
+    '''创建双层牙齿 (Double Layer)，变换见 layer_matrices'''
+    lower, upper = layer_matrices(shift_distance)
+    # 准备下排牙齿（原始）
+    lower_mesh_final = mesh.copy()
+    lower_mesh_final.apply_transform(lower)
+
+    # 创建上排牙齿（通过镜像和移动）
+    upper_mesh_final = mesh.copy()
+    upper_mesh_final.apply_transform(upper)
+    # [重要] 修复法线：反射变换会导致法线指向内部，必须修复
+    upper_mesh_final.fix_normals()
+
+    # 合并上下排
+    return trimesh.util.concatenate([lower_mesh_final, upper_mesh_final])
+
+
+def sdf_output_path(output_dir: str) -> str:
+    return os.path.join(output_dir, "teeth_double_layer.sdf.npy")
+
+
+def export_sdf(voxels_smoothed: np.ndarray, centroid: np.ndarray, scale_factor: float, voxel_resolution: int,
+               output_dir: str, shift_distance: float = SHIFT_DISTANCE) -> str:
+    '''
+    把平滑后的 SDF 变换到与 teeth_double_layer.obj 相同的坐标系（居中、缩放、上下两排、旋转）并导出，
+    运行时用于距离查询和射线检测 (src/sdf_field.py)。返回 .npy 路径，同名 .json 记录原点和间距
+    '''
+    # marching cubes 的顶点是体素索引坐标，先居中、缩放，再做双层变换
+    normalize = np.diag([scale_factor, scale_factor, scale_factor, 1.0]) @ trimesh.transformations.translation_matrix(-centroid)
+    transforms = [layer @ normalize for layer in layer_matrices(shift_distance)]
+    # SDF 的值以 mesh_to_sdf 的单位立方体为单位：边长 2 对应 voxel_resolution-1 个体素
+    distance_scale = (voxel_resolution - 1) / 2 * scale_factor
+    path = sdf_output_path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Exporting runtime SDF to {path}...")
+    info = resample_sdf(voxels_smoothed, transforms, distance_scale, path)
+    print(f"  grid {info['shape']}, spacing {info['spacing']:.3g}")
+    return path
+
+
+def teeth_output_paths(output_dir: str, erosion_amounts=EROSION_AMOUNTS):
+    '''导出文件路径：双层牙齿，随后是各级腐蚀版本'''
+    paths = [os.path.join(output_dir, "teeth_double_layer.obj")]
+    for i, amount in enumerate(erosion_amounts):
+        suffix = "" if i == 0 else f"_{amount:g}"
+        paths.append(os.path.join(output_dir, f"teeth_double_layer_eroded{suffix}.obj"))
+    return paths
+
+
+def export_teeth(combined_mesh: trimesh.Trimesh, combined_eroded_meshes, output_dir: str,
+                 erosion_amounts=EROSION_AMOUNTS):
+    '''导出双层牙齿和各级腐蚀版本，返回导出的文件路径'''
+    # 5. 设置材质（可选，为了 MeshLab 查看方便）
+    combined_mesh.visual.material = trimesh.visual.material.SimpleMaterial(
+        diffuse=[200, 200, 200, 255]
+    )
+    for combined_eroded_mesh in combined_eroded_meshes:
+        combined_eroded_mesh.visual.material = trimesh.visual.material.SimpleMaterial(
+            diffuse=[255, 100, 100, 255] # 腐蚀版用红色区分
+        )
+
+    # 6. 导出最终结果
+    os.makedirs(output_dir, exist_ok=True) # 确保目录存在
+    paths = teeth_output_paths(output_dir, erosion_amounts)
+
+    print(f"Exporting combined mesh to {paths[0]}...")
+    combined_mesh.export(paths[0])
+
+    for path, combined_eroded_mesh in zip(paths[1:], combined_eroded_meshes):
+        print(f"Exporting combined eroded mesh to {path}...")
+        combined_eroded_mesh.export(path)
+    return paths
+
+
+def process_teeth(input_path: str, output_dir: str, erosion_amounts=EROSION_AMOUNTS,
+                  voxel_resolution: int = 256, sigma: float = 0.8, max_scale: float = MAX_SCALE,
+                  shift_distance: float = SHIFT_DISTANCE, sdf_workers: int = None,
+                  cache_dir: str = DEFAULT_CACHE_DIR, lod_ratios=LOD_RATIOS, timer=None):
+    '''
+    完整流程：加载、体素化、平滑、多级腐蚀、归一化、双层组合、导出网格和运行时 SDF、生成LOD，返回导出的文件路径
+    timer(name) 返回计时上下文，批处理用它统计每一步的耗时
+    '''
+    if timer is None:
+        timer = lambda name: nullcontext()
+    with timer('load'):
+        mesh = load_teeth(input_path)
+    with timer('voxelize'):
+        voxels = compute_sdf(mesh, voxel_resolution, sdf_workers, cache_dir)
+    with timer('smooth'):
+        voxels_smoothed = smooth_voxels(voxels, sigma)
+    with timer('erode'):
+        mesh, eroded_meshes = extract_teeth(voxels_smoothed, erosion_amounts, max_scale)
+    with timer('double_layer'):
+        centroid, scale_factor = normalize_teeth(mesh, eroded_meshes, max_scale)
+        print("Creating upper teeth layer...")
+        combined_mesh = make_double_layer(mesh, shift_distance)
+        combined_eroded_meshes = [make_double_layer(eroded_mesh, shift_distance) for eroded_mesh in eroded_meshes]
+    with timer('export'):
+        paths = export_teeth(combined_mesh, combined_eroded_meshes, output_dir, erosion_amounts)
+    with timer('sdf_export'):
+        paths.append(export_sdf(voxels_smoothed, centroid, scale_factor, voxel_resolution, output_dir, shift_distance))
+    with timer('lod'):
+        paths += [generate_lods(path, lod_ratios) for path in list(paths) if path.endswith('.obj')]
+    # 打印一下最终信息看看
+    print(f"Final combined mesh vertices: {len(combined_mesh.vertices)}")
+    print(f"Final combined bounds Z-range: {combined_mesh.bounds[:, 2]}")
+    return paths
+
+
+if __name__ == '__main__':
+    process_teeth('../data/mesh/teeth_down.stl', "../data/mesh/")
+    print("Done!")
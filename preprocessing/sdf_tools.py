@@ -0,0 +1,293 @@
+# SDF 体素化：按网格内容和参数缓存，分块在进程池中并行计算
+# 与 mesh_to_sdf.mesh_to_voxels 结果一致（同样先缩放到单位立方体、同样的采样网格和 pad）
+# 注意 mesh_to_sdf 要求在 pyrender 之前导入，使用本模块的脚本应把它放在 pyrender 之前导入
+import hashlib
+import json
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version, PackageNotFoundError
+
+import numpy as np
+import trimesh
+from mesh_to_sdf import get_surface_point_cloud
+from mesh_to_sdf.utils import scale_to_unit_cube
+
+# 缓存格式或计算方式改变时加一，旧缓存自然失效
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = "../temp/sdf_cache"
+
+try:
+    _MESH_TO_SDF_VERSION = version("mesh-to-sdf")
+except PackageNotFoundError:
+    _MESH_TO_SDF_VERSION = "unknown"
+
+
+def mesh_hash(mesh: trimesh.Trimesh) -> str:
+    '''网格内容的哈希：顶点和面片，与文件名、加载方式无关'''
+    h = hashlib.sha256()
+    vertices = np.ascontiguousarray(mesh.vertices, dtype=np.float64)
+    faces = np.ascontiguousarray(mesh.faces, dtype=np.int64)
+    h.update(str(vertices.shape).encode())
+    h.update(vertices.tobytes())
+    h.update(str(faces.shape).encode())
+    h.update(faces.tobytes())
+    return h.hexdigest()
+
+
+def sdf_cache_key(mesh: trimesh.Trimesh, **params) -> str:
+    '''缓存键：网格内容哈希 + 全部 SDF 参数 + 缓存/库版本'''
+    h = hashlib.sha256()
+    h.update(mesh_hash(mesh).encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    h.update(f"{CACHE_VERSION}/{_MESH_TO_SDF_VERSION}".encode())
+    return h.hexdigest()[:32]
+
+
+def _brick_slices(resolution: int, brick_size: int):
+    '''把 resolution^3 的网格切成边长不超过 brick_size 的小块'''
+    starts = range(0, resolution, brick_size)
+    for a in starts:
+        for b in starts:
+            for c in starts:
+                yield (slice(a, min(a + brick_size, resolution)),
+                       slice(b, min(b + brick_size, resolution)),
+                       slice(c, min(c + brick_size, resolution)))
+
+
+def _brick_points(resolution: int, brick) -> np.ndarray:
+    '''小块内的采样点，顺序与 mesh_to_sdf.utils.get_raster_points 相同: voxels[a,b,c] 对应 (lin[a], lin[b], lin[c])'''
+    lin = np.linspace(-1, 1, resolution)
+    xs, ys, zs = np.meshgrid(lin[brick[0]], lin[brick[1]], lin[brick[2]], indexing='ij')
+    return np.stack([xs, ys, zs], axis=-1).reshape(-1, 3).astype(np.float32)
+
+
+# 工作进程中的表面点云，由初始化函数设置（fork 时直接继承，不需要序列化）
+_worker_cloud = None
+_worker_args = None
+
+
+def _init_worker(cloud, args) -> None:
+    global _worker_cloud, _worker_args
+    _worker_cloud = cloud
+    _worker_args = args
+
+
+def _compute_brick(brick) -> int:
+    '''计算一个小块并直接写入共享的 .npy 文件，返回计算的点数'''
+    path, resolution, offset, use_depth_buffer, sample_count = _worker_args
+    points = _brick_points(resolution, brick)
+    sdf = _worker_cloud.get_sdf(points, use_depth_buffer=use_depth_buffer, sample_count=sample_count)
+    out = np.load(path, mmap_mode='r+')
+    out[tuple(slice(s.start + offset, s.stop + offset) for s in brick)] = sdf.reshape(
+        [s.stop - s.start for s in brick])
+    out.flush()
+    del out
+    return len(points)
+
+
+def voxelize(mesh: trimesh.Trimesh,
+             voxel_resolution: int = 64,
+             pad: bool = False,
+             sign_method: str = 'normal',
+             surface_point_method: str = 'scan',
+             scan_count: int = 100,
+             scan_resolution: int = 400,
+             sample_point_count: int = 10000000,
+             normal_sample_count: int = 11,
+             cache_dir: str = DEFAULT_CACHE_DIR,
+             workers: int = None,
+             brick_size: int = 64,
+             mmap: bool = True) -> np.ndarray:
+    '''
+    计算网格的 SDF 体素（参数含义同 mesh_to_voxels），结果缓存在 cache_dir/<key>.npy
+    同一网格同样参数再次调用直接读取缓存；不同网格或参数的键不同，不会误用
+    workers 为进程数，默认 CPU 核数，1 表示在本进程内计算
+    mmap=True 时返回只读的内存映射数组
+    '''
+    params = dict(voxel_resolution=voxel_resolution, pad=pad, sign_method=sign_method,
+                  surface_point_method=surface_point_method, scan_count=scan_count,
+                  scan_resolution=scan_resolution, sample_point_count=sample_point_count,
+                  normal_sample_count=normal_sample_count)
+    key = sdf_cache_key(mesh, **params)
+    path = os.path.join(cache_dir, f"{key}.npy")
+    if os.path.exists(path):
+        print(f"Using cached SDF {path}")
+        return np.load(path, mmap_mode='r' if mmap else None)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    print(f"Computing SDF ({voxel_resolution}^3) -> {path}")
+    unit_mesh = scale_to_unit_cube(mesh)
+    cloud = get_surface_point_cloud(unit_mesh, surface_point_method, 3**0.5, scan_count, scan_resolution,
+                                    sample_point_count, calculate_normals=sign_method == 'normal')
+    use_depth_buffer = sign_method == 'depth'
+    sample_count = normal_sample_count
+
+    # 先写到临时文件，全部完成后再改名，中断的计算不会留下看似有效的缓存
+    partial = os.path.join(cache_dir, f"{key}.partial.{os.getpid()}.npy")
+    offset = 1 if pad else 0
+    size = voxel_resolution + 2 * offset
+    out = np.lib.format.open_memmap(partial, mode='w+', dtype=np.float32, shape=(size,) * 3)
+    if pad:
+        out[...] = 1    # 与 np.pad(..., constant_values=1) 相同，内部随后被覆盖
+    out.flush()
+    del out
+
+    bricks = list(_brick_slices(voxel_resolution, brick_size))
+    args = (partial, voxel_resolution, offset, use_depth_buffer, sample_count)
+    workers = workers or os.cpu_count() or 1
+    try:
+        if workers == 1:
+            _init_worker(cloud, args)
+            for i, brick in enumerate(bricks):
+                _compute_brick(brick)
+                print(f"\r  bricks {i + 1}/{len(bricks)}", end='', flush=True)
+        else:
+            # fork 时子进程直接继承点云和 KD 树；不支持 fork 的平台上会序列化后传给每个进程
+            method = 'fork' if 'fork' in mp.get_all_start_methods() else None
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context(method),
+                                     initializer=_init_worker, initargs=(cloud, args)) as pool:
+                for i, _ in enumerate(pool.map(_compute_brick, bricks)):
+                    print(f"\r  bricks {i + 1}/{len(bricks)}", end='', flush=True)
+        print()
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return np.load(path, mmap_mode='r' if mmap else None)
+
+
+def smooth_sdf(voxels: np.ndarray, sigma: float, out_path: str = None, slab: int = 32) -> np.ndarray:
+    '''
+    对 SDF 做高斯平滑，结果与 scipy.ndimage.gaussian_filter(voxels, sigma) 相同
+    沿第 0 轴分成带重叠(高斯核半径)的薄片逐片计算，内存中同时只有一片；结果写入 float32 的 .npy 内存映射
+    out_path 为空且 voxels 来自 voxelize 的缓存时，结果放在缓存文件旁边，同样参数再次调用直接读取
+    '''
+    from scipy.ndimage import gaussian_filter
+    if out_path is None and isinstance(voxels, np.memmap):
+        out_path = f"{os.path.splitext(voxels.filename)[0]}.s{sigma:g}.npy"
+    if out_path is not None and os.path.exists(out_path):
+        return np.load(out_path, mmap_mode='r')
+    halo = int(4.0 * sigma + 0.5)   # gaussian_filter 默认 truncate=4.0 时的核半径
+    n = voxels.shape[0]
+    if out_path is None:
+        out = np.empty(voxels.shape, dtype=np.float32)
+    else:
+        partial = f"{out_path}.partial.{os.getpid()}.npy"
+        out = np.lib.format.open_memmap(partial, mode='w+', dtype=np.float32, shape=voxels.shape)
+    for start in range(0, n, slab):
+        stop = min(start + slab, n)
+        lo, hi = max(start - halo, 0), min(stop + halo, n)
+        block = gaussian_filter(np.asarray(voxels[lo:hi], dtype=np.float32), sigma)
+        out[start:stop] = block[start - lo:stop - lo]
+    if out_path is None:
+        return out
+    out.flush()
+    del out
+    os.replace(partial, out_path)
+    return np.load(out_path, mmap_mode='r')
+
+
+def extract_levels(voxels: np.ndarray, levels, slab: int = 64):
+    '''
+    一次遍历 SDF，对每个等值面值做 marching cubes，返回与 levels 对应的 trimesh 列表
+    腐蚀/膨胀只是等值面平移：SDF 整体加上 c 后取 0 等值面，等价于原 SDF 取 -c 等值面
+    沿第 0 轴分片，每片前后多带一层用于法线的中心差分，只保留本片内的面片，最后合并片间重复的顶点
+    '''
+    import skimage.measure
+    n = voxels.shape[0]
+    parts = [[] for _ in levels]
+    for start in range(0, n - 1, slab):
+        stop = min(start + slab, n - 1)     # 本片负责第 start..stop-1 层立方体
+        lo, hi = max(start - 1, 0), min(stop + 2, n)
+        block = np.array(voxels[lo:hi], dtype=np.float32)   # 复制到内存，内存映射的只读切片不能直接传入
+        for i, level in enumerate(levels):
+            if not block.min() <= level <= block.max():
+                continue
+            vertices, faces, normals, _ = skimage.measure.marching_cubes(block, level=level)
+            vertices[:, 0] += lo
+            centers = vertices[faces, 0].mean(axis=1)
+            faces = faces[(centers >= start) & (centers < stop)]
+            if len(faces):
+                parts[i].append((vertices, faces, normals))
+    meshes = []
+    for level_parts in parts:
+        if not level_parts:
+            meshes.append(trimesh.Trimesh())
+            continue
+        offsets = np.cumsum([0] + [len(v) for v, _, _ in level_parts])
+        vertices = np.concatenate([v for v, _, _ in level_parts])
+        faces = np.concatenate([f + o for (_, f, _), o in zip(level_parts, offsets[:-1])])
+        normals = np.concatenate([nm for _, _, nm in level_parts])
+        # 去掉光环层中未被引用的顶点；片间共享平面上的顶点在相邻两片中各算了一次，坐标只差浮点舍入，
+        # 按体素坐标量化后合并。不用 trimesh 的 merge/remove_unreferenced，它们会丢掉 marching cubes 的梯度法线
+        used = np.unique(faces)
+        _, index, inverse = np.unique(np.round(vertices[used] * 1e4).astype(np.int64), axis=0,
+                                      return_index=True, return_inverse=True)
+        remap = np.empty(len(vertices), dtype=np.int64)
+        remap[used] = inverse.reshape(-1)
+        mesh = trimesh.Trimesh(vertices=vertices[used][index], faces=remap[faces],
+                               vertex_normals=normals[used][index], process=False)
+        meshes.append(mesh)
+    return meshes
+
+
+def _sdf_lower_bound(source: np.ndarray, q: np.ndarray, lo: np.ndarray, hi: np.ndarray, value_scale: float) -> np.ndarray:
+    '''
+    在索引坐标 q (3, M) 处三线性插值 source 并乘 value_scale 换算为索引单位；盒子 [lo, hi] 之外取距离下界
+    max(到盒子的距离, 盒内最近点的值 - 到盒子的距离)，假定表面都在盒子内，球追踪用时不会越过表面
+    '''
+    from scipy.ndimage import map_coordinates
+    clamped = np.clip(q, lo[:, None], hi[:, None])
+    values = map_coordinates(source, clamped, order=1, mode='nearest') * value_scale
+    outside = np.linalg.norm(q - clamped, axis=0)
+    return np.where(outside > 0, np.maximum(outside, values - outside), values)
+
+
+def resample_sdf(source: np.ndarray, transforms, distance_scale: float, out_path: str,
+                 margin: int = 4, slab: int = 16) -> dict:
+    '''
+    把 voxelize/smooth_sdf 得到的 SDF 变换到另一个坐标系（如运行时模型坐标系）并重新采样到规则网格
+    transforms 为若干 4x4 矩阵，把源体素索引坐标映射到目标坐标系，每个矩阵是一个实例（如上下两排牙齿），
+    结果为各实例的并集(最小值)；distance_scale 把源 SDF 的值换算为目标坐标系的长度
+    目标网格间距与源体素在目标坐标系中的尺寸相同，范围为各实例的包围盒外扩 margin 个体素
+    结果写入 out_path (.npy, float32)，同名 .json 记录原点、间距和形状，返回该记录
+    '''
+    n = np.array(source.shape, dtype=np.float64)
+    # pad 的外圈是常数，不是距离，不参与插值
+    lo, hi = np.ones(3), n - 2
+    inverses, scales = [], []
+    corners = np.array(np.meshgrid(*zip(lo, hi), indexing='ij')).reshape(3, -1)
+    box_min, box_max = np.full(3, np.inf), np.full(3, -np.inf)
+    for T in transforms:
+        T = np.asarray(T, dtype=np.float64)
+        inverses.append(np.linalg.inv(T))
+        scales.append(np.cbrt(abs(np.linalg.det(T[:3, :3]))))
+        mapped = T[:3, :3] @ corners + T[:3, 3:4]
+        box_min = np.minimum(box_min, mapped.min(axis=1))
+        box_max = np.maximum(box_max, mapped.max(axis=1))
+    spacing = float(min(scales))
+    origin = box_min - margin * spacing
+    shape = tuple(int(v) for v in np.ceil((box_max - box_min) / spacing) + 1 + 2 * margin)
+
+    partial = f"{out_path}.partial.{os.getpid()}.npy"
+    out = np.lib.format.open_memmap(partial, mode='w+', dtype=np.float32, shape=shape)
+    ys = origin[1] + spacing * np.arange(shape[1])
+    zs = origin[2] + spacing * np.arange(shape[2])
+    for start in range(0, shape[0], slab):
+        stop = min(start + slab, shape[0])
+        xs = origin[0] + spacing * np.arange(start, stop)
+        points = np.array(np.meshgrid(xs, ys, zs, indexing='ij')).reshape(3, -1)
+        result = np.full(points.shape[1], np.inf)
+        for inverse, scale in zip(inverses, scales):
+            q = inverse[:3, :3] @ points + inverse[:3, 3:4]
+            # 先统一为源体素索引单位，再乘实例的缩放得到目标坐标系的长度
+            result = np.minimum(result, _sdf_lower_bound(source, q, lo, hi, distance_scale / scale) * scale)
+        out[start:stop] = result.reshape(stop - start, shape[1], shape[2])
+    out.flush()
+    del out
+    os.replace(partial, out_path)
+    info = {'origin': origin.tolist(), 'spacing': spacing, 'shape': list(shape)}
+    with open(f"{os.path.splitext(out_path)[0]}.json", 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    return info
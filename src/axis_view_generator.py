@@ -1,8 +1,12 @@
 '''
 预初始化fig/ax、更新箭头、缓存图像。分离出plt_init、create_axis等
+直接使用Agg画布而不是pyplot，不依赖界面后端，可以在后台线程中创建和绘制
 '''
 
-import matplotlib.pyplot as plt
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np
 import hashlib
 from typing import Tuple
@@ -18,17 +22,19 @@ class AxisViewGenerator:
     def _plt_init(self) -> None:
         '''预初始化三个视图的fig/ax'''
         # 注意字体
-        plt.rcParams['font.family'] = 'AR PL UKai CN'
-        plt.rcParams['axes.unicode_minus'] = False
+        matplotlib.rcParams['font.family'] = 'AR PL UKai CN'
+        matplotlib.rcParams['axes.unicode_minus'] = False
         self.fig_front,self.ax_front = self._create_pre_fig_ax('X','Y','正视图(X-Y)')
         self.fig_top,self.ax_top = self._create_pre_fig_ax('X','Z','俯视图(X-Z)')
         self.fig_side,self.ax_side = self._create_pre_fig_ax('Z','Y','侧视图(Z-Y)')
         #  初始化三个箭头对象
         self.arrow_front=self.arrow_top=self.arrow_side=None
 
-    def _create_pre_fig_ax(self,xlabel:str,ylabel:str,title:str)-> Tuple[plt.figure,plt.Axes]:
+    def _create_pre_fig_ax(self,xlabel:str,ylabel:str,title:str)-> Tuple[Figure,Axes]:
         '''创建预绘制的fig/ax'''
-        fig,ax = plt.subplots(figsize=(3,2),dpi=100) # 这里假设了300*200
+        fig = Figure(figsize=(3,2),dpi=100) # 这里假设了300*200
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
         ax.set_facecolor = ('white')
         fig.patch.set_facecolor('white')
         ax.set_aspect('equal')
@@ -56,21 +62,31 @@ class AxisViewGenerator:
         # pose_hash = hashlib.md5(pose.tobytes()).hexdigest()
         # if pose_hash in self.axis_cache:
         #     return self.axis_cache[pose_hash]
-        # 计算投影、更新箭头、获取图像
-        arrow_pose = pose.copy()
-        z_axis = arrow_pose[:3, :3] @ np.array([0, 0, -1])  # 逆变换到世界系
-        projection_front = z_axis[:2]  # x,y
-        projection_top = np.array([z_axis[0], z_axis[2]])  # x,z
-        projection_side = z_axis[1:][::-1]  # y,z (反转匹配原代码)
-        # 获取更新图像
-        img_front, self.arrow_front = self._update_arrow_and_get_img(self.fig_front, self.ax_front, projection_front, self.arrow_front)
-        img_top, self.arrow_top = self._update_arrow_and_get_img(self.fig_top, self.ax_top, projection_top, self.arrow_top)
-        img_side, self.arrow_side = self._update_arrow_and_get_img(self.fig_side, self.ax_side, projection_side, self.arrow_side)
+        img_front = self.create_axis_view(pose,'front')
+        img_top = self.create_axis_view(pose,'top')
+        img_side = self.create_axis_view(pose,'side')
         # # 储存缓存
         # self.axis_cache[pose_hash] = (img_front, img_top, img_side)
         return img_front, img_top, img_side
+
+    def create_axis_view(self,pose:np.ndarray,view:str)->np.ndarray:
+        '''单独生成一个轴视图('front'/'top'/'side')，便于按视图分别调度'''
+        # 计算投影、更新箭头、获取图像
+        z_axis = pose[:3, :3] @ np.array([0, 0, -1])  # 逆变换到世界系
+        if view == 'front':
+            projection = z_axis[:2]  # x,y
+            img, self.arrow_front = self._update_arrow_and_get_img(self.fig_front, self.ax_front, projection, self.arrow_front)
+        elif view == 'top':
+            projection = np.array([z_axis[0], z_axis[2]])  # x,z
+            img, self.arrow_top = self._update_arrow_and_get_img(self.fig_top, self.ax_top, projection, self.arrow_top)
+        elif view == 'side':
+            projection = z_axis[1:][::-1]  # y,z (反转匹配原代码)
+            img, self.arrow_side = self._update_arrow_and_get_img(self.fig_side, self.ax_side, projection, self.arrow_side)
+        else:
+            raise ValueError(f'Unknown axis view: {view}')
+        return img
     
-    def _update_arrow_and_get_img(self, fig: plt.Figure, ax: plt.Axes, projection: np.ndarray, arrow_ref) -> Tuple[np.ndarray, object]:
+    def _update_arrow_and_get_img(self, fig: Figure, ax: Axes, projection: np.ndarray, arrow_ref) -> Tuple[np.ndarray, object]:
         '''更新箭头并从canvas获取图像'''
         # 移除旧箭头（如果存在）
         if arrow_ref is not None:
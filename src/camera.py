@@ -1,20 +1,175 @@
 '''
 主要职责为初始化相机、捕捉帧、检测棋盘格、求解位姿
+采集使用预分配的缓冲池，灰度图直接由解码后的BGR生成，RGB只在需要时才转换
 '''
 
 import cv2
 import numpy as np
-from typing import Tuple
+import time
+from typing import Dict, List, Optional, Set, Tuple
 from config import Config
+from metrics import FrameStamp, StageMetrics
+
+
+class FramePool:
+    '''
+    循环使用的帧缓冲池。每个槽位按名字保存若干缓冲区（bgr/gray/rgb），尺寸不变时反复复用；
+    alloc_count/alloc_bytes 记录实际发生的分配，稳定运行后每帧应为 0
+    '''
+    def __init__(self,size:int):
+        self._slots: List[Dict[str,np.ndarray]] = [{} for _ in range(size)]
+        self._next = 0
+        self.frames = 0
+        self.alloc_count = 0
+        self.alloc_bytes = 0
+        self._last_stats = (0, 0, 0)
+
+    def next_slot(self) -> int:
+        '''轮到下一个槽位，调用方保证池大小大于同时持有的帧数'''
+        slot = self._next
+        self._next = (self._next + 1) % len(self._slots)
+        self.frames += 1
+        return slot
+
+    def buffer(self,slot:int,name:str,shape:Tuple[int,...],dtype=np.uint8) -> np.ndarray:
+        '''取得槽位中的缓冲区，不存在或尺寸不符时才分配'''
+        buf = self._slots[slot].get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape,dtype)
+            self.adopt(slot,name,buf)
+        return buf
+
+    def peek(self,slot:int,name:str) -> Optional[np.ndarray]:
+        '''查看槽位中已有的缓冲区，不分配'''
+        return self._slots[slot].get(name)
+
+    def adopt(self,slot:int,name:str,buf:np.ndarray) -> None:
+        '''OpenCV 未能写入给定缓冲区而返回了新数组时，把新数组收进池中并计入分配'''
+        if self._slots[slot].get(name) is buf:
+            return
+        self._slots[slot][name] = buf
+        self.alloc_count += 1
+        self.alloc_bytes += buf.nbytes
+
+    def stats(self) -> Dict[str,float]:
+        '''累计分配情况，以及距上次调用以来平均每帧的分配次数和字节数'''
+        frames, count, nbytes = self.frames - self._last_stats[0], self.alloc_count - self._last_stats[1], self.alloc_bytes - self._last_stats[2]
+        self._last_stats = (self.frames, self.alloc_count, self.alloc_bytes)
+        return {'frames': self.frames,
+                'alloc_count': self.alloc_count,
+                'alloc_bytes': self.alloc_bytes,
+                'allocs_per_frame': count / frames if frames else 0.0,
+                'bytes_per_frame': nbytes / frames if frames else 0.0}
+
+
+class CapturedFrame:
+    '''
+    一帧采集结果，bgr 为解码后的原图；gray/rgb 在第一次访问时转换到池中的缓冲区
+    jpeg 为相机送来的原始 MJPEG 数据（一维 uint8，只在原始采集模式下有），录像时原样写出
+    '''
+    def __init__(self,pool:FramePool,slot:int,bgr:np.ndarray,stamp:FrameStamp,jpeg:Optional[np.ndarray]=None):
+        self.pool = pool
+        self.slot = slot
+        self.bgr = bgr
+        self.stamp = stamp
+        self.jpeg = jpeg
+        self._gray = None
+        self._rgb = None
+
+    @property
+    def gray(self) -> np.ndarray:
+        if self._gray is None:
+            dst = self.pool.buffer(self.slot,'gray',self.bgr.shape[:2])
+            self._gray = cv2.cvtColor(self.bgr,cv2.COLOR_BGR2GRAY,dst=dst)
+            self.pool.adopt(self.slot,'gray',self._gray)
+        return self._gray
+
+    @property
+    def rgb(self) -> np.ndarray:
+        '''整帧RGB，只有真正需要全分辨率RGB的使用者才访问'''
+        if self._rgb is None:
+            dst = self.pool.buffer(self.slot,'rgb',self.bgr.shape)
+            self._rgb = cv2.cvtColor(self.bgr,cv2.COLOR_BGR2RGB,dst=dst)
+            self.pool.adopt(self.slot,'rgb',self._rgb)
+        return self._rgb
+
+
+def pose_matrices(rvec:np.ndarray,tvec:np.ndarray) -> Tuple[np.ndarray,np.ndarray]:
+    '''由 OpenCV 的 rvec/tvec (标定板 -> 相机) 得到用于pyrender和位姿计算的两个矩阵'''
+    R, _ = cv2.Rodrigues(rvec)
+    # Pc = R @ Pw + tvec -> Pw = -R.T @ tvec
+    t = -R.T @ np.asarray(tvec).flatten()
+    pose_pyrender,camera_pose = np.eye(4),np.eye(4)
+    # transform opencv->pyrender or pyrender-> opencv
+    T_opencv2pyrender = np.array([[1,0,0],[0,-1,0],[0,0,-1]])
+    pose_pyrender[:3,:3] = T_opencv2pyrender @ R.T @ T_opencv2pyrender  # We must add extra transform for later method
+    # We could assosiate it with congruent transformation
+    pose_pyrender[:3,3] = T_opencv2pyrender @ t
+    camera_pose[:3,:3] = T_opencv2pyrender @ R
+    camera_pose[:3,3] = T_opencv2pyrender @ t
+    #print(pose_pyrender,camera_pose)
+    return pose_pyrender,camera_pose
+
+
+def reprojection_error(obj_points:np.ndarray,corners:np.ndarray,rvec:np.ndarray,tvec:np.ndarray,
+                       mtx:np.ndarray,dist:np.ndarray) -> float:
+    '''PnP结果的重投影误差(像素，均方根)，obj_points 与 corners 必须来自同一份标定板参数'''
+    projected, _ = cv2.projectPoints(obj_points,rvec,tvec,mtx,dist)
+    return float(np.sqrt(np.mean(np.sum((projected.reshape(-1,2) - corners.reshape(-1,2))**2,axis=1))))
 
 
 class Camera:
-    def __init__(self,config:Config):
+    def __init__(self,config:Config,metrics:Optional[StageMetrics]=None,source=None,pool_size:Optional[int]=None):
+        '''
+        source 为设备号或视频文件路径，默认 config.camera_id；视频文件读到结尾后从头循环
+        pool_size 为帧缓冲池槽位数，默认 config.frame_pool_size
+        '''
         self.config = config
-        self.cap = cv2.VideoCapture(config.camera_id)
-        self._setup_camera()
+        self.metrics = metrics if metrics is not None else StageMetrics(enabled=False)
+        self.source = config.camera_id if source is None else source
+        self.is_file = isinstance(self.source,str)
+        # 原始采集：由后端直接取出压缩的 MJPEG 数据、在这里解码，录像时不需要再次编码
+        self.raw_capture = config.recording_raw_camera
+        self.cap = self._open()
         self.mtx,self.dist = self._init_calibration()
-        self.obj_points = self._generate_chessboard_world()
+        self._update_board()
+        self.rvec = self.tvec = None  # 最近一次 solve_pose 的结果(OpenCV 相机系)
+        self.last_corners = None      # 最近一次检测到的角点，未检测到时为 None
+        self.frame_seq = 0  # 采集序号
+        self.frame_pool = FramePool(config.frame_pool_size if pool_size is None else pool_size)
+
+    def _open(self) -> cv2.VideoCapture:
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            raise ValueError(f"无法打开相机: {self.source}")
+        self.cap = cap
+        if not self.is_file:
+            self._setup_camera()
+        if self.raw_capture:
+            # FFmpeg 后端（录像文件）用 CAP_PROP_FORMAT=-1 输出原始数据包，V4L2 等设备后端用 CONVERT_RGB=0
+            cap.set(cv2.CAP_PROP_FORMAT if self.is_file else cv2.CAP_PROP_CONVERT_RGB, -1 if self.is_file else 0)
+        return cap
+
+    def _disable_raw_capture(self) -> None:
+        '''后端给出的不是 JPEG 数据（不支持原始输出或相机不是 MJPG 格式），重新打开为普通解码采集'''
+        print(f"相机 {self.source} 不支持原始 MJPEG 采集，录像时相机画面需要重新编码")
+        self.cap.release()
+        self.raw_capture = False
+        self.cap = self._open()
+
+    def _read_raw(self) -> Tuple[bool,Optional[np.ndarray],Optional[np.ndarray]]:
+        '''读取一帧原始数据并解码，返回 (ret, bgr, jpeg)；imdecode 不能写入已有缓冲区，每帧分配一次'''
+        ret,data = self.cap.read()
+        if not ret:
+            return False,None,None
+        jpeg = data.reshape(-1)
+        if data.ndim > 2 or data.shape[0] != 1 or jpeg[:2].tolist() != [0xFF,0xD8]:
+            self._disable_raw_capture()
+            ret,frame = self.cap.read()
+            return ret,frame,None
+        with self.metrics.stage('decode'):
+            frame = cv2.imdecode(jpeg,cv2.IMREAD_COLOR)
+        return frame is not None,frame,jpeg
 
     def _setup_camera(self) -> None:
         '''相机参数如分辨率和帧率'''
@@ -27,8 +182,8 @@ class Camera:
 
     def _init_calibration(self) -> Tuple[np.ndarray,np.ndarray]:
         '''相机初始化内参和畸变参数'''   
-        # 这里先进行简单假设
-        focal_length = 1400 # pixel assume that cmos is around 5mm
+        # 这里先进行简单假设，fx=fy，可通过 Config.fy 在运行时调整
+        focal_length = self.config.fy # pixel assume that cmos is around 5mm
         mtx = np.eye(3)
         mtx[0,0] = focal_length
         mtx[1,1] = focal_length
@@ -36,57 +191,137 @@ class Camera:
         dist = np.zeros((5,1),dtype=np.float32) # assume that no distortion
         return mtx,dist
     
+    def _update_board(self) -> None:
+        '''
+        从配置取一份标定板参数（尺寸、选用的角点、格子大小），检测和PnP都只用这一份，
+        保证角点与物体点一一对应；配置变化时由 apply_config_changes 整体替换
+        '''
+        self.chessboard_size = tuple(self.config.chessboard_size)
+        self.selected_indices = list(self.config.selected_indices)
+        self.square_size = self.config.chessboard_square_size
+        self.obj_points = self._generate_chessboard_world()
+        self.board_outline, self.board_corners = self._generate_board_overlay_points()
+
     def _generate_chessboard_world(self)->np.ndarray:
-        objp = np.zeros((self.config.chessboard_size[0] * self.config.chessboard_size[1], 3), np.float32)
-        objp[:, :2] = np.mgrid[0:self.config.chessboard_size[0], 0:self.config.chessboard_size[1]].T.reshape(-1, 2)
-        objp *= self.config.chessboard_square_size  # 乘以格子尺寸，转换为实际世界坐标
+        objp = np.zeros((self.chessboard_size[0] * self.chessboard_size[1], 3), np.float32)
+        objp[:, :2] = np.mgrid[0:self.chessboard_size[0], 0:self.chessboard_size[1]].T.reshape(-1, 2)
+        objp *= self.square_size  # 乘以格子尺寸，转换为实际世界坐标
         # pick some points
-        objp = objp[self.config.selected_indices]
+        objp = objp[self.selected_indices]
         return objp   
     
-    def capture_frame(self)->np.ndarray:
-        '''捕捉一帧图像并且返回RGB格式'''
-        ret,frame = self.cap.read()
+    def _generate_board_overlay_points(self) -> Tuple[np.ndarray,np.ndarray]:
+        '''调试叠加用的标定板外轮廓(内角点向外扩一格)和全部内角点，棋盘格坐标系'''
+        nx, ny = self.chessboard_size
+        size = self.square_size
+        outline = np.array([[-1,-1,0],[nx,-1,0],[nx,ny,0],[-1,ny,0]],dtype=np.float32) * size
+        corners = np.zeros((nx*ny,3),np.float32)
+        corners[:, :2] = np.mgrid[0:nx, 0:ny].T.reshape(-1, 2) * size
+        return outline, corners
+
+    def apply_config_changes(self,changed:Set[str]) -> None:
+        '''配置变化后只重建受影响的部分：内参或PnP用到的标定板点'''
+        if 'fy' in changed:
+            self.mtx,self.dist = self._init_calibration()
+        if changed & {'chessboard_size','chessboard_square_size','selected_indices'}:
+            self._update_board()
+
+    def capture_frame(self)->CapturedFrame:
+        '''捕捉一帧BGR图像（解码到池中的缓冲区），附带采集时刻的帧标记'''
+        slot = self.frame_pool.next_slot()
+        with self.metrics.stage('capture_wait'):
+            ret,frame,jpeg = self._read(slot)
+            if not ret and self.is_file:
+                # 录像读到结尾，从头循环
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES,0)
+                ret,frame,jpeg = self._read(slot)
         if not ret:
             raise ValueError("Frame capture failed")
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)   # cv2是BGR需要转换一下
+        self.frame_pool.adopt(slot,'bgr',frame)
+        # read()返回即视为采集时刻，单调时钟与界面线程共用
+        self.frame_seq += 1
+        stamp = FrameStamp(self.frame_seq, time.perf_counter_ns())
+        return CapturedFrame(self.frame_pool,slot,frame,stamp,jpeg)
+
+    def _read(self,slot:int) -> Tuple[bool,Optional[np.ndarray],Optional[np.ndarray]]:
+        if self.raw_capture:
+            return self._read_raw()
+        buf = self.frame_pool.peek(slot,'bgr')
+        ret,frame = self.cap.read(buf) if buf is not None else self.cap.read()
+        return ret,frame,None
 
-    def detect_chessboard(self,frame:np.ndarray) -> Tuple[bool, np.ndarray]:
+    def detect_chessboard(self,frame:CapturedFrame) -> Tuple[bool, np.ndarray]:
         '''检测棋盘格角点'''
-        gray = cv2.cvtColor(frame,cv2.COLOR_RGB2GRAY)
+        with self.metrics.stage('grayscale'):
+            gray = frame.gray
         # TODO 超时控制
-        ret, corners = cv2.findChessboardCorners(gray, self.config.chessboard_size, None)
+        with self.metrics.stage('detect'):
+            ret, corners = cv2.findChessboardCorners(gray, self.chessboard_size, None)
         if ret:
-            corners = cv2.cornerSubPix(image=gray,
-                                        corners=corners,
-                                        winSize=(11,11),
-                                        zeroZone=(-1,-1),
-                                        criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001))
-            selected_corners = corners[self.config.selected_indices]
+            with self.metrics.stage('corner_subpix'):
+                corners = cv2.cornerSubPix(image=gray,
+                                            corners=corners,
+                                            winSize=(11,11),
+                                            zeroZone=(-1,-1),
+                                            criteria=(cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001))
+            selected_corners = corners[self.selected_indices]
+            self.last_corners = selected_corners
             return ret,selected_corners
         else:
+            self.last_corners = None
             return False,False
 
-    def solve_pose(self,corners:np.ndarray)->Tuple[np.ndarray,np.ndarray]:
-        '''solvePnP求解位姿，返回用于pyrender和位姿计算的两个矩阵'''
+    def solve_pnp(self,corners:np.ndarray) -> Tuple[np.ndarray,np.ndarray]:
+        '''solvePnP求解标定板 -> 相机的 rvec/tvec，并记为最近一次的结果'''
         # TODO better PnP
-        ret,rvec,tvec = cv2.solvePnP(self.obj_points,corners,self.mtx,self.dist)
+        with self.metrics.stage('pnp'):
+            ret,rvec,tvec = cv2.solvePnP(self.obj_points,corners,self.mtx,self.dist)
         if not ret:
             raise ValueError('PnP solve failed')
-        R, _ = cv2.Rodrigues(rvec)
-        # Pc = R @ Pw + tvec -> Pw = -R.T @ tvec
-        t = -R.T @ tvec.flatten()
-        pose_pyrender,camera_pose = np.eye(4),np.eye(4)
-        # transform opencv->pyrender or pyrender-> opencv
-        T_opencv2pyrender = np.array([[1,0,0],[0,-1,0],[0,0,-1]])
-        pose_pyrender[:3,:3] = T_opencv2pyrender @ R.T @ T_opencv2pyrender  # We must add extra transform for later method
-        # We could assosiate it with congruent transformation
-        pose_pyrender[:3,3] = T_opencv2pyrender @ t
-        camera_pose[:3,:3] = T_opencv2pyrender @ R
-        camera_pose[:3,3] = T_opencv2pyrender @ t
-        #print(pose_pyrender,camera_pose)
-
-        return pose_pyrender,camera_pose
+        self.rvec, self.tvec = rvec, tvec
+        return rvec, tvec
+
+    def reprojection_error(self,corners:np.ndarray,rvec:np.ndarray,tvec:np.ndarray) -> float:
+        '''PnP结果的重投影误差(像素，均方根)'''
+        return reprojection_error(self.obj_points,corners,rvec,tvec,self.mtx,self.dist)
+
+    def solve_pose(self,corners:np.ndarray)->Tuple[np.ndarray,np.ndarray]:
+        '''solvePnP求解位姿，返回用于pyrender和位姿计算的两个矩阵'''
+        return pose_matrices(*self.solve_pnp(corners))
+
+    def last_result(self) -> Tuple[Optional[np.ndarray],Optional[np.ndarray],Optional[np.ndarray],float,int]:
+        '''最近一帧的结果，供会话日志：(角点, rvec, tvec, 重投影误差, 相机数)，未检测到时角点等为 None'''
+        if self.last_corners is None or self.rvec is None:
+            return None, None, None, float('nan'), 0
+        return self.last_corners, self.rvec, self.tvec, self.reprojection_error(self.last_corners,self.rvec,self.tvec), 1
+
+    def draw_chessboard_overlay(self,frame:np.ndarray,rvec:Optional[np.ndarray]=None,tvec:Optional[np.ndarray]=None) -> None:
+        '''
+        用最近一次求解的位姿（或给定的 rvec/tvec）把标定板轮廓和内角点投影到BGR图像上，直接在 frame 上修改
+        只在标定板多边形的包围盒内做半透明混合，不产生整帧大小的临时图像
+        '''
+        if rvec is None:
+            rvec, tvec = self.rvec, self.tvec
+        if rvec is None:
+            return
+        outline, _ = cv2.projectPoints(self.board_outline,rvec,tvec,self.mtx,self.dist)
+        polygon = np.round(outline.reshape(-1,2)).astype(np.int32)
+        height, width = frame.shape[:2]
+        x0, y0 = np.clip(polygon.min(axis=0), 0, [width, height])
+        x1, y1 = np.clip(polygon.max(axis=0) + 1, 0, [width, height])
+        if x1 <= x0 or y1 <= y0:
+            return  # 标定板完全在画面外
+        roi = frame[y0:y1, x0:x1]   # 视图，修改会写回 frame
+        mask = np.zeros(roi.shape[:2],np.uint8)
+        cv2.fillPoly(mask,[polygon - [x0, y0]],255)
+        board = np.zeros_like(roi)
+        board[..., 1] = 255     # 绿色半透明，方便调试
+        blended = cv2.addWeighted(roi, 0.7, board, 0.3, 0)
+        cv2.copyTo(blended, mask, roi)
+        cv2.polylines(frame,[polygon],True,(0,255,0),2)
+        corners, _ = cv2.projectPoints(self.board_corners,rvec,tvec,self.mtx,self.dist)
+        for x, y in np.round(corners.reshape(-1,2)).astype(np.int32):
+            cv2.circle(frame,(int(x),int(y)),3,(0,0,255),-1)
 
     def release(self)->None:
         '''释放相机资源'''
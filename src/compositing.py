@@ -0,0 +1,12 @@
+'''
+视图合成的纯图像运算，不依赖 pyrender/OpenGL，没有GL环境时也可以导入（如性能基准）
+'''
+
+import numpy as np
+
+
+def composite_camera_view(camera_rendering:np.ndarray,face_img:np.ndarray)->np.ndarray:
+    '''相机视图合成：相机模型渲染结果中的白色背景处换成面部混合图像'''
+    temp = np.sum(camera_rendering, axis=2, dtype=np.uint16)
+    mask = (temp <= 254 * 3)[:, :, np.newaxis]
+    return (mask * camera_rendering + (~mask) * face_img).astype(np.uint8)
@@ -1,13 +1,17 @@
 import numpy as np
-import trimesh
 import json
 import os
-from typing import Tuple
+import time
+from typing import Any, Callable, Dict, List, Set, Tuple, Union
 
 class Config:
     def __init__(self, camera_test: bool = True):
         # 配置文件保存路径
         self.config_path = "deploy_config.json"
+        self.config_poll_interval = 1.0     # 运行时检查配置文件是否被修改的间隔(秒)
+        self._config_mtime = None
+        self._last_poll = 0.0
+        self._listeners = []
         
         # --- 1. 相机基础参数 ---
         # self.campose = np.eye(4)
@@ -16,6 +20,7 @@ class Config:
         self.camera_id = 0 
         self.camera_resolution: Tuple[int, int] = (1920, 1080) # 现场需确认
         self.camera_fps: int = 30
+        self.frame_pool_size = 3    # 采集缓冲池槽位数，需大于同时在用的帧数；多相机时 MultiCamera 会按需加大
         
         # 关键：动态内参 (fy)。开始默认 1400，cx, cy 默认取分辨率中心
         self.fy = 1400.0  
@@ -40,6 +45,12 @@ class Config:
         self.mixed_alpha: float = 0.5   # 叠加显示时的透明度
         self.ui_fps = 60
         self.arrow_length = 0.1         # 虚拟坐标轴长度
+        # 六个输出视图的名称，顺序与 ImageGenerator 的输出下标一致
+        self.view_names: Tuple[str, ...] = ('camera', 'tooth', 'front', 'top', 'side', 'debug')
+        # 各视图在界面上的尺寸(宽,高)，工作线程直接输出该尺寸的图像
+        self.view_sizes = {'camera': (640, 480), 'tooth': (640, 480),
+                           'front': (300, 200), 'top': (300, 200), 'side': (300, 200),
+                           'debug': (self.camera_resolution[0]//3, self.camera_resolution[1]//3)}
         
         # --- 6. 混合视图渲染视角同步 (核心逻辑) ---
         # 我们增加两个变量来控制“拉远距离”和“减小畸变”
@@ -50,7 +61,57 @@ class Config:
         self.cpose = np.eye(4)   # 模型的基础偏置（通常保持eye即可）
 
         # 固定位置（由模型本身决定的初始偏置，如果没有则设为 eye）
-        self.cpose = np.eye(4) 
+        self.cpose = np.eye(4)
+
+        # --- 7. 脏标记：位姿变化低于阈值时跳过渲染，界面保留上一张图像 ---
+        self.dirty_tracking = True
+        self.pose_trans_threshold = 0.0005              # 平移阈值：0.5mm
+        self.pose_rot_threshold = np.radians(0.2)       # 旋转阈值：0.2度
+
+        # --- 8. 视图调度：目标帧率(<=0不限速)、优先级(越小越重要)、每帧时间预算 ---
+        self.view_target_fps = {'tooth': 30, 'camera': 15, 'front': 10, 'top': 10, 'side': 10, 'debug': 10}
+        self.view_priority = {'tooth': 0, 'camera': 1, 'debug': 2, 'front': 3, 'top': 3, 'side': 3}
+        self.frame_budget_ms = 30.0         # 约等于相机帧间隔
+        self.max_view_deferrals = 5         # 连续推迟次数上限，超过后强制渲染
+
+        # --- 9. 性能统计 (默认关闭) ---
+        self.metrics_enabled = False
+        self.metrics_window = 1000                          # 每个阶段保留的滚动样本数
+        self.metrics_export_path = "../temp/metrics.json"   # 后缀为 .csv 时导出CSV
+        self.metrics_export_interval = 10.0                 # 周期导出间隔(秒)，<=0 只在退出时导出
+        self.metrics_overlay = False                        # 是否在界面上叠加显示统计
+        self.latency_export_path = "../temp/latency.json"   # 端到端(采集->显示)延迟统计
+        self.gl_profiling = False                           # 渲染调用的GL级耗时分解(上传/绘制/GPU/读回)，见 gl_profiler.py
+
+        # --- 10. 细节层次(LOD)：按投影到屏幕上的几何误差选择预处理生成的简化网格 ---
+        self.lod_enabled = True
+        self.lod_pixel_error = 0.5      # 允许的最大屏幕误差(像素)
+
+        # --- 11. 距离场(SDF)：预处理导出的牙齿距离场，用于探头-牙齿距离和瞄准点，没有时退回网格射线检测 ---
+        self.sdf_enabled = True
+        self.sdf_max_distance = 0.5     # 瞄准射线的最远距离(米)
+        self.sdf_max_steps = 64         # 球追踪的最大步数
+
+        # --- 12. 多相机：每个相机一个采集+检测线程，各自的 PnP 结果按重投影误差加权融合为一个位姿 ---
+        # 每项为设备号或录像文件路径，第一个为参考相机（位姿、调试画面都以它为准）；只有一项时与单相机相同
+        self.camera_sources: List[Union[int, str]] = [self.camera_id]
+        # 各相机的外参：相机 i 的 OpenCV 坐标系 -> 参考相机 OpenCV 坐标系的 4x4 矩阵，第一个为单位阵
+        # 两个相机同时看到标定板时 E_i = T_0 @ inv(T_i)，T 为各自 PnP 得到的 标定板->相机 矩阵
+        self.camera_extrinsics = np.eye(4)[None]
+        self.camera_max_reproj_error = 2.0      # 重投影误差(像素)超过该值的结果不参与融合
+        self.camera_sync_tolerance = 0.02       # 其他相机的结果与参考相机帧的采集时间差上限(秒)
+
+        # --- 13. 会话日志：每帧的检测结果和位姿写入二进制日志，见 session_log.py ---
+        self.session_log_enabled = True
+        self.session_log_dir = "../temp/sessions"
+
+        # --- 14. 录像：输出视图在后台线程编码写出，相机画面可原样保存 MJPEG 流，见 recorder.py ---
+        self.recording_autostart = False            # 启动即开始录像；运行中按 R 键开始/停止
+        self.recording_views: Tuple[str, ...] = ('tooth', 'camera')
+        self.recording_dir = "../temp/recordings"
+        self.recording_fourcc = 'mp4v'
+        self.recording_queue_size = 8               # 每路待编码的帧数上限，满时丢弃最旧的
+        self.recording_raw_camera = False           # 采集原始 MJPEG 并在录像时原样写出（相机需为 MJPG 格式）
 
         # 启动时自动加载上次保存的校准参数
         self.load_from_file()
@@ -73,51 +134,95 @@ class Config:
 
     # --- 辅助方法：生成变换矩阵 ---
 
+    @staticmethod
+    def _trans_scale_matrix(trans: np.ndarray, scale: float) -> np.ndarray:
+        """平移 @ 均匀缩放，与 trimesh.transformations 的结果一致（这里不引入 trimesh 以加快启动）"""
+        M = np.diag([scale, scale, scale, 1.0])
+        M[:3, 3] = trans
+        return M
+
     def get_head_matrix(self) -> np.ndarray:
         """获取人头的 4x4 变换矩阵"""
-        T = trimesh.transformations.translation_matrix(self.head_trans)
-        S = trimesh.transformations.scale_matrix(self.head_scale)
-        return T @ S
+        return self._trans_scale_matrix(self.head_trans, self.head_scale)
 
     def get_teeth_matrix(self) -> np.ndarray:
         """获取牙齿的 4x4 变换矩阵"""
-        T = trimesh.transformations.translation_matrix(self.teeth_trans)
-        S = trimesh.transformations.scale_matrix(self.teeth_scale)
-        return T @ S
+        return self._trans_scale_matrix(self.teeth_trans, self.teeth_scale)
 
     def get_yfov(self) -> float:
         """根据当前的 fy 计算 pyrender 需要的垂直 FOV"""
         return 2.0 * np.arctan(self.camera_resolution[1] / (2.0 * self.fy))
 
-    # --- 持久化存储逻辑 ---
+    # --- 持久化存储与运行时更新 ---
+    # 可以在运行时修改（写入 deploy_config.json 或调用 apply）并立即生效的字段
+    RELOADABLE_FIELDS = ("fy", "head_trans", "head_scale", "teeth_trans", "teeth_scale", "cam_distance_offset",
+                         "chessboard_size", "chessboard_square_size", "selected_indices", "camera_extrinsics")
+
+    def add_listener(self, callback: Callable[[Set[str]], None]) -> None:
+        """注册配置变化通知，回调参数为发生变化的字段名集合，在调用 apply/reload 的线程中执行"""
+        self._listeners.append(callback)
+
+    def apply(self, data: Dict[str, Any]) -> Set[str]:
+        """应用一组新的参数，只通知真正发生变化的字段"""
+        changed = set()
+        for name in self.RELOADABLE_FIELDS:
+            if name not in data:
+                continue
+            old = getattr(self, name)
+            # 保持原有类型（JSON 中数组读出来是 list）
+            if isinstance(old, np.ndarray):
+                new = np.asarray(data[name], dtype=float)
+            elif isinstance(old, tuple):
+                new = tuple(data[name])
+            elif isinstance(old, list):
+                new = list(data[name])
+            else:
+                new = type(old)(data[name])
+            if not np.array_equal(old, new):
+                setattr(self, name, new)
+                changed.add(name)
+        if changed & {"head_trans", "cam_distance_offset"}:
+            self.update_sync_campose()
+            changed.add("campose")
+        if changed:
+            for callback in self._listeners:
+                callback(changed)
+        return changed
+
+    def reload_if_changed(self) -> Set[str]:
+        """配置文件被修改后重新加载，距离上次检查不足 config_poll_interval 秒时直接返回"""
+        now = time.monotonic()
+        if now - self._last_poll < self.config_poll_interval:
+            return set()
+        self._last_poll = now
+        try:
+            mtime = os.stat(self.config_path).st_mtime
+        except OSError:
+            return set()
+        if mtime == self._config_mtime:
+            return set()
+        return self.load_from_file()
 
     def save_to_file(self) -> None:
-        data = {
-            "fy": self.fy,
-            "face_trans": self.face_trans,
-            "face_scale": self.face_scale,
-            "teeth_trans": self.teeth_trans,
-            "teeth_scale": self.teeth_scale,
-            "cam_distance_offset": self.cam_distance_offset
-        }
+        data = {}
+        for name in self.RELOADABLE_FIELDS:
+            value = getattr(self, name)
+            data[name] = value.tolist() if isinstance(value, np.ndarray) else value
         try:
             with open(self.config_path, 'w') as f:
                 json.dump(data, f, indent=4)
+            self._config_mtime = os.stat(self.config_path).st_mtime  # 自己写入的不再触发重新加载
             print(f"参数已保存")
         except Exception as e:
             print(f"保存失败: {e}")
 
-    def load_from_file(self) -> None:
+    def load_from_file(self) -> Set[str]:
         if os.path.exists(self.config_path):
             try:
+                self._config_mtime = os.stat(self.config_path).st_mtime
                 with open(self.config_path, 'r') as f:
                     data = json.load(f)
-                self.fy = data.get("fy", self.fy)
-                self.face_trans = data.get("face_trans", self.face_trans)
-                self.face_scale = data.get("face_scale", self.face_scale)
-                self.teeth_trans = data.get("teeth_trans", self.teeth_trans)
-                self.teeth_scale = data.get("teeth_scale", self.teeth_scale)
-                self.cam_distance_offset = data.get("cam_distance_offset", self.cam_distance_offset)
-                self.update_sync_campose() # 加载后同步
+                return self.apply(data) # 加载后同步
             except Exception as e:
-                print(f"加载失败: {e}")
\ No newline at end of file
+                print(f"加载失败: {e}")
+        return set()
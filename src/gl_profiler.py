@@ -0,0 +1,184 @@
+'''
+渲染调用的GL级计时：把 pyrender 一次 render 拆成上传(顶点缓冲/纹理)、绘制提交、GPU执行和读回(glReadPixels)，
+并记录提交的三角形数和读回的字节数，用来判断是哪个场景、哪个网格超出了帧预算。
+GPU 时间使用 GL_TIME_ELAPSED 计时查询，从上传完成到开始读回，与 draw_ms 是同一区间；
+上下文不支持时只有 CPU 时间（gpu_ms 为 None）
+'''
+
+import collections
+import ctypes
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+import pyrender
+from OpenGL import GL as gl
+
+
+class RenderCall(NamedTuple):
+    '''一次 render 调用的耗时分解，时间单位毫秒'''
+    total_ms: float         # 整个 render 调用（CPU）
+    upload_ms: float        # 上传新网格/纹理，LOD 切换或场景切换时不为 0
+    draw_ms: float          # 遍历场景、提交绘制命令（CPU），不含上传和读回
+    gpu_ms: Optional[float] # 绘制在 GPU 上的执行时间（计时查询），不含上传和读回，不支持时为 None
+    readback_ms: float      # 读回颜色/深度缓冲，包含等待 GPU 完成
+    triangles: int          # 提交的三角形数（含实例化）
+    readback_bytes: int     # 读回的字节数
+
+
+def count_triangles(scene: pyrender.Scene) -> int:
+    '''场景中可见网格提交的三角形数'''
+    total = 0
+    for node in scene.mesh_nodes:
+        mesh = node.mesh
+        if mesh is None or not mesh.is_visible:
+            continue
+        for primitive in mesh.primitives:
+            if primitive.mode != pyrender.constants.GLTF.TRIANGLES:
+                continue
+            count = len(primitive.indices) if primitive.indices is not None else len(primitive.positions) // 3
+            total += count * (len(primitive.poses) if primitive.poses is not None else 1)
+    return total
+
+
+class _ContextProbe:
+    '''挂在一个 OffscreenRenderer 上的计时钩子，只在该上下文中使用自己的查询对象'''
+    def __init__(self, name: str, offscreen: pyrender.OffscreenRenderer, window: int):
+        self.name = name
+        self.calls = collections.deque(maxlen=window)
+        self.count = 0
+        self._lock = threading.Lock()   # 渲染线程写入，界面线程读取统计
+        self._query = None              # 第一次渲染时在该上下文中创建，None 表示还没试过
+        self._query_supported = True
+        self._reset()
+        renderer = offscreen._renderer
+        self._render = renderer.render
+        self._update_context = renderer._update_context
+        self._read_main_framebuffer = renderer._read_main_framebuffer
+        # 替换实例上的方法，不影响其他 pyrender 渲染器
+        renderer.render = self.render
+        renderer._update_context = self.update_context
+        renderer._read_main_framebuffer = self.read_main_framebuffer
+
+    def _reset(self) -> None:
+        self._upload_ns = 0
+        self._readback_ns = 0
+        self._readback_bytes = 0
+        self._draw_end = None
+        self._query_active = False
+        self._query_begun = False       # 本次调用是否开始过计时查询
+
+    def _begin_query(self) -> None:
+        if not self._query_supported:
+            return
+        try:
+            if self._query is None:
+                self._query = int(gl.glGenQueries(1)[0])
+            gl.glBeginQuery(gl.GL_TIME_ELAPSED, self._query)
+            self._query_active = self._query_begun = True
+        except Exception:
+            # 上下文不支持计时查询(GL < 3.3 且没有 ARB_timer_query)，之后只用 CPU 计时
+            self._query_supported = False
+
+    def _end_query(self) -> None:
+        if self._query_active:
+            gl.glEndQuery(gl.GL_TIME_ELAPSED)
+            self._query_active = False
+
+    def _query_result_ms(self) -> Optional[float]:
+        if not self._query_supported or not self._query_begun:
+            return None
+        elapsed = ctypes.c_uint64()
+        # 读回之后 GPU 已完成，结果立即可用
+        gl.glGetQueryObjectui64v(self._query, gl.GL_QUERY_RESULT, ctypes.byref(elapsed))
+        return elapsed.value / 1e6
+
+    def render(self, scene, flags, seg_node_map=None):
+        self._reset()
+        start = time.perf_counter_ns()
+        try:
+            return self._render(scene, flags, seg_node_map)
+        finally:
+            self._end_query()   # 没有读回（不支持帧缓冲的平台）时在这里结束
+            end = time.perf_counter_ns()
+            draw_end = self._draw_end if self._draw_end is not None else end
+            total_ms = (end - start) / 1e6
+            gpu_ms = self._query_result_ms()
+            if gpu_ms is not None and gpu_ms > total_ms:
+                # 查询区间在本次调用之内，超出只能是无效结果（部分驱动的第一次查询），丢弃
+                gpu_ms = None
+            call = RenderCall(
+                total_ms=total_ms,
+                upload_ms=self._upload_ns / 1e6,
+                draw_ms=(draw_end - start - self._upload_ns) / 1e6,
+                gpu_ms=gpu_ms,
+                readback_ms=self._readback_ns / 1e6,
+                triangles=count_triangles(scene),
+                readback_bytes=self._readback_bytes)
+            with self._lock:
+                self.calls.append(call)
+                self.count += 1
+
+    def update_context(self, scene, flags):
+        # pyrender 在每次 render 开始时调用一次，上传完成后才开始计时查询，GPU 时间与 draw_ms 一样不含上传
+        start = time.perf_counter_ns()
+        try:
+            return self._update_context(scene, flags)
+        finally:
+            self._upload_ns += time.perf_counter_ns() - start
+            if not self._query_begun:
+                self._begin_query()
+
+    def read_main_framebuffer(self, scene, flags):
+        # 计时查询只覆盖绘制，读回单独计时
+        self._end_query()
+        self._draw_end = start = time.perf_counter_ns()
+        result = self._read_main_framebuffer(scene, flags)
+        self._readback_ns += time.perf_counter_ns() - start
+        buffers = result if isinstance(result, tuple) else (result,)
+        self._readback_bytes += sum(buf.nbytes for buf in buffers if isinstance(buf, np.ndarray))
+        return result
+
+    def stats(self) -> dict:
+        '''最近一次调用和滚动窗口内的平均值、p95'''
+        with self._lock:
+            calls, count = list(self.calls), self.count
+        if not calls:
+            return {'calls': count}
+        fields = {name: np.array([getattr(call, name) for call in calls], dtype=np.float64)
+                  for name in RenderCall._fields if name != 'gpu_ms'}
+        gpu = [call.gpu_ms for call in calls if call.gpu_ms is not None]
+        if gpu:
+            fields['gpu_ms'] = np.array(gpu)
+        return {'calls': count,
+                'last': calls[-1]._asdict(),
+                'mean': {name: float(values.mean()) for name, values in fields.items()},
+                'p95': {name: float(np.percentile(values, 95)) for name, values in fields.items()}}
+
+
+class GLRenderProfiler:
+    '''
+    按名字挂到多个 OffscreenRenderer 上（如 tooth/camera/face 各一个上下文），
+    stats() 返回每个上下文的耗时分解，format_summary() 为界面叠加显示的文本
+    '''
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._probes: Dict[str, _ContextProbe] = {}
+
+    def attach(self, name: str, offscreen: pyrender.OffscreenRenderer) -> None:
+        self._probes[name] = _ContextProbe(name, offscreen, self.window)
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: probe.stats() for name, probe in self._probes.items()}
+
+    def format_summary(self) -> str:
+        lines = []
+        for name, s in self.stats().items():
+            if 'mean' not in s:
+                continue
+            m = s['mean']
+            gpu = f'{m["gpu_ms"]:5.2f}' if 'gpu_ms' in m else '    -'
+            lines.append(f'gl/{name:<7}draw {m["draw_ms"]:5.2f}  gpu {gpu}  read {m["readback_ms"]:5.2f}  '
+                         f'up {m["upload_ms"]:5.2f} ms  {m["triangles"]/1000:6.1f}k tri')
+        return '\n'.join(lines)
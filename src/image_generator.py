@@ -1,81 +1,309 @@
 '''
-管理队列、启动/停止线程、生成图像。组合以上类，不直接处理渲染或相机。
+管理输出槽、启动/停止线程、生成图像。组合以上类，不直接处理渲染或相机。
 '''
 
+import os
 import threading
-import queue
 import time
 import numpy as np
-import time # for debug
 import cv2
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from config import Config
-from camera import Camera
-from renderer import PyrenderRenderer
-from axis_view_generator import AxisViewGenerator
+from camera import Camera, CapturedFrame
+from metrics import FrameStamp, LatencyTracker, StageMetrics, startup_profiler
+from scheduler import DirtyTracker, ViewScheduler
+
+class FrameSlot:
+    '''单个视图的输出槽：只保存最新的一张图像，未被取走的旧图像直接被覆盖'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item: Optional[Tuple[np.ndarray,FrameStamp]] = None
+
+    def put(self,img:np.ndarray,stamp:FrameStamp) -> bool:
+        '''放入新图像，返回放入前槽是否为空（为空时才需要通知界面）'''
+        with self._lock:
+            was_empty = self._item is None
+            self._item = (img,stamp)
+        return was_empty
+
+    def take(self) -> Optional[Tuple[np.ndarray,FrameStamp]]:
+        '''取走最新图像，没有新图像时返回 None'''
+        with self._lock:
+            item, self._item = self._item, None
+        return item
+
 
 class ImageGenerator:
     def __init__(self, config:Config):
         self.config = config
-        self.camera = Camera(config)
-                
-        self.axis_generator = AxisViewGenerator(config)
-        self.image_queues = [queue.Queue(maxsize=3) for _ in range(6)]  # 初始化缓冲队列
-        self.running = False    # 用于线程
+        self.metrics = StageMetrics(enabled=config.metrics_enabled,
+                                    window=config.metrics_window,
+                                    export_path=config.metrics_export_path,
+                                    export_interval=config.metrics_export_interval)
+        self.latency = LatencyTracker(config.view_names,
+                                      enabled=config.metrics_enabled,
+                                      window=config.metrics_window,
+                                      export_path=config.latency_export_path,
+                                      export_interval=config.metrics_export_interval)
+        # 相机、渲染器和轴视图在工作线程中启动，renderer.py/axis_view_generator.py 及其依赖
+        # (pyrender、trimesh、matplotlib) 也推迟到那时导入，界面可以先显示出来
+        self.camera = None
+        self.axis_generator = None
         self.renderer = None
+        self.session_log = None
+        self.recorder = None    # 录像中时为 Recorder，界面线程开始/停止，渲染线程只读取引用
+        self._meshes_future: Optional[Future] = None
+        self._axis_future: Optional[Future] = None
+        self.dirty = DirtyTracker(config)
+        self.scheduler = ViewScheduler(config)
+        self.image_slots = [FrameSlot() for _ in range(6)]  # 每个视图一个输出槽，元素为 (图像, FrameStamp)
+        self._listeners: List[Callable[[int],None]] = []  # 有新图像时回调，参数为视图下标
+        # 配置变化可能来自界面线程，先记下，由渲染线程在下一帧开始前统一应用
+        self._config_changes = set()
+        self._config_lock = threading.Lock()
+        config.add_listener(self._on_config_changed)
+        self.running = False    # 用于线程
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self,callback:Callable[[int],None]) -> None:
+        '''
+        注册新图像通知，回调在工作线程中执行，必须线程安全（例如发射Qt信号）
+        同一视图的图像未被取走前不会重复通知
+        '''
+        self._listeners.append(callback)
 
     def start_generating(self) -> None:
         '''启动处理线程的接口'''
         self.running = True
-        threading.Thread(target=self._generate_images,daemon=True).start()  # 守护线程，适合当作后台进程
+        self._thread = threading.Thread(target=self._generate_images,daemon=True)  # 守护线程，适合当作后台进程
+        self._thread.start()
 
-    def stop_generating(self) -> None:
-        '''重置标签并释放资源'''
+    def stop_generating(self,timeout:float=2.0) -> None:
+        '''重置标签，等渲染线程处理完当前帧退出后再释放资源；相机卡住时最多等待 timeout 秒'''
         self.running = False
-        self.camera.release()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.camera is not None:
+            self.camera.release()
+        if self.session_log is not None:
+            self.session_log.close()
+            self.session_log = None
+        self.stop_recording()
+        self.metrics.export()   # 退出时导出一次统计
+        self.latency.export()
         if self.renderer is not None:
             self.renderer.cleanup()
             self.renderer = None
 
     def _generate_images(self) -> None:
-        '''主循环，捕捉帧、求解位姿、渲染、放入队列'''
-        if self.renderer is None:
-            self.renderer = PyrenderRenderer(self.config)
+        '''主循环，捕捉帧、求解位姿、渲染、放入输出槽'''
+        self._startup()
         while self.running:
+            self.config.reload_if_changed()
+            self._attach_ready_subsystems()
+            self._apply_config_changes()
             frame = self.camera.capture_frame()
-            
-            a = time.time()
-            ret, corners = self.camera.detect_chessboard(frame)
-            if self.config.camera_test:
-                # 相机调试，放入队列 [5]
-                # rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                #rgb_frame = frame[:,:,::-1]
-                # 在中心添加红点
-                frame[self.config.camera_resolution[1]//2-3:self.config.camera_resolution[1]//2+3, self.config.camera_resolution[0]//2-3:self.config.camera_resolution[0]//2+3, :] = [255,0,0]
-            debug_frame = frame.copy()
-            if ret:
-                pose_pyrender, camera_pose = self.camera.solve_pose(corners)
-                tooth_img = self.renderer.render_tooth(pose_pyrender)
-                self._put_image(tooth_img,1)
-                camera_img = self.renderer.render_camera(pose_pyrender)
-                self._put_image(camera_img,0)
-                img_front, img_top, img_side = self.axis_generator.create_axis(camera_pose)
-                self._put_image(img_front,2)
-                self._put_image(img_top,3)
-                self._put_image(img_side,4)
-                if self.config.camera_test:
-                    board_overlay = self.renderer.render_chessboard(pose_pyrender)
-                    board_overlay = cv2.resize(board_overlay, self.config.camera_resolution)
-                    debug_frame = cv2.addWeighted(debug_frame, 0.7, board_overlay, 0.7, 0)
-            self._put_image(debug_frame,5)
-            print("Time per frame:",time.time()-a) # for debug
-            
-
-    def _put_image(self,img:np.ndarray,i:int) -> None:
-        '''为多张图片的加入创建统一的接口'''
-        try:
-            self.image_queues[i].put(img,timeout=0.001) # without timeout, code will stop hear forever
-        except queue.Full:
-            pass
+            self.latency.on_capture(frame.stamp)
+            with self.metrics.stage('frame_total'):
+                self._process_frame(frame,frame.stamp)
+            self.metrics.maybe_export()
+            self.latency.maybe_export()
+
+    def _startup(self) -> None:
+        '''在后台线程加载模型、创建轴视图的同时，在本线程打开相机；相机就绪后立即开始出图'''
+        executor = ThreadPoolExecutor(max_workers=2,thread_name_prefix='startup')
+        self._meshes_future = executor.submit(self._load_meshes)
+        self._axis_future = executor.submit(self._create_axis_generator)
+        executor.shutdown(wait=False)
+        with startup_profiler.phase('camera_open'):
+            if len(self.config.camera_sources) > 1:
+                from multi_camera import MultiCamera
+                self.camera = MultiCamera(self.config,self.metrics)
+            else:
+                self.camera = Camera(self.config,self.metrics,self.config.camera_sources[0])
+        self._open_session_log()
+        if self.config.recording_autostart:
+            self.start_recording()
+
+    def start_recording(self) -> str:
+        '''开始录像（已在录像时不变），返回输出目录'''
+        if self.recorder is None:
+            from recorder import Recorder
+            self.recorder = Recorder(self.config,self.metrics)
+            print(f"开始录像: {self.recorder.directory}")
+        return self.recorder.directory
+
+    def stop_recording(self) -> None:
+        '''停止录像，等待队列中剩余的帧写完'''
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+            print(f"录像已保存: {recorder.directory}")
+
+    def _open_session_log(self) -> None:
+        '''每次启动一个新的会话日志文件，同名 .json 记录当时的对齐参数'''
+        if not self.config.session_log_enabled:
+            return
+        from session_log import SessionLog, LOG_EXTENSION
+        path = os.path.join(self.config.session_log_dir, time.strftime('session_%Y%m%d_%H%M%S') + LOG_EXTENSION)
+        meta = {name: value.tolist() if isinstance(value,np.ndarray) else value
+                for name,value in ((name,getattr(self.config,name)) for name in
+                                   ('camera_sources','camera_resolution','fy','chessboard_size','chessboard_square_size',
+                                    'selected_indices','head_trans','head_scale','teeth_trans','teeth_scale'))}
+        self.session_log = SessionLog(path,len(self.config.selected_indices),meta)
+
+    def _load_meshes(self) -> Dict:
+        with startup_profiler.phase('import_renderer'):
+            from renderer import PyrenderRenderer
+        with startup_profiler.phase('load_meshes'):
+            return PyrenderRenderer.load_meshes(self.config.lod_enabled)
+
+    def _create_axis_generator(self):
+        with startup_profiler.phase('import_matplotlib'):
+            from axis_view_generator import AxisViewGenerator
+        with startup_profiler.phase('axis_init'):
+            return AxisViewGenerator(self.config)
+
+    def _attach_ready_subsystems(self) -> None:
+        '''后台加载完成的子系统在这里接入；GL上下文必须在渲染线程(本线程)中创建'''
+        if self._meshes_future is not None and self._meshes_future.done():
+            from renderer import PyrenderRenderer   # 已在加载线程中导入
+            with startup_profiler.phase('renderer_init'):
+                self.renderer = PyrenderRenderer(self.config,self.metrics,self._meshes_future.result())
+            self._meshes_future = None
+        if self._axis_future is not None and self._axis_future.done():
+            self.axis_generator = self._axis_future.result()
+            self._axis_future = None
+
+    def _available_views(self) -> Tuple[int,...]:
+        '''子系统已就绪、可以渲染的位姿相关视图'''
+        views = ()
+        if self.renderer is not None:
+            views += (0,1)
+        if self.axis_generator is not None:
+            views += (2,3,4)
+        return views
+
+    def _on_config_changed(self,changed:Set[str]) -> None:
+        with self._config_lock:
+            self._config_changes |= changed
+
+    def _apply_config_changes(self) -> None:
+        '''按变化的字段只重建依赖它们的部分：场景节点位姿、相机内参、面部混合图、PnP物体点'''
+        with self._config_lock:
+            changed, self._config_changes = self._config_changes, set()
+        if not changed:
+            return
+        with self.metrics.stage('config_reload'):
+            self.camera.apply_config_changes(changed)
+            if self.renderer is not None:   # 尚未创建时，创建时会直接使用最新配置
+                self.renderer.apply_config_changes(changed)
+            if changed & {'fy','chessboard_size','chessboard_square_size','selected_indices','camera_extrinsics'}:
+                self.dirty.invalidate()         # 位姿求解或多相机融合方式变了，所有视图都要更新
+            else:
+                # 同时变化的几组字段各自失效对应的视图
+                views = set()
+                if changed & {'teeth_trans','teeth_scale'}:
+                    views |= {0,1}
+                if changed & {'head_trans','head_scale','campose'}:
+                    views.add(0)
+                if views:
+                    self.dirty.invalidate(tuple(sorted(views)))
+
+    def _process_frame(self,frame:CapturedFrame,stamp:FrameStamp) -> None:
+        '''处理一帧：检测、求解位姿，再按调度结果渲染各视图并放入输出槽'''
+        self.scheduler.begin_cycle()
+        recorder = self.recorder
+        if recorder is not None and frame.jpeg is not None:
+            recorder.submit_raw(frame.jpeg,stamp)
+        ret, corners = self.camera.detect_chessboard(frame)
+        candidates = [5] if self.config.camera_test else []    # 调试画面每帧都有新内容，只在调试模式下显示
+        poses = None
+        if ret:
+            poses = self.camera.solve_pose(corners)
+            # 位姿变化不明显的视图不重新渲染也不重新发送，界面保留上一张图像
+            candidates += self.dirty.dirty_views(poses[0],self._available_views())
+        session_log = self.session_log     # 界面线程可能同时关闭日志，只读取一次引用
+        if session_log is not None:
+            with self.metrics.stage('session_log'):
+                if ret:
+                    points, rvec, tvec, error, n_cameras = self.camera.last_result()
+                    session_log.append(stamp.seq,stamp.t_capture_ns,True,points,rvec,tvec,error,poses[0],n_cameras)
+                else:
+                    session_log.append(stamp.seq,stamp.t_capture_ns,False)
+        # 按优先级执行到期的视图，超出帧预算的低优先级视图推迟到之后的循环
+        for view in self.scheduler.due_views(candidates):
+            if not self.scheduler.fits(view):
+                continue
+            start = time.perf_counter_ns()
+            self._render_view(view,frame,poses,stamp)
+            self.scheduler.record_run(view,time.perf_counter_ns()-start)
+            if poses is not None and view != 5:
+                self.dirty.mark_clean(view,poses[0])
+
+    def _render_view(self,view:int,frame:CapturedFrame,poses:Optional[Tuple[np.ndarray,np.ndarray]],stamp:FrameStamp) -> None:
+        '''渲染单个视图并放入对应输出槽，poses 为 (pose_pyrender, camera_pose)，未检测到棋盘格时为 None'''
+        if view == 1:
+            with self.metrics.stage('tooth_render'):
+                img = self.renderer.render_tooth(poses[0])
+        elif view == 0:
+            with self.metrics.stage('camera_render'):    # 包含 ray_cast
+                img = self.renderer.render_camera(poses[0])
+        elif view in (2,3,4):
+            with self.metrics.stage('axis_plots'):
+                img = self.axis_generator.create_axis_view(poses[1],self.config.view_names[view])
+        else:
+            with self.metrics.stage('debug_view'):
+                img = self._render_debug(frame,poses is not None)
+        self._put_image(img,view,stamp)
+
+    def _render_debug(self,frame:CapturedFrame,detected:bool) -> np.ndarray:
+        '''
+        调试视图：相机原始画面，调试模式下叠加中心点和标定板。
+        直接在池中的BGR帧上绘制，先缩小到视图尺寸再转RGB，不产生整帧大小的RGB副本
+        '''
+        bgr = frame.bgr
+        if self.config.camera_test:
+            # 相机调试，放入输出槽 [5]
+            # 在中心添加红点(BGR)
+            bgr[self.config.camera_resolution[1]//2-3:self.config.camera_resolution[1]//2+3, self.config.camera_resolution[0]//2-3:self.config.camera_resolution[0]//2+3, :] = [0,0,255]
+            if detected:
+                self.camera.draw_chessboard_overlay(bgr)
+        small = self._fit_to_view(bgr,5)
+        if small is bgr:
+            # 视图与相机分辨率相同，池中的缓冲区会被复用，需要独立的输出数组
+            return cv2.cvtColor(bgr,cv2.COLOR_BGR2RGB)
+        return cv2.cvtColor(small,cv2.COLOR_BGR2RGB,dst=small)
+
+    def _fit_to_view(self,img:np.ndarray,i:int) -> np.ndarray:
+        '''
+        按比例缩放到视图尺寸并保证内存连续，界面线程可以直接引用该数组而无需复制或缩放
+        返回的数组不与渲染器/画布共享内存
+        '''
+        width, height = self.config.view_sizes[self.config.view_names[i]]
+        h, w = img.shape[:2]
+        scale = min(width/w, height/h)
+        size = (max(1,round(w*scale)), max(1,round(h*scale)))
+        if size == (w, h):
+            # 尺寸一致时只需保证连续（如matplotlib画布的RGBA切片），渲染结果本身已是新数组
+            return np.ascontiguousarray(img)
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        return cv2.resize(img, size, interpolation=interpolation)
+
+    def _put_image(self,img:np.ndarray,i:int,stamp:FrameStamp) -> None:
+        '''为多张图片的加入创建统一的接口，图像与其来源帧的标记一起放入输出槽并通知界面'''
+        with self.metrics.stage('prescale'):
+            img = self._fit_to_view(img,i)
+        with self.metrics.stage('enqueue'):
+            self.latency.on_output(i,stamp)
+            if self.image_slots[i].put(img,stamp):
+                for callback in self._listeners:
+                    callback(i)
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.submit(i,img,stamp)
 
 
 
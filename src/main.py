@@ -1,11 +1,23 @@
+import time
+T0 = time.perf_counter_ns()     # 启动计时的起点，放在所有导入之前
+
 import sys
-from main_window import MainWindow
-from config import Config
-from PyQt6.QtWidgets import QApplication
+from metrics import startup_profiler
 
 if __name__ == '__main__':
+    # --profile-startup: 打印导入和各启动阶段耗时，以及各视图首帧出现的时间
+    if '--profile-startup' in sys.argv:
+        sys.argv.remove('--profile-startup')
+        startup_profiler.enable(T0)
+    with startup_profiler.phase('import_qt'):
+        from PyQt6.QtWidgets import QApplication
+    with startup_profiler.phase('import_main_window'):
+        from main_window import MainWindow
+        from config import Config
     config = Config(camera_test=True)
     app = QApplication(sys.argv)
-    window = MainWindow(config)
-    window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    with startup_profiler.phase('window_setup'):
+        window = MainWindow(config)
+        window.show()
+    startup_profiler.mark('window_shown')
+    sys.exit(app.exec())
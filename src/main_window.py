@@ -1,13 +1,61 @@
 '''
-继承自QMainWindow，主要负责标签管理和定时器更新，从队列更新图像
+继承自QMainWindow，主要负责标签管理，收到新图像通知后从输出槽更新图像
 '''
 
 from PyQt6.QtWidgets import QMainWindow, QLabel, QVBoxLayout, QHBoxLayout, QWidget
-from PyQt6.QtGui import QImage, QPixmap
-from PyQt6.QtCore import QTimer, Qt
-import queue
+from PyQt6.QtGui import QImage, QFont, QPainter, QColor
+from PyQt6.QtCore import QObject, QTimer, Qt, pyqtSignal
+import time
+import numpy as np
+from typing import Callable, Optional, Tuple
 from config import Config
 from image_generator import ImageGenerator
+from metrics import FrameStamp, startup_profiler
+
+
+class ImageView(QWidget):
+    '''
+    直接绘制NumPy图像的控件。图像已由工作线程缩放到控件尺寸，
+    这里用QImage共享数组内存（不复制），并持有数组引用保证其在绘制期间有效
+    '''
+    def __init__(self,size:Tuple[int,int],on_displayed:Optional[Callable[[FrameStamp],None]]=None,parent=None):
+        super().__init__(parent)
+        self.setFixedSize(*size)
+        self._frame = None
+        self._qimage = None
+        self._stamp = None
+        self._on_displayed = on_displayed   # 实际绘制时回调，用于统计显示延迟
+
+    def set_frame(self,frame:np.ndarray,stamp:FrameStamp) -> None:
+        '''设置新图像，frame 为 HxWx3 的RGB数组，行之间可以有填充但像素必须紧密排列'''
+        height, width, _ = frame.shape
+        self._frame = frame
+        self._qimage = QImage(frame.data, width, height, frame.strides[0], QImage.Format.Format_RGB888)
+        self._stamp = stamp
+        self.update()
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        if self._qimage is None:
+            # 子系统还在启动，先显示占位
+            painter.fillRect(self.rect(), QColor(235, 235, 235))
+            painter.setPen(QColor(120, 120, 120))
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, '加载中…')
+            painter.end()
+            return
+        # 保持比例缩放后的图像可能小于控件，居中绘制
+        x = (self.width() - self._qimage.width()) // 2
+        y = (self.height() - self._qimage.height()) // 2
+        painter.drawImage(x, y, self._qimage)
+        painter.end()
+        if self._stamp is not None and self._on_displayed is not None:
+            self._on_displayed(self._stamp)
+            self._stamp = None
+
+
+class FrameNotifier(QObject):
+    '''把工作线程的新图像通知转为Qt信号，跨线程时自动排队到界面线程'''
+    frame_ready = pyqtSignal(int)
 
 
 class MainWindow(QMainWindow):
@@ -15,51 +63,71 @@ class MainWindow(QMainWindow):
         super().__init__() # 调用父类的init方法
         self.config = config
         self.image_generator = ImageGenerator(self.config)
-        self.image_labels = []  # 初始化标签列表
         self._setup_ui()    # init ui layout
+        # 事件驱动刷新：有新图像才刷新，短时间内的多次通知合并为一次，刷新频率不超过 ui_fps
+        self._pending_views = set()
+        self._last_flush = 0.0
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(self.update_images_from_slots)
+        self.notifier = FrameNotifier(self)
+        self.notifier.frame_ready.connect(self._on_frame_ready)
+        self.image_generator.add_listener(self.notifier.frame_ready.emit)
         self.image_generator.start_generating()
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_images_from_queue)
-        self.timer.start(int(1000/self.config.ui_fps)) # 设置界面帧率
+        if self.config.metrics_overlay:
+            # 性能统计刷新不需要跟随界面帧率
+            self.stats_timer = QTimer(self)
+            self.stats_timer.timeout.connect(self.update_stats_overlay)
+            self.stats_timer.start(500)
 
 
+    def _create_view(self,view:int) -> ImageView:
+        '''创建一个视图控件，尺寸与工作线程输出的图像尺寸一致'''
+        on_displayed = lambda stamp: self._on_view_displayed(view,stamp)
+        return ImageView(self.config.view_sizes[self.config.view_names[view]],on_displayed,self)
+
+    def _on_view_displayed(self,view:int,stamp:FrameStamp) -> None:
+        '''视图实际绘制后的回调：延迟统计，以及启动计时中的各视图首帧'''
+        self.image_generator.latency.on_display(view,stamp)
+        if startup_profiler.enabled and not startup_profiler.has_mark('all_views_ready'):
+            startup_profiler.mark(f'first_frame/{self.config.view_names[view]}')
+            if all(startup_profiler.has_mark(f'first_frame/{self.config.view_names[i]}') for i in range(len(self.image_labels))):
+                startup_profiler.mark('all_views_ready')
+                print(startup_profiler.report())
+
     def _setup_ui(self) -> None:
-        '''设置布局和标签'''
+        '''设置布局和标签，self.image_labels 的下标与 ImageGenerator 的输出下标一致'''
+        self.image_labels = [self._create_view(i) for i in range(6 if self.config.camera_test else 5)]
         # 创建主布局 (水平布局 for image1 and image2)
         main_layout = QHBoxLayout()
         # 左侧布局：image1 和下面的 image3, image4, image5
         left_layout = QVBoxLayout()
         # 先添加image1
-        image1_label = QLabel(self)
-        image1_label.setFixedSize(640,480)
-        self.image_labels.append(image1_label)
-        left_layout.addWidget(image1_label)
+        left_layout.addWidget(self.image_labels[0])
         # 左侧布局的下部布局
         left_bottom_layout = QHBoxLayout()
-        for i in range(3):
-            label = QLabel(self)
-            label.setFixedSize(300,200)
-            self.image_labels.append(label)
-            left_bottom_layout.addWidget(label)
+        for i in range(2,5):
+            left_bottom_layout.addWidget(self.image_labels[i])
         left_layout.addLayout(left_bottom_layout)
         # 添加左侧布局
         main_layout.addLayout(left_layout)
-        # 创建image2的QLabel
-        image2_label = QLabel(self)
-        image2_label.setFixedSize(640,480)
-        self.image_labels.insert(1,image2_label)
         # 考虑是否需要调试
         if not self.config.camera_test:
-            main_layout.addWidget(image2_label)
+            main_layout.addWidget(self.image_labels[1])
         else: 
             # 调试模式下在右侧窗口展示当前相机画面
             camera_test_layout = QVBoxLayout()
-            camera_view_label = QLabel(self)
-            camera_view_label.setFixedSize(self.config.camera_resolution[0]//3,self.config.camera_resolution[1]//3) # 1920*1080
-            self.image_labels.insert(5,camera_view_label)
-            camera_test_layout.addWidget(image2_label)
-            camera_test_layout.addWidget(camera_view_label)
+            camera_test_layout.addWidget(self.image_labels[1])
+            camera_test_layout.addWidget(self.image_labels[5])
             main_layout.addLayout(camera_test_layout)
+        # 性能统计叠加显示
+        self.stats_label = None
+        if self.config.metrics_overlay:
+            self.stats_label = QLabel(self)
+            self.stats_label.setFont(QFont('monospace', 8))
+            self.stats_label.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
+            self.stats_label.setFixedWidth(420)
+            main_layout.addWidget(self.stats_label)
         # 设置主窗口的中心部件
         central_widget = QWidget()
         central_widget.setLayout(main_layout)
@@ -67,24 +135,57 @@ class MainWindow(QMainWindow):
         central_widget.setStyleSheet("background-color: #FFFFFF;")
         self.setCentralWidget(central_widget)
 
-    def update_images_from_queue(self) -> None:
-        '''从队列更新图像到QLabel'''
-        for i in range(len(self.image_labels)):
-            try: 
-                frame = self.image_generator.image_queues[i].get_nowait()
-                # to QPixmap
-                height, width, channel = frame.shape
-                bytes_per_line = 3*width
-                qimage = QImage(frame.data.tobytes(), width, height, bytes_per_line, QImage.Format.Format_RGB888)
-                # qimage = qimage.rgbSwapped() # BGR -> RGB
-                pixmap = QPixmap.fromImage(qimage)
-                if not pixmap.isNull():
-                    self.image_labels[i].setPixmap(pixmap.scaled(self.image_labels[i].size(),Qt.AspectRatioMode.KeepAspectRatio))
-            except queue.Empty:
-                # 空队列则跳过读取
-                pass
-            
+    def _on_frame_ready(self,view:int) -> None:
+        '''记录有新图像的视图，并在距离上次刷新满一个界面帧间隔时安排刷新'''
+        self._pending_views.add(view)
+        if self.flush_timer.isActive():
+            return
+        wait = self._last_flush + 1.0/self.config.ui_fps - time.monotonic()
+        self.flush_timer.start(max(0, int(wait*1000)))
+
+    def update_images_from_slots(self) -> None:
+        '''只刷新有新图像的视图，图像已是控件尺寸，这里不复制也不缩放'''
+        self._last_flush = time.monotonic()
+        views, self._pending_views = self._pending_views, set()
+        for i in views:
+            if i >= len(self.image_labels):
+                continue
+            item = self.image_generator.image_slots[i].take()
+            if item is not None:
+                self.image_labels[i].set_frame(*item)
+
+    def update_stats_overlay(self) -> None:
+        '''刷新性能统计文本'''
+        texts = [self.image_generator.metrics.format_summary(),
+                 self.image_generator.latency.format_summary(),
+                 self.image_generator.scheduler.format_rates()]
+        if self.image_generator.camera is not None:
+            pool = self.image_generator.camera.frame_pool.stats()
+            texts.append(f'alloc/frame {pool["allocs_per_frame"]:.2f}  bytes/frame {pool["bytes_per_frame"]:.0f}')
+            if hasattr(self.image_generator.camera,'format_status'):    # 多相机
+                texts.append(self.image_generator.camera.format_status())
+        if self.image_generator.renderer is not None:
+            texts.append(self.image_generator.renderer.format_readout())
+            if self.image_generator.renderer.profiler is not None:
+                texts.append(self.image_generator.renderer.profiler.format_summary())
+        recorder = self.image_generator.recorder
+        if recorder is not None:
+            texts.append(recorder.format_status())
+        self.stats_label.setText('\n\n'.join(texts))
+
+    def keyPressEvent(self, event) -> None:
+        '''R 键开始/停止录像'''
+        if event.key() == Qt.Key.Key_R and not event.isAutoRepeat():
+            if self.image_generator.recorder is None:
+                self.image_generator.start_recording()
+            else:
+                self.image_generator.stop_recording()
+            return
+        super().keyPressEvent(event)
+
     def closeEvent(self, event):
+        if startup_profiler.enabled and not startup_profiler.has_mark('all_views_ready'):
+            print(startup_profiler.report())   # 还没等到所有视图出图就关闭了
         self.image_generator.stop_generating()
         #event.accept()
         super().closeEvent(event)
@@ -0,0 +1,276 @@
+'''
+轻量级性能统计：按阶段计时(perf_counter_ns)、滚动窗口分位数(p50/p95/p99)、导出CSV/JSON。关闭时几乎没有开销
+另外提供帧时间戳(FrameStamp)、端到端延迟统计(LatencyTracker)和启动阶段计时(startup_profiler)
+'''
+
+import collections
+import csv
+import json
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+class FrameStamp(NamedTuple):
+    '''采集时打上的帧标记，随图像一起传到界面'''
+    seq: int            # 采集序号
+    t_capture_ns: int   # 采集完成时的 perf_counter_ns
+
+
+class _NullStage:
+    '''关闭统计时使用的空上下文，避免每次分配对象'''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    '''单个阶段的计时上下文'''
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics: 'StageMetrics', name: str):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.metrics.record(self.name, time.perf_counter_ns() - self.start)
+
+
+class StageMetrics:
+    def __init__(self, enabled: bool = True, window: int = 1000, export_path: Optional[str] = None, export_interval: float = 0.0):
+        self.enabled = enabled
+        self.window = window                    # 每个阶段保留最近的样本数
+        self.export_path = export_path
+        self.export_interval = export_interval  # 秒，<=0 表示只在退出时导出
+        self._samples: Dict[str, collections.deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._last_export = time.monotonic()
+
+    def stage(self, name: str):
+        '''用法: with metrics.stage('detect'): ...'''
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name: str, elapsed_ns: int) -> None:
+        '''记录一次耗时（纳秒）'''
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = collections.deque(maxlen=self.window)
+                self._counts[name] = 0
+            samples.append(elapsed_ns)
+            self._counts[name] += 1
+
+    def summary(self) -> Dict[str, dict]:
+        '''各阶段的统计结果，单位毫秒'''
+        with self._lock:
+            snapshot = {name: (np.fromiter(samples, dtype=np.int64), self._counts[name]) for name, samples in self._samples.items()}
+        result = {}
+        for name, (samples, count) in snapshot.items():
+            if len(samples) == 0:
+                continue
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) / 1e6
+            result[name] = {
+                'count': count,
+                'mean_ms': float(samples.mean() / 1e6),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': float(samples.max() / 1e6),
+            }
+        return result
+
+    def format_summary(self) -> str:
+        '''用于界面叠加显示的简短文本'''
+        lines = [f'{name:<14}p50 {s["p50_ms"]:6.2f}  p95 {s["p95_ms"]:6.2f}  p99 {s["p99_ms"]:6.2f} ms'
+                 for name, s in self.summary().items()]
+        return '\n'.join(lines)
+
+    def export(self, path: Optional[str] = None) -> None:
+        '''按文件后缀导出为CSV或JSON'''
+        path = path or self.export_path
+        if not self.enabled or not path:
+            return
+        summary = self.summary()
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        try:
+            if path.endswith('.csv'):
+                columns = []
+                for s in summary.values():
+                    columns += [key for key in s if key not in columns]
+                with open(path, 'w', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(['stage'] + columns)
+                    for name, s in summary.items():
+                        writer.writerow([name] + [s.get(key, '') for key in columns])
+            else:
+                with open(path, 'w') as f:
+                    json.dump(summary, f, indent=4)
+        except OSError as e:
+            print(f"性能数据导出失败: {e}")
+
+    def maybe_export(self) -> None:
+        '''在主循环中调用，按设定的间隔周期性导出'''
+        if not self.enabled or self.export_interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last_export >= self.export_interval:
+            self._last_export = now
+            self.export()
+
+
+class LatencyTracker(StageMetrics):
+    '''
+    端到端延迟统计：采集 -> 放入输出(output/<view>) 以及 采集 -> 界面显示(display/<view>)
+    同时统计每个视图产生/显示/丢弃的帧数，以及采集后从未在任何视图显示过的帧数
+    '''
+    def __init__(self, view_names: Sequence[str], enabled: bool = True, window: int = 1000, export_path: Optional[str] = None, export_interval: float = 0.0):
+        super().__init__(enabled, window, export_path, export_interval)
+        self.view_names = list(view_names)
+        self.captured = 0
+        self.produced = [0] * len(self.view_names)
+        self.shown = [0] * len(self.view_names)
+        self._shown_seqs = set()    # 已显示过的帧序号(定期裁剪)
+        self._unique_shown = 0
+        self._max_seq = 0
+
+    def on_capture(self, stamp: FrameStamp) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.captured += 1
+            self._max_seq = max(self._max_seq, stamp.seq)
+
+    def on_output(self, view: int, stamp: FrameStamp) -> None:
+        '''视图图像生成完毕、交给界面之前调用'''
+        if not self.enabled:
+            return
+        self.record(f'output/{self.view_names[view]}', time.perf_counter_ns() - stamp.t_capture_ns)
+        with self._lock:
+            self.produced[view] += 1
+
+    def on_display(self, view: int, stamp: FrameStamp) -> None:
+        '''界面线程把图像设置到控件上时调用'''
+        if not self.enabled:
+            return
+        self.record(f'display/{self.view_names[view]}', time.perf_counter_ns() - stamp.t_capture_ns)
+        with self._lock:
+            self.shown[view] += 1
+            if stamp.seq not in self._shown_seqs:
+                self._shown_seqs.add(stamp.seq)
+                self._unique_shown += 1
+            # 太旧的帧不会再被显示，裁剪集合避免无限增长
+            if len(self._shown_seqs) > 4 * self.window:
+                oldest = self._max_seq - self.window
+                self._shown_seqs = {seq for seq in self._shown_seqs if seq >= oldest}
+
+    def summary(self) -> Dict[str, dict]:
+        result = super().summary()
+        with self._lock:
+            for i, name in enumerate(self.view_names):
+                key = f'display/{name}'
+                entry = result.setdefault(key, {})
+                entry['produced'] = self.produced[i]
+                entry['shown'] = self.shown[i]
+                entry['dropped'] = self.produced[i] - self.shown[i]
+            result['frames'] = {'captured': self.captured,
+                                'never_shown': self.captured - self._unique_shown}
+        return result
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f'{name:<16}p50 {s["p50_ms"]:6.2f}  p95 {s["p95_ms"]:6.2f}  p99 {s["p99_ms"]:6.2f} ms  drop {s["dropped"]}'
+                 for name, s in summary.items() if name.startswith('display/') and 'p50_ms' in s]
+        frames = summary['frames']
+        lines.append(f'captured {frames["captured"]}  never shown {frames["never_shown"]}')
+        return '\n'.join(lines)
+
+
+class _Phase:
+    '''启动阶段的计时上下文'''
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: 'StartupProfiler', name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.profiler._add(self.name, self.start, time.perf_counter_ns())
+
+
+class StartupProfiler:
+    '''
+    启动计时：记录各阶段(导入、加载模型、打开相机等)所在线程、开始时间和耗时，以及首帧等时间点
+    时间都相对进程入口(main.py 最开始)计算，默认关闭
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.t0 = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._phases = []   # (名称, 线程, 开始ns, 结束ns)
+        self._marks = {}    # 名称 -> 时间ns
+
+    def enable(self, t0: Optional[int] = None) -> None:
+        self.enabled = True
+        if t0 is not None:
+            self.t0 = t0
+
+    def phase(self, name: str):
+        '''用法: with startup_profiler.phase('load_meshes'): ...'''
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Phase(self, name)
+
+    def _add(self, name: str, start: int, end: int) -> None:
+        with self._lock:
+            self._phases.append((name, threading.current_thread().name, start, end))
+
+    def mark(self, name: str) -> None:
+        '''记录一个时间点，同名只记录第一次'''
+        if not self.enabled:
+            return
+        with self._lock:
+            self._marks.setdefault(name, time.perf_counter_ns())
+
+    def has_mark(self, name: str) -> bool:
+        return name in self._marks
+
+    def report(self) -> str:
+        '''按开始时间排序的阶段表和时间点，单位毫秒'''
+        with self._lock:
+            phases = sorted(self._phases, key=lambda p: p[2])
+            marks = sorted(self._marks.items(), key=lambda m: m[1])
+        lines = ['启动阶段            线程              开始(ms)   耗时(ms)']
+        for name, thread, start, end in phases:
+            lines.append(f'{name:<20}{thread:<18}{(start - self.t0) / 1e6:9.1f}  {(end - start) / 1e6:9.1f}')
+        for name, t in marks:
+            lines.append(f'@ {name:<36}{(t - self.t0) / 1e6:9.1f}')
+        return '\n'.join(lines)
+
+
+# 全局启动计时器，由 main.py 根据命令行参数开启
+startup_profiler = StartupProfiler()
@@ -0,0 +1,270 @@
+'''
+多相机位姿采集：每个相机（设备或录像文件）一个工作线程，各自采集、检测棋盘格、求解PnP，
+主循环把各相机的结果按重投影误差加权融合为一个位姿。接口与 Camera 相同，ImageGenerator 不需要区分单相机和多相机。
+OpenCV 的检测、亚像素和PnP在计算时释放GIL，多个相机的工作线程可以同时占用多个核
+
+不接相机时可以用录像文件代替，检查融合结果（合成两个相机的录像，比较融合位姿与单相机位姿）：
+    cd benchmarks && python check_multi_camera.py
+'''
+
+import queue
+import threading
+from typing import List, NamedTuple, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+from camera import Camera, CapturedFrame, pose_matrices, reprojection_error
+from config import Config
+from metrics import StageMetrics
+
+
+class CameraObservation(NamedTuple):
+    '''单个相机一帧的检测结果'''
+    camera: int                     # 相机下标，与 config.camera_sources 一致
+    t_capture_ns: int               # 采集时刻
+    rvec: Optional[np.ndarray]      # 标定板 -> 该相机，未检测到时为 None
+    tvec: Optional[np.ndarray]
+    error: float                    # 重投影误差(像素)，未检测到时为 inf
+    corners: Optional[np.ndarray]   # 检测到的角点
+    obj_points: Optional[np.ndarray] = None     # 与 corners 对应的标定板点，以及求解时的内参
+    mtx: Optional[np.ndarray] = None
+
+
+class _PrefixedMetrics:
+    '''给每个相机的阶段名加上相机前缀，多个工作线程写入同一个 StageMetrics'''
+    def __init__(self,metrics:StageMetrics,prefix:str):
+        self.metrics = metrics
+        self.prefix = prefix
+
+    def stage(self,name:str):
+        return self.metrics.stage(f'{self.prefix}/{name}')
+
+
+def fuse_poses(observations:List[CameraObservation],extrinsics:np.ndarray) -> Tuple[np.ndarray,np.ndarray]:
+    '''
+    把各相机的 标定板->相机 位姿经外参变换到参考相机坐标系，按 1/误差^2 加权平均，返回参考相机下的 (rvec, tvec)
+    平移取加权平均；旋转取加权平均矩阵在 SO(3) 上的最近旋转 (SVD)，各相机结果接近时与四元数平均一致
+    '''
+    rotations, translations, weights = [], [], []
+    for obs in observations:
+        R, _ = cv2.Rodrigues(obs.rvec)
+        E = extrinsics[obs.camera]
+        rotations.append(E[:3,:3] @ R)
+        translations.append(E[:3,:3] @ obs.tvec.reshape(3) + E[:3,3])
+        weights.append(1.0 / max(obs.error, 0.05)**2)   # 误差极小时不让单个相机独占权重
+    weights = np.array(weights) / np.sum(weights)
+    U, _, Vt = np.linalg.svd(np.einsum('i,ijk->jk',weights,np.array(rotations)))
+    R = U @ np.diag([1.0, 1.0, np.linalg.det(U @ Vt)]) @ Vt
+    t = weights @ np.array(translations)
+    rvec, _ = cv2.Rodrigues(R)
+    return rvec, t.reshape(3,1)
+
+
+class _CameraWorker:
+    '''
+    单个相机的采集+检测线程。参考相机和录像文件的结果放入容量为1的队列，队列满时等待取走（主循环按该相机的帧率运行，
+    录像文件之间保持逐帧同步）；其他实时相机只保留最新结果，不能阻塞读取，否则驱动中会积压旧帧。
+    相机的配置变化（内参、标定板）由本线程在两帧之间应用，一帧的检测和PnP始终使用同一份参数
+    '''
+    def __init__(self,index:int,camera:Camera,blocking:bool):
+        self.index = index
+        self.camera = camera
+        self.blocking = blocking
+        self.results: 'queue.Queue' = queue.Queue(maxsize=1)
+        self.latest: Optional[CameraObservation] = None
+        self.error: Optional[BaseException] = None
+        self.running = True
+        self._config_changes: Set[str] = set()
+        self._config_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run,name=f'camera-{index}',daemon=True)
+
+    def request_config_changes(self,changed:Set[str]) -> None:
+        '''记下配置变化，由工作线程在下一帧检测之前应用'''
+        with self._config_lock:
+            self._config_changes |= changed
+
+    def _apply_config_changes(self) -> None:
+        with self._config_lock:
+            changed, self._config_changes = self._config_changes, set()
+        if changed:
+            self.camera.apply_config_changes(changed)
+
+    def _observe(self,frame:CapturedFrame) -> CameraObservation:
+        camera = self.camera
+        obj_points, mtx = camera.obj_points, camera.mtx
+        missed = CameraObservation(self.index,frame.stamp.t_capture_ns,None,None,float('inf'),None)
+        ret, corners = camera.detect_chessboard(frame)
+        if not ret:
+            return missed
+        if len(corners) != len(obj_points):
+            return missed   # 角点与标定板点数量不一致（不应出现），跳过这一帧而不是结束线程
+        try:
+            rvec, tvec = camera.solve_pnp(corners)
+        except (ValueError, cv2.error):
+            return missed
+        error = reprojection_error(obj_points,corners,rvec,tvec,mtx,camera.dist)
+        return CameraObservation(self.index,frame.stamp.t_capture_ns,rvec,tvec,error,corners,obj_points,mtx)
+
+    def _run(self) -> None:
+        try:
+            while self.running:
+                frame = self.camera.capture_frame()
+                self._apply_config_changes()
+                item = (frame,self._observe(frame))
+                if self.blocking:
+                    while self.running:
+                        try:
+                            self.results.put(item,timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                else:
+                    self.latest = item[1]   # 只保留检测结果，不持有池中的帧
+        except Exception as e:
+            self.error = e
+            print(f"相机 {self.camera.source} 停止: {type(e).__name__}: {e}")
+            if self.blocking:
+                self.results.put((None,None))
+
+    def take(self) -> Tuple[Optional[CapturedFrame],Optional[CameraObservation]]:
+        '''取下一帧结果（阻塞模式）；工作线程出错后返回 (None, None)'''
+        while True:
+            try:
+                return self.results.get(timeout=0.5)
+            except queue.Empty:
+                if self.error is not None or not self.thread.is_alive():
+                    return None, None
+
+
+class MultiCamera:
+    '''
+    多个相机的组合，提供与 Camera 相同的 capture_frame / detect_chessboard / solve_pose 接口。
+    capture_frame 返回参考相机的帧，同时收集该时刻各相机的检测结果；detect_chessboard 只是取出这些结果，
+    solve_pose 按重投影误差加权融合。任一相机看到标定板即可得到位姿
+    '''
+    # 阻塞模式下每个相机同时在用的帧：主循环处理中、队列中等待、工作线程正在采集，缓冲池至少要多一个槽位
+    FRAMES_IN_FLIGHT = 3
+
+    def __init__(self,config:Config,metrics:Optional[StageMetrics]=None):
+        self.config = config
+        self.metrics = metrics if metrics is not None else StageMetrics(enabled=False)
+        sources = list(config.camera_sources)
+        if len(config.camera_extrinsics) != len(sources):
+            raise ValueError(f"camera_extrinsics 有 {len(config.camera_extrinsics)} 个，camera_sources 有 {len(sources)} 个")
+        pool_size = max(config.frame_pool_size,self.FRAMES_IN_FLIGHT + 1)
+        self.cameras = [Camera(config,_PrefixedMetrics(self.metrics,f'cam{i}'),source,pool_size)
+                        for i,source in enumerate(sources)]
+        # 全部为录像文件时逐帧同步（测试、回放结果可重复）；实时相机各自按硬件帧率运行，按采集时间配对
+        self.lockstep = all(camera.is_file for camera in self.cameras)
+        self.workers = [_CameraWorker(i,camera,blocking=(i == 0 or self.lockstep)) for i,camera in enumerate(self.cameras)]
+        for worker in self.workers:
+            worker.thread.start()
+        self.primary = self.cameras[0]
+        self.frame_pool = self.primary.frame_pool
+        self.rvec = self.tvec = None    # 最近一次融合结果，参考相机 OpenCV 坐标系
+        self.last_observations: List[CameraObservation] = []
+        self._fused_count = 0
+        self._observations: List[CameraObservation] = []
+
+    @property
+    def mtx(self) -> np.ndarray:
+        return self.primary.mtx
+
+    @property
+    def dist(self) -> np.ndarray:
+        return self.primary.dist
+
+    def apply_config_changes(self,changed:Set[str]) -> None:
+        '''各相机的内参、标定板点交给各自的工作线程在两帧之间更新；外参每次融合时直接读取 config'''
+        for worker in self.workers:
+            worker.request_config_changes(changed)
+
+    def capture_frame(self) -> CapturedFrame:
+        '''等待参考相机的下一帧，并收集其他相机与之同步的检测结果'''
+        with self.metrics.stage('capture_wait'):
+            frame, observation = self.workers[0].take()
+            if frame is None:
+                raise ValueError("Frame capture failed")
+            observations = [observation]
+            for worker in self.workers[1:]:
+                if worker.blocking:
+                    _, other = worker.take()
+                else:
+                    other = worker.latest
+                    if other is not None and abs(other.t_capture_ns - observation.t_capture_ns) > self.config.camera_sync_tolerance * 1e9:
+                        other = None    # 太旧或太新，不是同一时刻的位姿
+                if other is not None:
+                    observations.append(other)
+        self._observations = observations
+        return frame
+
+    def detect_chessboard(self,frame:CapturedFrame) -> Tuple[bool,List[CameraObservation]]:
+        '''返回 capture_frame 时收集到的、误差在阈值内的检测结果；没有任何相机看到标定板时为 (False, [])'''
+        self.last_observations = self._observations
+        valid = [obs for obs in self._observations
+                 if obs.rvec is not None and obs.error <= self.config.camera_max_reproj_error]
+        self._fused_count = len(valid)
+        if not valid:
+            self.rvec = self.tvec = None
+        return len(valid) > 0, valid
+
+    def solve_pose(self,observations:List[CameraObservation]) -> Tuple[np.ndarray,np.ndarray]:
+        '''融合各相机的结果，返回参考相机下用于pyrender和位姿计算的两个矩阵'''
+        with self.metrics.stage('pose_fusion'):
+            extrinsics = np.asarray(self.config.camera_extrinsics,dtype=np.float64)
+            rvec, tvec = fuse_poses(observations,extrinsics)
+            # 参考相机的外参通常是单位阵，不是时换算到参考相机自身的坐标系
+            if not np.allclose(extrinsics[0],np.eye(4)):
+                T = np.eye(4)
+                T[:3,:3], _ = cv2.Rodrigues(rvec)
+                T[:3,3] = tvec.reshape(3)
+                T = np.linalg.inv(extrinsics[0]) @ T
+                rvec, _ = cv2.Rodrigues(T[:3,:3])
+                tvec = T[:3,3].reshape(3,1)
+        self.rvec, self.tvec = rvec, tvec
+        return pose_matrices(rvec,tvec)
+
+    def last_result(self) -> Tuple[Optional[np.ndarray],Optional[np.ndarray],Optional[np.ndarray],float,int]:
+        '''
+        最近一帧的结果，供会话日志：(参考相机的角点, 融合后的 rvec/tvec, 重投影误差, 参与融合的相机数)
+        参考相机看到标定板时误差为融合位姿在参考相机上的重投影误差，否则为参与融合的相机中的最小误差
+        '''
+        if self._fused_count == 0 or self.rvec is None:
+            return None, None, None, float('nan'), 0
+        reference = next((obs for obs in self.last_observations if obs.camera == 0 and obs.corners is not None), None)
+        if reference is not None:
+            error = reprojection_error(reference.obj_points,reference.corners,self.rvec,self.tvec,reference.mtx,
+                                       self.primary.dist)
+            return reference.corners, self.rvec, self.tvec, error, self._fused_count
+        error = min(obs.error for obs in self.last_observations if obs.rvec is not None)
+        return None, self.rvec, self.tvec, error, self._fused_count
+
+    def draw_chessboard_overlay(self,frame:np.ndarray) -> None:
+        '''在参考相机画面上绘制融合后的标定板'''
+        self.primary.draw_chessboard_overlay(frame,self.rvec,self.tvec)
+
+    def format_status(self) -> str:
+        '''各相机最近一帧的检测情况，供界面叠加显示'''
+        seen = {obs.camera: obs for obs in self.last_observations}
+        lines = []
+        for i,camera in enumerate(self.cameras):
+            obs = seen.get(i)
+            if self.workers[i].error is not None:
+                state = 'stopped'
+            elif obs is None:
+                state = 'no sync'
+            elif obs.rvec is None:
+                state = 'no board'
+            else:
+                state = f'err {obs.error:.2f}px'
+            lines.append(f'cam{i} {state}')
+        return '  '.join(lines)
+
+    def release(self) -> None:
+        for worker in self.workers:
+            worker.running = False
+        for worker in self.workers:
+            worker.thread.join(timeout=1.0)
+        for camera in self.cameras:
+            camera.release()
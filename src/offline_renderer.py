@@ -0,0 +1,201 @@
+'''
+离线批量渲染：按记录的位姿序列重新渲染整段的牙齿视图、相机视图和三个轴视图，用于病例回顾
+位姿按块分给多个工作进程，每个进程有自己的无界面GL上下文(EGL/OSMesa)、PyrenderRenderer 和 AxisViewGenerator；
+主进程按帧序写出图像序列或视频，同时在途的块数有上限，内存占用不随序列长度增长
+
+用法（在 src 目录下运行）：
+    python offline_renderer.py poses.npy --output ../temp/review --workers 4 --video
+poses.npy 为 (N,4,4) 的 pose_pyrender 序列，或 (N,2,4,4) 的 (pose_pyrender, camera_pose) 序列；
+也可以直接给会话日志 session_*.poselog（见 session_log.py），使用其中检测成功的帧
+'''
+
+import argparse
+import collections
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence
+
+import cv2
+import numpy as np
+
+VIEWS = ('tooth', 'camera', 'front', 'top', 'side')
+AXIS_VIEWS = ('front', 'top', 'side')
+
+# 工作进程内的渲染器，由 _init_worker 创建
+_worker = {}
+
+
+def camera_pose_from_pyrender(pose_pyrender: np.ndarray) -> np.ndarray:
+    '''由 pose_pyrender 还原 camera_pose（两者的关系见 camera.pose_matrices），轴视图使用后者'''
+    P = np.diag([1.0, -1.0, -1.0])
+    camera_pose = np.eye(4)
+    camera_pose[:3, :3] = pose_pyrender[:3, :3].T @ P
+    camera_pose[:3, 3] = pose_pyrender[:3, 3]
+    return camera_pose
+
+
+def _as_pose_pairs(poses: np.ndarray) -> np.ndarray:
+    '''统一为 (N,2,4,4) 的 (pose_pyrender, camera_pose)'''
+    poses = np.asarray(poses, dtype=np.float64)
+    if len(poses) == 0:
+        raise ValueError("位姿序列为空，没有可渲染的帧")
+    if poses.ndim == 3 and poses.shape[1:] == (4, 4):
+        return np.stack([poses, np.array([camera_pose_from_pyrender(p) for p in poses])], axis=1)
+    if poses.ndim == 4 and poses.shape[1:] == (2, 4, 4):
+        return poses
+    raise ValueError(f"位姿数组的形状应为 (N,4,4) 或 (N,2,4,4)，实际为 {poses.shape}")
+
+
+def _init_worker(views: Sequence[str], config_path: Optional[str], gl_platform: str) -> None:
+    '''在工作进程中创建GL上下文和渲染器；PYOPENGL_PLATFORM 必须在导入 pyrender 之前设置'''
+    os.environ.setdefault('PYOPENGL_PLATFORM', gl_platform)
+    from config import Config
+    config = Config(camera_test=False)
+    if config_path is not None:
+        config.config_path = config_path
+        config.load_from_file()
+    _worker['views'] = tuple(views)
+    _worker['renderer'] = None
+    _worker['axis'] = None
+    if {'tooth', 'camera'} & set(views):
+        from renderer import PyrenderRenderer
+        _worker['renderer'] = PyrenderRenderer(config)
+    if set(AXIS_VIEWS) & set(views):
+        from axis_view_generator import AxisViewGenerator
+        _worker['axis'] = AxisViewGenerator(config)
+
+
+def _render_chunk(poses: np.ndarray, encode: Optional[str]) -> Dict[str, list]:
+    '''
+    渲染一块位姿的所有视图，返回 {视图: [每帧图像]}；encode 为 '.png' 等后缀时在工作进程中编码，
+    返回编码后的字节，减少进程间传输的数据量，编码也随进程数并行
+    '''
+    renderer, axis = _worker['renderer'], _worker['axis']
+    result = {view: [] for view in _worker['views']}
+    for pose_pyrender, camera_pose in poses:
+        for view in _worker['views']:
+            if view == 'tooth':
+                img = renderer.render_tooth(pose_pyrender)
+            elif view == 'camera':
+                img = renderer.render_camera(pose_pyrender)
+            else:
+                # 轴视图返回的是画布缓冲区的视图，下一次绘制会覆盖
+                img = np.ascontiguousarray(axis.create_axis_view(camera_pose, view))
+            bgr = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+            if encode is not None:
+                ok, data = cv2.imencode(encode, bgr)
+                if not ok:
+                    raise ValueError(f"图像编码失败: {view}")
+                bgr = data.tobytes()
+            result[view].append(bgr)
+    return result
+
+
+class _SequenceWriter:
+    '''按帧序写出一个视图：图像序列 <output>/<view>/000000.png，或视频 <output>/<view>.mp4'''
+    def __init__(self, output: str, view: str, video: bool, fps: float, ext: str):
+        self.video = video
+        self.count = 0
+        self.writer = None
+        self.fps = fps
+        self.ext = ext
+        if video:
+            self.path = os.path.join(output, f'{view}.mp4')
+        else:
+            self.path = os.path.join(output, view)
+            os.makedirs(self.path, exist_ok=True)
+
+    def write(self, item) -> None:
+        if self.video:
+            if self.writer is None:
+                height, width = item.shape[:2]
+                self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (width, height))
+            self.writer.write(item)
+        else:
+            with open(os.path.join(self.path, f'{self.count:06d}{self.ext}'), 'wb') as f:
+                f.write(item)
+        self.count += 1
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.release()
+
+
+def render_trajectory(poses: np.ndarray, output: str, views: Sequence[str] = VIEWS, workers: Optional[int] = None,
+                      chunk_size: int = 8, video: bool = False, fps: float = 30.0, image_ext: str = '.png',
+                      config_path: Optional[str] = None, gl_platform: str = 'egl') -> Dict[str, str]:
+    '''
+    按位姿序列离线渲染各视图，返回 {视图: 输出路径}
+    poses: (N,4,4) 的 pose_pyrender 或 (N,2,4,4) 的 (pose_pyrender, camera_pose)
+    workers: 工作进程数，默认为 CPU 核数；每个进程都有完整的渲染器和模型，内存按进程数增长
+    video: True 时每个视图写一个 mp4，否则写图像序列（在工作进程中编码）
+    config_path: 对齐参数文件（deploy_config.json），默认使用当前目录下的
+    gl_platform: 无界面GL后端，'egl'（有GPU驱动时）或 'osmesa'（纯CPU）
+    '''
+    unknown = set(views) - set(VIEWS)
+    if unknown:
+        raise ValueError(f"未知视图: {sorted(unknown)}")
+    pairs = _as_pose_pairs(poses)   # 在启动工作进程之前检查
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output, exist_ok=True)
+    writers = {view: _SequenceWriter(output, view, video, fps, image_ext) for view in views}
+    encode = None if video else image_ext
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    start = time.perf_counter()
+    # spawn: 子进程不继承父进程可能已有的GL状态
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                             initializer=_init_worker, initargs=(tuple(views), config_path, gl_platform)) as pool:
+        # 按提交顺序等待最早的块，结果自然有序；在途的块数限制为进程数的两倍，慢块不会让后面的结果无限堆积
+        pending = collections.deque()
+        next_chunk = 0
+        done = 0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < 2 * workers:
+                pending.append(pool.submit(_render_chunk, chunks[next_chunk], encode))
+                next_chunk += 1
+            result = pending.popleft().result()
+            for view, items in result.items():
+                for item in items:
+                    writers[view].write(item)
+            done += len(next(iter(result.values())))
+            elapsed = time.perf_counter() - start
+            print(f"\r{done}/{len(pairs)} frames, {done / elapsed:.1f} fps", end='', flush=True)
+    print()
+    for writer in writers.values():
+        writer.close()
+    return {view: writer.path for view, writer in writers.items()}
+
+
+def load_poses(path: str) -> np.ndarray:
+    '''读取 .npy 位姿序列或会话日志中的位姿'''
+    from session_log import LOG_EXTENSION, load_session, session_poses
+    if path.endswith(LOG_EXTENSION):
+        poses = session_poses(load_session(path))
+        if len(poses) == 0:
+            raise ValueError(f"{path} 中没有检测到位姿的帧")
+        return poses
+    return np.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按位姿序列离线渲染各视图")
+    parser.add_argument('poses', help="(N,4,4) 或 (N,2,4,4) 的 .npy 位姿序列，或 .poselog 会话日志")
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--views', nargs='+', default=list(VIEWS), choices=VIEWS)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=8)
+    parser.add_argument('--video', action='store_true', help="每个视图写一个 mp4，默认写 PNG 序列")
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--config', default=None, help="对齐参数文件，默认 deploy_config.json")
+    parser.add_argument('--gl-platform', default='egl', choices=('egl', 'osmesa'))
+    args = parser.parse_args()
+    paths = render_trajectory(load_poses(args.poses), args.output, args.views, args.workers, args.chunk_size,
+                              args.video, args.fps, config_path=args.config, gl_platform=args.gl_platform)
+    for view, path in paths.items():
+        print(f"{view}: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+'''
+录像：把输出视图（牙齿视图、混合相机视图等）写成视频文件，编码全部在后台线程中完成。
+渲染线程只把输出槽中的图像按引用放入每路的有界队列（放入输出槽后的图像不会再被修改），队列满时丢弃最旧的一帧，
+编码再慢也不会拖慢渲染帧率。每路一个编码线程，OpenCV 编码时释放GIL，多路可以同时占用多个核。
+
+视图写成固定帧率的视频（帧率取该视图的目标帧率），未更新的间隔重复上一帧，回放时各视图都与采集时间对齐。
+相机的原始 MJPEG 数据（Camera 的原始采集模式）直接拼接写入 camera_raw.mjpeg，不解码也不重新编码，
+每帧的序号和采集时间写在同名 .csv 中，可以与会话日志对应。转成常见格式：
+    ffmpeg -f mjpeg -framerate 30 -i camera_raw.mjpeg -c copy camera_raw.avi
+'''
+
+import collections
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from config import Config
+from metrics import FrameStamp, StageMetrics
+
+
+class StreamStats(NamedTuple):
+    '''一路录像的状态'''
+    name: str
+    written: int        # 已写出的帧数（不含重复的补帧）
+    dropped: int        # 队列满时丢弃的帧数
+    queued: int         # 等待编码的帧数
+    lag_ms: float       # 最近写出的一帧从采集到写完的时间
+    max_lag_ms: float
+
+
+class _EncoderStream(ABC):
+    '''一路录像：有界队列 + 编码线程，子类实现 _write，需要时覆盖 _idle/_finish'''
+    idle_timeout = 0.5      # 没有新帧时每隔这么久调用一次 _idle
+
+    def __init__(self,name:str,queue_size:int,metrics:StageMetrics):
+        self.name = name
+        self.metrics = metrics
+        self.written = 0
+        self.dropped = 0
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.error: Optional[BaseException] = None
+        self._queue = collections.deque(maxlen=queue_size)
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run,name=f'recorder-{name}',daemon=True)
+        self._thread.start()
+
+    def submit(self,data:np.ndarray,stamp:FrameStamp) -> None:
+        '''放入一帧，不等待；队列满时 deque 自动挤掉最旧的一帧'''
+        with self._cond:
+            if self._closing:
+                return
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append((data,stamp))
+            self._cond.notify()
+
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def _run(self) -> None:
+        try:
+            while True:
+                with self._cond:
+                    if not self._queue and not self._closing:
+                        self._cond.wait(self.idle_timeout)
+                    if not self._queue:
+                        if self._closing:
+                            break
+                        item = None
+                    else:
+                        item = self._queue.popleft()
+                if item is None:
+                    self._idle()
+                    continue
+                data, stamp = item
+                start = time.perf_counter_ns()
+                self._write(data,stamp)
+                end = time.perf_counter_ns()
+                self.metrics.record(f'rec/{self.name}',end - start)
+                self.written += 1
+                self.lag_ms = (end - stamp.t_capture_ns) / 1e6
+                self.max_lag_ms = max(self.max_lag_ms,self.lag_ms)
+        except Exception as e:
+            self.error = e
+            print(f"录像 {self.name} 停止: {type(e).__name__}: {e}")
+            with self._cond:
+                self._closing = True
+                self._queue.clear()
+        finally:
+            self._finish()
+
+    @abstractmethod
+    def _write(self,data:np.ndarray,stamp:FrameStamp) -> None:
+        pass
+
+    def _idle(self) -> None:
+        pass
+
+    def _finish(self) -> None:
+        pass
+
+    def close(self) -> None:
+        '''写完队列中剩余的帧后关闭文件'''
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+
+    def stats(self) -> StreamStats:
+        return StreamStats(self.name,self.written,self.dropped,self.queued(),self.lag_ms,self.max_lag_ms)
+
+
+class _VideoStream(_EncoderStream):
+    '''
+    把一个视图的RGB图像编码为固定帧率的视频。第 i 帧对应采集时间 t0 + i/fps，
+    新图像之前的空档重复上一帧；长时间没有新图像（如标定板离开画面）时在空闲时补帧，不会在恢复时集中编码
+    '''
+    idle_slack_ns = 200_000_000     # 空闲补帧只补到 0.2 秒之前，还在渲染或排队的图像仍能按采集时间写入
+
+    def __init__(self,name:str,path:str,fps:float,fourcc:str,queue_size:int,metrics:StageMetrics):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self._writer = None
+        self._size = None
+        self._bgr = None        # 最近一帧(BGR)，补帧时重复写入
+        self._t0 = None
+        self._frames = 0        # 已写入视频的帧数（含补帧）
+        super().__init__(name,queue_size,metrics)
+
+    def _index(self,t_ns:int) -> int:
+        return int(round((t_ns - self._t0) * self.fps / 1e9))
+
+    def _fill_to(self,index:int) -> None:
+        while self._frames < index:
+            self._writer.write(self._bgr)
+            self._frames += 1
+
+    def _write(self,rgb:np.ndarray,stamp:FrameStamp) -> None:
+        if self._writer is None:
+            self._size = (rgb.shape[1],rgb.shape[0])
+            self._writer = cv2.VideoWriter(self.path,cv2.VideoWriter_fourcc(*self.fourcc),self.fps,self._size)
+            if not self._writer.isOpened():
+                raise ValueError(f"无法创建视频文件: {self.path} ({self.fourcc})")
+            self._t0 = stamp.t_capture_ns
+        index = self._index(stamp.t_capture_ns)
+        if self._bgr is not None:
+            self._fill_to(index)    # 上一帧一直显示到这一帧之前
+        if (rgb.shape[1],rgb.shape[0]) != self._size:
+            rgb = cv2.resize(rgb,self._size,interpolation=cv2.INTER_AREA)
+        self._bgr = cv2.cvtColor(rgb,cv2.COLOR_RGB2BGR,dst=self._bgr)
+        if index >= self._frames:
+            self._writer.write(self._bgr)
+            self._frames += 1
+        # 同一帧间隔内的第二张图像不单独占一帧，只作为之后补帧的内容
+
+    def _idle(self) -> None:
+        if self._writer is not None:
+            self._fill_to(self._index(time.perf_counter_ns() - self.idle_slack_ns))
+
+    def _finish(self) -> None:
+        if self._writer is not None:
+            self._writer.release()
+
+
+class _MJPEGStream(_EncoderStream):
+    '''相机原始 MJPEG 数据原样拼接写出，同名 .csv 记录每帧的序号、采集时间和字节数'''
+    def __init__(self,name:str,path:str,queue_size:int,metrics:StageMetrics):
+        self.path = path
+        self._file = open(path,'wb')
+        self._index_file = open(f"{os.path.splitext(path)[0]}.csv",'w',encoding='utf-8')
+        self._index_file.write('seq,t_capture_ns,bytes\n')
+        super().__init__(name,queue_size,metrics)
+
+    def _write(self,jpeg:np.ndarray,stamp:FrameStamp) -> None:
+        self._file.write(jpeg.data)
+        self._index_file.write(f'{stamp.seq},{stamp.t_capture_ns},{jpeg.nbytes}\n')
+
+    def _finish(self) -> None:
+        self._file.close()
+        self._index_file.close()
+
+
+class Recorder:
+    '''
+    一次录像：config.recording_views 中的每个视图一路视频，开启 recording_raw_camera 时再加一路相机原始流，
+    写在 recording_dir 下以开始时间命名的目录中。submit/submit_raw 在渲染线程调用，只做入队
+    '''
+    def __init__(self,config:Config,metrics:Optional[StageMetrics]=None,directory:Optional[str]=None):
+        self.config = config
+        metrics = metrics if metrics is not None else StageMetrics(enabled=False)
+        self.directory = directory or os.path.join(config.recording_dir,time.strftime('rec_%Y%m%d_%H%M%S'))
+        os.makedirs(self.directory,exist_ok=True)
+        self._views = {}
+        for name in config.recording_views:
+            fps = config.view_target_fps.get(name,0)
+            if fps <= 0:
+                fps = config.camera_fps     # 不限速的视图最多每帧更新一次
+            self._views[config.view_names.index(name)] = _VideoStream(
+                name,os.path.join(self.directory,f'{name}.mp4'),fps,config.recording_fourcc,
+                config.recording_queue_size,metrics)
+        self._raw = None
+        if config.recording_raw_camera:
+            self._raw = _MJPEGStream('camera_raw',os.path.join(self.directory,'camera_raw.mjpeg'),
+                                     config.recording_queue_size,metrics)
+
+    def submit(self,view:int,img:np.ndarray,stamp:FrameStamp) -> None:
+        '''放入一张输出视图的RGB图像，图像之后不能再被修改'''
+        stream = self._views.get(view)
+        if stream is not None:
+            stream.submit(img,stamp)
+
+    def submit_raw(self,jpeg:np.ndarray,stamp:FrameStamp) -> None:
+        '''放入一帧相机原始 MJPEG 数据'''
+        if self._raw is not None:
+            self._raw.submit(jpeg,stamp)
+
+    def _streams(self) -> List[_EncoderStream]:
+        return list(self._views.values()) + ([self._raw] if self._raw is not None else [])
+
+    def stats(self) -> List[StreamStats]:
+        return [stream.stats() for stream in self._streams()]
+
+    def format_status(self) -> str:
+        '''各路的写出/丢弃帧数和编码延迟，供界面叠加显示'''
+        return '\n'.join(f'rec/{s.name:<10} {s.written:6d} fr  drop {s.dropped:4d}  queue {s.queued:2d}  '
+                         f'lag {s.lag_ms:6.1f} ms (max {s.max_lag_ms:.0f})' for s in self.stats())
+
+    def close(self) -> None:
+        for stream in self._streams():
+            stream.close()
@@ -2,14 +2,21 @@
 初始化场景、渲染牙齿、面部、相机视图。分离出create_tooth_scene、create_camera_scene、render_tooth、render_camera等
 '''
 
+import json
+import os
 import pyrender
 import trimesh
 import numpy as np
 from OpenGL import GL as gl
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
 
+from compositing import composite_camera_view
 from config import Config
+from metrics import StageMetrics
+from sdf_field import SDFField
 
 
 class Renderer(ABC):
@@ -21,72 +28,139 @@ class Renderer(ABC):
     def render_camera(self,pose:np.ndarray) ->np.ndarray:
         pass
 
+
+class MeshLod(NamedTuple):
+    '''一级细节层次：网格及其相对原始网格的几何误差(模型单位，见 preprocessing/lod.py)，原始网格误差为 0'''
+    mesh: trimesh.Trimesh
+    error: float
+
+
+class LodNode:
+    '''
+    按投影到屏幕上的几何误差选择细节层次的网格节点。切换级别时替换节点上的网格，
+    场景中始终只有当前级别，GPU 上也只保留当前级别的顶点缓冲；各级的 pyrender.Mesh 在第一次用到时创建
+    '''
+    COARSEN_MARGIN = 0.8    # 换成更粗的级别时要求误差低于阈值的比例，避免在阈值附近来回切换
+
+    def __init__(self,lods:Sequence[MeshLod],material:pyrender.Material):
+        self.lods = lods
+        self.material = material
+        self._meshes: List[Optional[pyrender.Mesh]] = [None] * len(lods)
+        bounds = lods[0].mesh.bounds
+        self.center = bounds.mean(axis=0)   # 模型坐标系下的包围球
+        self.radius = np.linalg.norm(bounds[1] - bounds[0]) / 2
+        self.level = 0
+        self.node = pyrender.Node(mesh=self._mesh(0))
+
+    def _mesh(self,level:int) -> pyrender.Mesh:
+        if self._meshes[level] is None:
+            self._meshes[level] = pyrender.Mesh.from_trimesh(self.lods[level].mesh,material=self.material)
+        return self._meshes[level]
+
+    def select(self,camera_pose:np.ndarray,yfov:float,viewport_height:int,pixel_error:float) -> int:
+        '''选择投影误差不超过 pixel_error 像素的最粗级别，返回级别下标'''
+        matrix = self.node.matrix
+        scale = np.cbrt(abs(np.linalg.det(matrix[:3,:3])))
+        center = matrix[:3,:3] @ self.center + matrix[:3,3]
+        # 用包围球上离相机最近的点估计，偏保守；相机在包围球内时总是使用原始网格
+        distance = max(np.linalg.norm(camera_pose[:3,3] - center) - self.radius * scale, 1e-3)
+        pixels_per_unit = scale * viewport_height / (2 * np.tan(yfov / 2)) / distance
+        level = 0
+        for i in range(len(self.lods) - 1, 0, -1):
+            limit = pixel_error if i <= self.level else pixel_error * self.COARSEN_MARGIN
+            if self.lods[i].error * pixels_per_unit <= limit:
+                level = i
+                break
+        if level != self.level:
+            self.level = level
+            self.node.mesh = self._mesh(level)
+        return level
+
+
 class PyrenderRenderer(Renderer):
-    def __init__(self,config:Config):
+    # 运行时用到的模型文件
+    MESH_PATHS = {
+        'teeth': '../data/mesh/teeth_double_layer.obj',
+        #'teeth': '../data/mesh/tooth_mesh.obj',
+        'teeth_eroded': '../data/mesh/teeth_double_layer_eroded.obj',
+        'head': '../data/mesh/head_mesh.obj',
+    }
+    # 预处理导出的牙齿距离场，与 teeth_double_layer.obj 同一坐标系
+    SDF_PATH = '../data/mesh/teeth_double_layer.sdf.npy'
+
+    def __init__(self,config:Config,metrics:Optional[StageMetrics]=None,meshes:Optional[Dict[str,List[MeshLod]]]=None):
+        '''meshes 为 load_meshes 的结果，可以在创建GL上下文之前在其他线程中提前加载'''
         self.config = config
-        self.renderer = pyrender.OffscreenRenderer(*config.render_size) # 解包参数  point_size代表渲染点云的点尺寸
+        self.metrics = metrics if metrics is not None else StageMetrics(enabled=False)
+        self.meshes = meshes if meshes is not None else self.load_meshes(config.lod_enabled)
+        # 距离场只是内存映射，打开很快；没有或已过期时瞄准点退回网格射线检测
+        self.sdf = SDFField.load(self.SDF_PATH,self.MESH_PATHS['teeth']) if config.sdf_enabled else None
+        self.probe_distance: Optional[float] = None     # 探头(相机模型原点)到牙齿表面的距离(米)，仅在有距离场时计算
+        self.probe_in_field = False                     # 探头在距离场网格外时 probe_distance 只是下界
+        self.aim_point: Optional[np.ndarray] = None     # 探头中心射线与牙齿的交点(世界坐标)
+        self.aim_distance: Optional[float] = None       # 探头到瞄准点的距离(米)
+        # 牙齿、相机、面部场景各用一个离屏上下文：pyrender 在同一上下文中换场景渲染时，
+        # 会删除上一个场景的顶点缓冲并重新上传，牙齿和相机视图每帧交替渲染，共用上下文时每帧都要重新上传牙齿网格
+        self.renderers = {name: self._create_offscreen_renderer() for name in ('tooth','camera','face')}
+        # 可选的GL级计时，按上下文（即按场景）统计
+        self.profiler = None
+        if config.gl_profiling:
+            from gl_profiler import GLRenderProfiler
+            self.profiler = GLRenderProfiler(config.metrics_window)
+            for name,renderer in self.renderers.items():
+                self.profiler.attach(name,renderer)
         self._init_scenes()
-        self.face_img = self._create_and_render_face_scene()
-        #渲染前启用混合
+        self.face_img = self._render_face_img()
+
+    def _create_offscreen_renderer(self)->pyrender.OffscreenRenderer:
+        renderer = pyrender.OffscreenRenderer(*self.config.render_size) # 解包参数  point_size代表渲染点云的点尺寸
+        #渲染前启用混合（对刚创建的当前上下文生效）
         gl.glEnable(gl.GL_BLEND)
         gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        return renderer
+
+    @classmethod
+    def load_meshes(cls,with_lods:bool=True)->Dict[str,List[MeshLod]]:
+        '''
+        并行读取所有模型文件（不涉及GL，可在任意线程调用）
+        每个模型为从细到粗的 MeshLod 列表，第一个是原始网格；with_lods=False 时只读取原始网格
+        '''
+        files = {name: cls._lod_files(path) if with_lods else [(path,0.0)] for name,path in cls.MESH_PATHS.items()}
+        with ThreadPoolExecutor(max_workers=min(8,sum(len(levels) for levels in files.values()))) as executor:
+            futures = {name: [(executor.submit(trimesh.load_mesh,path),error) for path,error in levels]
+                       for name,levels in files.items()}
+            return {name: [MeshLod(future.result(),error) for future,error in levels] for name,levels in futures.items()}
+
+    @staticmethod
+    def _lod_files(path:str)->List[Tuple[str,float]]:
+        '''原始网格和预处理生成的各级LOD文件及其误差；没有LOD说明文件或说明文件比原始网格旧时只用原始网格'''
+        files = [(path,0.0)]
+        sidecar = f"{os.path.splitext(path)[0]}.lod.json"
+        if not os.path.exists(sidecar):
+            return files
+        if os.path.getmtime(sidecar) < os.path.getmtime(path):
+            print(f"LOD 文件已过期，忽略: {sidecar}")
+            return files
+        with open(sidecar,'r',encoding='utf-8') as f:
+            info = json.load(f)
+        base = os.path.dirname(path)
+        return files + [(os.path.join(base,level['file']),level['error']) for level in info['levels']]
+
+    def _select_lods(self,lod_nodes:Sequence[LodNode],camera_pose:np.ndarray,yfov:float)->None:
+        '''按即将使用的相机位姿为场景中的网格选择细节层次'''
+        if not self.config.lod_enabled:
+            return
+        for lod in lod_nodes:
+            lod.select(camera_pose,yfov,self.config.render_size[1],self.config.lod_pixel_error)
 
     def _init_scenes(self)->None:
-        '''初始化牙齿和相机的两个场景'''
-        self.mesh_origin_trimesh = trimesh.load_mesh('../data/mesh/teeth_double_layer.obj')
-        #self.mesh_origin_trimesh = trimesh.load_mesh('../data/mesh/tooth_mesh.obj')
+        '''初始化牙齿、相机和面部混合图像的场景'''
+        # 射线检测使用原始网格
+        self.mesh_origin_trimesh = self.meshes['teeth'][0].mesh
 
         self.scene_tooth = self._create_tooth_scene()
         self.scene_camera = self._create_camera_scene()
-        self.scene_chessboard = self._create_chessboard_scene()
-
-    def _create_chessboard_scene(self) -> pyrender.Scene:
-        '''创建标定板渲染场景'''
-        scene = pyrender.Scene(bg_color=[0, 0, 0, 0]) # 背景透明（但在Offscreen中通常表现为黑色）
-        
-        # 计算标定板物理尺寸 (假设外围多出一个边框)
-        width = (self.config.chessboard_size[0] + 1) * self.config.chessboard_square_size
-        height = (self.config.chessboard_size[1] + 1) * self.config.chessboard_square_size
-        
-        # 创建一个薄板 (Box)，中心对齐
-        # 注意：OpenCV 棋盘格定义在 Z=0 平面，这里创建一个稍微有一点厚度的板或者平面
-        board_mesh = trimesh.creation.box(extents=[width, height, 0.001])
-        
-        # 将板的中心偏移，使得第一个角点(0,0,0)对应正确位置
-        # trimesh.box 默认中心在原点，而 solvePnP 的原点是第一个内角点
-        # 我们需要根据内角点数量将模型中心平移
-        offset_x = (self.config.chessboard_size[0] - 1) * self.config.chessboard_square_size / 2
-        offset_y = (self.config.chessboard_size[1] - 1) * self.config.chessboard_square_size / 2
-        board_mesh.apply_translation([offset_x, -offset_y, 0])
-
-        material = pyrender.material.MetallicRoughnessMaterial(
-            baseColorFactor=[0.0, 1.0, 0.0, 0.5], # 绿色半透明，方便调试
-            metallicFactor=0,
-            roughnessFactor=1.0
-        )
-        
-        mesh = pyrender.Mesh.from_trimesh(board_mesh, material=material)
-        self.nm_chessboard = pyrender.Node(mesh=mesh)
-        scene.add_node(self.nm_chessboard)
-
-        # 添加相机节点（使用与牙齿渲染一致的相机参数）
-        self.nc_chessboard = pyrender.Node(camera=pyrender.PerspectiveCamera(
-            yfov=self.config.get_yfov(), 
-            aspectRatio=self.config.camera_resolution[0]/self.config.camera_resolution[1]))
-        scene.add_node(self.nc_chessboard)
-        
-        # 添加光照
-        scene.add_node(pyrender.Node(light=pyrender.DirectionalLight(color=[1, 1, 1], intensity=2)))
-        
-        return scene
-    
-    def render_chessboard(self, pose: np.ndarray) -> np.ndarray:
-        '''根据位姿渲染标定板平面'''
-        # 标定板固定在世界原点，移动相机
-        self.scene_chessboard.set_pose(self.nc_chessboard, pose)
-        # 强制渲染分辨率与相机一致，以便叠加
-        img, _ = self.renderer.render(self.scene_chessboard)
-        return img
+        self._create_face_scenes()
 
     def _create_tooth_scene(self)->pyrender.Scene:
         '''
@@ -111,22 +185,21 @@ class PyrenderRenderer(Renderer):
             roughnessFactor= 1,
             baseColorFactor = origin_eroded
         )
-        # init meshes
-        mesh_origin = pyrender.Mesh.from_trimesh(self.mesh_origin_trimesh,material=material_origin)
-        mesh_eroded = pyrender.Mesh.from_trimesh(trimesh.load_mesh('../data/mesh/teeth_double_layer_eroded.obj'),material=material_eroded)
-        # init and add nodes
-        nm_origin = pyrender.Node(mesh=mesh_origin)
-        nm_eroded = pyrender.Node(mesh=mesh_eroded)
+        # init meshes and nodes
+        self.lod_origin = LodNode(self.meshes['teeth'],material_origin)
+        self.lod_eroded = LodNode(self.meshes['teeth_eroded'],material_eroded)
+        self.nm_origin = self.lod_origin.node
+        self.nm_eroded = self.lod_eroded.node
         self.nl_tooth = pyrender.Node(light=pyrender.PointLight(color=[1,1,1],intensity=1)) # note that when falt_shading is true, light is disabled
         
         self.nc_tooth = pyrender.Node(camera=pyrender.PerspectiveCamera(yfov=np.pi * self.config.teeth_fov,aspectRatio=self.config.render_size[0]/self.config.render_size[1]))
-        scene_tooth.add_node(nm_origin)
-        scene_tooth.add_node(nm_eroded)
+        scene_tooth.add_node(self.nm_origin)
+        scene_tooth.add_node(self.nm_eroded)
         scene_tooth.add_node(self.nc_tooth)
         scene_tooth.add_node(self.nl_tooth)        
         # set poses
-        scene_tooth.set_pose(nm_origin,self.config.get_teeth_matrix())
-        scene_tooth.set_pose(nm_eroded,self.config.get_teeth_matrix())
+        scene_tooth.set_pose(self.nm_origin,self.config.get_teeth_matrix())
+        scene_tooth.set_pose(self.nm_eroded,self.config.get_teeth_matrix())
 
         return scene_tooth
 
@@ -167,63 +240,74 @@ class PyrenderRenderer(Renderer):
 
         return scene_camera
 
-    def  _create_and_render_face_scene(self)->np.ndarray:
-        '''预渲染面部和牙齿的混合图像'''
+    def _create_face_scenes(self)->None:
+        '''创建面部和牙齿混合图像用到的两个场景，节点保存为属性，配置变化时只需重新设置位姿并渲染'''
         # firstly create the face img
         # we need confirm the face position
         pose_face = self.config.cpose.copy()
         pose_face[:3,3] += [0,0.01,0]   # 调整，主要为了牙齿和面部图像的匹配
         # create scenes
-        scene_face = pyrender.Scene(bg_color=[255,255,255])
+        self.scene_face = pyrender.Scene(bg_color=[255,255,255])
         # init materials
         material_face = pyrender.material.MetallicRoughnessMaterial(
             metallicFactor= 0,
             roughnessFactor= 0.5,
             baseColorFactor= [0.82, 0.71, 0.59, 1]
         )
-        # init meshes
-        mesh_face = pyrender.Mesh.from_trimesh(trimesh.load_mesh('../data/mesh/head_mesh.obj'),material=material_face)
-        # init and add nodes
-        nm_face = pyrender.Node(mesh=mesh_face)
+        # init meshes and nodes
+        self.lod_face = LodNode(self.meshes['head'],material_face)
+        self.nm_face = self.lod_face.node
         #self.nl_face = pyrender.Node(light=pyrender.PointLight(color=[1,1,1],intensity=30))
         nl_face = pyrender.Node(light=pyrender.DirectionalLight(intensity=2))
-        nc_face = pyrender.Node(camera=pyrender.PerspectiveCamera(
+        self.nc_face = pyrender.Node(camera=pyrender.PerspectiveCamera(
                                 yfov=self.config.render_yfov, 
                                 aspectRatio=self.config.render_size[0]/self.config.render_size[1]))
-        scene_face.add_node(nm_face)
-        scene_face.add_node(nl_face)
-        scene_face.add_node(nc_face)
-        # set poses
-        scene_face.set_pose(nm_face,self.config.get_head_matrix())
-        scene_face.set_pose(nc_face,self.config.campose)
-        face,_ = self.renderer.render(scene_face)
+        self.scene_face.add_node(self.nm_face)
+        self.scene_face.add_node(nl_face)
+        self.scene_face.add_node(self.nc_face)
         # then create the toothimg
         material_origin_camera = pyrender.material.MetallicRoughnessMaterial(
             metallicFactor= 0,
             roughnessFactor= 0.3,
             baseColorFactor= [0.95,0.92,0.85,1],
         )
-        scene_tooth = pyrender.Scene(bg_color=[255,255,255])
-        mesh_tooth = pyrender.Mesh.from_trimesh(self.mesh_origin_trimesh,material=material_origin_camera)
-        nm_tooth = pyrender.Node(mesh=mesh_tooth)
-        scene_tooth.add_node(nm_tooth)
-
-        
-        scene_tooth.add_node(nl_face)
-        scene_tooth.add_node(nc_face)
-        scene_tooth.set_pose(nm_tooth,self.config.get_teeth_matrix())
-        scene_tooth.set_pose(nc_face,self.config.campose)
-        tooth,_ = self.renderer.render(scene_tooth)
+        self.scene_face_tooth = pyrender.Scene(bg_color=[255,255,255])
+        self.lod_face_tooth = LodNode(self.meshes['teeth'],material_origin_camera)
+        self.nm_face_tooth = self.lod_face_tooth.node
+        self.scene_face_tooth.add_node(self.nm_face_tooth)
+        self.scene_face_tooth.add_node(nl_face)
+        self.scene_face_tooth.add_node(self.nc_face)
+
+    def _render_face_img(self)->np.ndarray:
+        '''按当前配置渲染面部和牙齿的混合图像'''
+        self.scene_face.set_pose(self.nm_face,self.config.get_head_matrix())
+        self.scene_face.set_pose(self.nc_face,self.config.campose)
+        self.scene_face_tooth.set_pose(self.nm_face_tooth,self.config.get_teeth_matrix())
+        self.scene_face_tooth.set_pose(self.nc_face,self.config.campose)
+        # 面部在远处且视场较小，通常可以用较粗的级别
+        self._select_lods((self.lod_face,self.lod_face_tooth),self.config.campose,self.config.render_yfov)
+        face,_ = self.renderers['face'].render(self.scene_face)
+        tooth,_ = self.renderers['face'].render(self.scene_face_tooth)
 
         # then render all of them
         face_img = (tooth*(1-self.config.mixed_alpha) + face*self.config.mixed_alpha).astype(np.uint8)
         return face_img
 
+    def apply_config_changes(self,changed:Set[str])->None:
+        '''配置变化后只更新受影响的部分，需在渲染线程中调用'''
+        if changed & {'teeth_trans','teeth_scale'}:
+            self.scene_tooth.set_pose(self.nm_origin,self.config.get_teeth_matrix())
+            self.scene_tooth.set_pose(self.nm_eroded,self.config.get_teeth_matrix())
+        if changed & {'teeth_trans','teeth_scale','head_trans','head_scale','campose'}:
+            # 相机视图的背景，render_camera 每次都会按 config.campose 设置视角
+            self.face_img = self._render_face_img()
+
     def render_tooth(self,pose:np.ndarray) -> np.ndarray:
         '''渲染牙齿视图'''
         self.scene_tooth.set_pose(self.nl_tooth,pose)
         self.scene_tooth.set_pose(self.nc_tooth,pose)
-        img,_ = self.renderer.render(self.scene_tooth,flags = pyrender.RenderFlags.FLAT)
+        self._select_lods((self.lod_origin,self.lod_eroded),pose,np.pi * self.config.teeth_fov)
+        img,_ = self.renderers['tooth'].render(self.scene_tooth,flags = pyrender.RenderFlags.FLAT)
         return img
     
     # def render_camera(self, pose: np.ndarray) -> np.ndarray:
@@ -291,25 +375,23 @@ class PyrenderRenderer(Renderer):
         # 1. 设置物理相机模型位姿
         self.scene_camera.set_pose(self.nm_camera, pose)
         
-        # 2. 准备单根射线：中心方向与相对于原始 Mesh 的起点
+        # 2. 准备单根射线：中心方向
         z_axis = pose[:3, :3] @ np.array([0, 0, -1]) 
-        cam_origin_local = pose[:3, 3] - self.config.teeth_trans
 
         # 3. 执行单次检测
-        locations, _, _ = self.mesh_origin_trimesh.ray.intersects_location(
-            ray_origins=[cam_origin_local],
-            ray_directions=[z_axis],
-            multiple_hits=False
-        )
+        with self.metrics.stage('ray_cast'):
+            if self.sdf is not None:
+                world_hit_point = self._sdf_aim(pose[:3, 3], z_axis)
+            else:
+                world_hit_point = self._mesh_aim(pose[:3, 3], z_axis)
+        self.aim_point = world_hit_point
+        self.aim_distance = None if world_hit_point is None else float(np.linalg.norm(world_hit_point - pose[:3, 3]))
 
         # 4. 处理结果
         outpos = np.eye(4)
         outpos[:3, 3] = [0, 0, 10]
 
-        if len(locations) > 0:
-            # 单点检测直接取第一个交点，加回平移量还原到世界系
-            world_hit_point = locations[0] + self.config.teeth_trans
-            
+        if world_hit_point is not None:
             pos_dot = np.eye(4)
             pos_dot[:3, 3] = world_hit_point
             self.scene_camera.set_pose(self.nm_dot, pos_dot)
@@ -318,18 +400,63 @@ class PyrenderRenderer(Renderer):
 
         # 5. 视角同步与渲染
         self.scene_camera.set_pose(self.nc_camera, self.config.campose)
-        camera_rendering, _ = self.renderer.render(self.scene_camera)
+        camera_rendering, _ = self.renderers['camera'].render(self.scene_camera)
         
         # 6. 图像合成
-        temp = np.sum(camera_rendering, axis=2, dtype=np.uint16)
-        mask = (temp <= 254 * 3)[:, :, np.newaxis]
-        img = (mask * camera_rendering + (~mask) * self.face_img).astype(np.uint8)
-        
-        return img
+        return composite_camera_view(camera_rendering, self.face_img)
+
+    def _mesh_aim(self,origin:np.ndarray,direction:np.ndarray) -> Optional[np.ndarray]:
+        '''用原始网格做射线检测，返回世界坐标交点'''
+        # 相对于原始 Mesh 的起点
+        locations, _, _ = self.mesh_origin_trimesh.ray.intersects_location(
+            ray_origins=[origin - self.config.teeth_trans],
+            ray_directions=[direction],
+            multiple_hits=False
+        )
+        if len(locations) == 0:
+            return None
+        # 单点检测直接取第一个交点，加回平移量还原到世界系
+        return locations[0] + self.config.teeth_trans
+
+    def _sdf_aim(self,origin:np.ndarray,direction:np.ndarray) -> Optional[np.ndarray]:
+        '''用距离场球追踪求交点，同时更新探头到牙齿的距离；在牙齿模型坐标系中计算，距离按牙齿缩放换算回米'''
+        scale = self.config.teeth_scale
+        origin_local = (origin - self.config.teeth_trans) / scale
+        self.probe_in_field = self.sdf.contains(origin_local)
+        self.probe_distance = self.sdf.point_distance(*origin_local.tolist()) * scale
+        hit, _, point = self.sdf.trace_ray(origin_local, direction, self.config.sdf_max_distance / scale,
+                                           self.config.sdf_max_steps)
+        return point * scale + self.config.teeth_trans if hit else None
+
+    def get_render_stats(self) -> Dict[str,dict]:
+        '''
+        各场景(tooth/camera/face)渲染调用的耗时分解：最近一次和滚动窗口的平均值、p95，
+        字段见 gl_profiler.RenderCall；另附各 LOD 节点当前的级别和面数。未开启 config.gl_profiling 时只有后者
+        '''
+        stats = self.profiler.stats() if self.profiler is not None else {}
+        stats['lod'] = {name: {'level': lod.level, 'faces': len(lod.lods[lod.level].mesh.faces)}
+                        for name,lod in (('origin',self.lod_origin),('eroded',self.lod_eroded),
+                                         ('face',self.lod_face),('face_tooth',self.lod_face_tooth))}
+        return stats
+
+    def format_readout(self) -> str:
+        '''探头距离和瞄准点，供界面叠加显示'''
+        # 在界面线程调用，渲染线程可能同时在更新，先取出再判断
+        probe_distance, aim_point, aim_distance = self.probe_distance, self.aim_point, self.aim_distance
+        lines = []
+        if probe_distance is not None:
+            lines.append(f'probe-tooth {"" if self.probe_in_field else ">"}{probe_distance*1000:.2f} mm')
+        if aim_point is not None and aim_distance is not None:
+            x, y, z = aim_point * 1000
+            lines.append(f'aim ({x:.1f}, {y:.1f}, {z:.1f}) mm  range {aim_distance*1000:.1f} mm')
+        else:
+            lines.append('aim -')
+        return '\n'.join(lines)
 
     def cleanup(self)->None:
         '''释放渲染资源'''
-        self.renderer.delete()
+        for renderer in self.renderers.values():
+            renderer.delete()
 
 
 
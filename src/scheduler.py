@@ -0,0 +1,134 @@
+'''
+输出视图的调度：根据位姿变化判断哪些视图需要重新渲染（脏标记），按各视图目标帧率和优先级在帧时间预算内安排渲染
+'''
+
+import collections
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import Config
+
+
+class DirtyTracker:
+    '''
+    记录每个视图上一次渲染时使用的位姿，新位姿与之相比超过阈值才标记为脏
+    与“上一次渲染”而不是“上一帧”比较，缓慢漂移累计超过阈值后同样会触发更新
+    '''
+    # 只依赖朝向的视图（三个轴视图只画相机z轴的投影）
+    ROTATION_ONLY_VIEWS = (2, 3, 4)
+
+    def __init__(self, config: Config):
+        self.config = config
+        self._last_poses: List[Optional[np.ndarray]] = [None] * len(config.view_names)
+
+    @staticmethod
+    def _rotation_angle(R_a: np.ndarray, R_b: np.ndarray) -> float:
+        '''两个旋转矩阵之间的夹角(弧度)'''
+        cos = (np.trace(R_a.T @ R_b) - 1.0) / 2.0
+        return float(np.arccos(np.clip(cos, -1.0, 1.0)))
+
+    def is_dirty(self, view: int, pose: np.ndarray) -> bool:
+        '''判断单个视图在新位姿下是否需要更新'''
+        if not self.config.dirty_tracking:
+            return True
+        last = self._last_poses[view]
+        if last is None:
+            return True
+        if self._rotation_angle(last[:3, :3], pose[:3, :3]) > self.config.pose_rot_threshold:
+            return True
+        if view in self.ROTATION_ONLY_VIEWS:
+            return False
+        return float(np.linalg.norm(last[:3, 3] - pose[:3, 3])) > self.config.pose_trans_threshold
+
+    def dirty_views(self, pose: np.ndarray, views: Sequence[int]) -> List[int]:
+        '''返回 views 中需要重新渲染的视图下标'''
+        return [view for view in views if self.is_dirty(view, pose)]
+
+    def mark_clean(self, view: int, pose: np.ndarray) -> None:
+        '''视图已按该位姿渲染并发送'''
+        self._last_poses[view] = pose.copy()
+
+    def invalidate(self, views: Optional[Sequence[int]] = None) -> None:
+        '''强制下次更新（例如配置改变后），views 为空表示全部视图'''
+        for view in (range(len(self._last_poses)) if views is None else views):
+            self._last_poses[view] = None
+
+
+class ViewScheduler:
+    '''
+    每个视图有目标帧率和优先级(数值越小越重要)。每个循环按优先级依次尝试到期的视图，
+    预计耗时(历史耗时的滑动平均)超出本帧预算时推迟低优先级视图；最高优先级的视图不受预算限制，
+    被连续推迟过多次的视图也会强制执行，避免饿死。
+    到期按计划时刻判断：每次运行占用一个计划时刻（上一个时刻加间隔），而不是按渲染完成的时间，
+    相机帧的到达时间有抖动，提前不到半帧也算到期，目标帧率等于相机帧率的视图每帧都会更新
+    '''
+    def __init__(self, config: Config):
+        self.config = config
+        names = config.view_names
+        self._interval_ns = [self._rate_to_interval(config.view_target_fps.get(name, 0)) for name in names]
+        self._priority = [config.view_priority.get(name, len(names)) for name in names]
+        self._top_priority = min(self._priority)
+        self._last_run_ns: List[Optional[int]] = [None] * len(names)  # 上一次运行占用的计划时刻
+        self._slack_ns = self._rate_to_interval(config.camera_fps) // 2
+        self._cost_ns = [0.0] * len(names)      # 渲染耗时的指数滑动平均
+        self._deferred = [0] * len(names)       # 连续被推迟的次数
+        self._run_times = [collections.deque(maxlen=120) for _ in names]   # 用于统计实际帧率
+        self._cycle_start_ns = 0
+
+    @staticmethod
+    def _rate_to_interval(fps: float) -> int:
+        '''目标帧率转换为最小间隔，<=0 表示不限速'''
+        return int(1e9 / fps) if fps and fps > 0 else 0
+
+    def begin_cycle(self) -> None:
+        '''每帧开始处理时调用，预算从这里开始计算'''
+        self._cycle_start_ns = time.perf_counter_ns()
+
+    def due_views(self, candidates: Sequence[int]) -> List[int]:
+        '''候选视图中已到更新时间的，按优先级排序'''
+        now = self._cycle_start_ns + self._slack_ns
+        due = [view for view in candidates
+               if self._last_run_ns[view] is None or now - self._last_run_ns[view] >= self._interval_ns[view]]
+        return sorted(due, key=lambda view: self._priority[view])
+
+    def fits(self, view: int) -> bool:
+        '''判断该视图能否放进本帧剩余预算，不能则记为推迟一次'''
+        if self._priority[view] == self._top_priority or self._deferred[view] >= self.config.max_view_deferrals:
+            return True
+        elapsed = time.perf_counter_ns() - self._cycle_start_ns
+        if elapsed + self._cost_ns[view] <= self.config.frame_budget_ms * 1e6:
+            return True
+        self._deferred[view] += 1
+        return False
+
+    def record_run(self, view: int, elapsed_ns: int) -> None:
+        '''视图渲染完成后记录耗时'''
+        now = time.perf_counter_ns()
+        last = self._last_run_ns[view]
+        # 沿计划时刻前进；推迟或长时间没有候选后从本帧重新开始，不会连续补跑
+        if last is None:
+            self._last_run_ns[view] = self._cycle_start_ns
+        else:
+            self._last_run_ns[view] = max(last + self._interval_ns[view], self._cycle_start_ns)
+        self._deferred[view] = 0
+        cost = self._cost_ns[view]
+        self._cost_ns[view] = elapsed_ns if cost == 0 else 0.8 * cost + 0.2 * elapsed_ns
+        self._run_times[view].append(now)
+
+    def achieved_rates(self) -> Dict[str, float]:
+        '''各视图最近实际达到的更新频率(Hz)'''
+        rates = {}
+        now = time.perf_counter_ns()
+        for name, times in zip(self.config.view_names, self._run_times):
+            # 超过2秒没有更新视为0，避免静止时一直显示旧的频率
+            if len(times) < 2 or now - times[-1] > 2e9:
+                rates[name] = 0.0
+            else:
+                rates[name] = (len(times) - 1) * 1e9 / (times[-1] - times[0])
+        return rates
+
+    def format_rates(self) -> str:
+        '''用于界面叠加显示的简短文本'''
+        return '\n'.join(f'{name:<8}{rate:5.1f} Hz' for name, rate in self.achieved_rates().items())
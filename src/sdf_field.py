@@ -0,0 +1,176 @@
+'''
+运行时牙齿距离场：读取预处理导出的 teeth_double_layer.sdf.npy（与 teeth_double_layer.obj 同一坐标系，
+见 preprocessing/process_teeth.py 的 export_sdf），内存映射，按需读取用到的页。
+提供三线性插值的距离查询和向量化的球追踪射线检测，每帧的探头-牙齿距离和瞄准点不需要做三角形求交
+'''
+
+import json
+import math
+import os
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+class TraceResult(NamedTuple):
+    '''球追踪结果，均为每根射线一个值'''
+    hit: np.ndarray         # 是否命中表面 (bool)
+    t: np.ndarray           # 沿(单位)方向的距离，未命中时为停止处
+    points: np.ndarray      # 命中点/停止点 (N,3)
+
+
+class SDFField:
+    '''
+    规则网格上的有符号距离场，表面外为正。values[i,j,k] 为点 origin + spacing*(i,j,k) 处的距离（模型单位）
+    网格之外返回距离下界 max(到网格的距离, 网格上最近点的值 - 到网格的距离)，球追踪从远处进入网格时不会越过表面
+    '''
+
+    def __init__(self,values:np.ndarray,origin,spacing:float):
+        self.values = values
+        # 内存映射数组转为普通 ndarray 视图（不复制），按一维下标一次取出八个角点，小批量查询时开销小得多
+        self._flat = np.asarray(values).reshape(-1)
+        self._corner_offsets = np.array([(dx*values.shape[1] + dy)*values.shape[2] + dz
+                                         for dx in (0,1) for dy in (0,1) for dz in (0,1)],dtype=np.intp)
+        self.origin = np.asarray(origin,dtype=np.float64)
+        self.spacing = float(spacing)
+        self._max_index = np.array(values.shape,dtype=np.float64) - 1
+        self.bounds = np.array([self.origin, self.origin + self._max_index * self.spacing])
+        self._scalar_grid = (tuple(self.origin.tolist()),self.spacing,tuple(self._max_index.tolist()))
+
+    @classmethod
+    def load(cls,path:str,mesh_path:Optional[str]=None) -> Optional['SDFField']:
+        '''
+        内存映射读取 .npy 及同名 .json 中的原点和间距；文件不存在或比 mesh_path 旧（网格重新生成过）时返回 None
+        '''
+        sidecar = f"{os.path.splitext(path)[0]}.json"
+        if not (os.path.exists(path) and os.path.exists(sidecar)):
+            return None
+        if mesh_path is not None and os.path.exists(mesh_path) and os.path.getmtime(path) < os.path.getmtime(mesh_path):
+            print(f"SDF 文件已过期，忽略: {path}")
+            return None
+        with open(sidecar,'r',encoding='utf-8') as f:
+            info = json.load(f)
+        values = np.load(path,mmap_mode='r')
+        if list(values.shape) != list(info['shape']):
+            print(f"SDF 文件与说明文件不一致，忽略: {path}")
+            return None
+        return cls(values,info['origin'],info['spacing'])
+
+    def contains(self,point) -> bool:
+        '''点是否在网格范围内（范围内的距离为插值结果，范围外为下界）'''
+        return bool(np.all((point >= self.bounds[0]) & (point <= self.bounds[1])))
+
+    def distance(self,points:np.ndarray) -> np.ndarray:
+        '''点 (N,3) 或 (3,) 处的有符号距离，三线性插值'''
+        points = np.asarray(points,dtype=np.float64)
+        single = points.ndim == 1
+        points = np.atleast_2d(points)
+        index = (points - self.origin) / self.spacing
+        clamped = np.clip(index,0.0,self._max_index)
+        base = np.minimum(np.floor(clamped).astype(np.intp),np.maximum(self._max_index.astype(np.intp) - 1,0))
+        frac = clamped - base
+        flat = (base[:,0]*self.values.shape[1] + base[:,1])*self.values.shape[2] + base[:,2]
+        # 八个角点 (N,2,2,2)，下标依次为 x、y、z 方向的 0/1，再沿 z、y、x 依次插值
+        c = self._flat.take(flat[:,None] + self._corner_offsets).reshape(-1,2,2,2)
+        fx,fy,fz = (frac[:,axis,None,None,None] for axis in range(3))
+        c = c[...,0:1]*(1-fz) + c[...,1:2]*fz
+        c = c[:,:,0:1]*(1-fy) + c[:,:,1:2]*fy
+        values = (c[:,0:1]*(1-fx) + c[:,1:2]*fx).reshape(-1)
+        outside = np.linalg.norm(index - clamped,axis=1) * self.spacing
+        result = np.where(outside > 0,np.maximum(outside,values - outside),values)
+        return result[0] if single else result
+
+    def point_distance(self,x:float,y:float,z:float) -> float:
+        '''单个点的距离，与 distance 结果相同。纯 Python 标量计算，每帧一两次的查询避免 numpy 小数组的调用开销'''
+        (ox,oy,oz),h,(mx,my,mz) = self._scalar_grid
+        ix,iy,iz = (x - ox) / h,(y - oy) / h,(z - oz) / h
+        cx,cy,cz = min(max(ix,0.0),mx),min(max(iy,0.0),my),min(max(iz,0.0),mz)
+        bx,by,bz = min(int(cx),int(mx) - 1),min(int(cy),int(my) - 1),min(int(cz),int(mz) - 1)
+        fx,fy,fz = cx - bx,cy - by,cz - bz
+        sy,sz = int(my) + 1,int(mz) + 1
+        i = (bx*sy + by)*sz + bz
+        c = self._flat[i:i + sz + 2].tolist(), self._flat[i + sy*sz:i + sy*sz + sz + 2].tolist()
+        # c[dx] 从 (bx+dx, by, bz) 开始的一段，[0],[1] 为 dy=0，[sz],[sz+1] 为 dy=1
+        x0 = (c[0][0]*(1-fz) + c[0][1]*fz)*(1-fy) + (c[0][sz]*(1-fz) + c[0][sz+1]*fz)*fy
+        x1 = (c[1][0]*(1-fz) + c[1][1]*fz)*(1-fy) + (c[1][sz]*(1-fz) + c[1][sz+1]*fz)*fy
+        value = x0*(1-fx) + x1*fx
+        if ix == cx and iy == cy and iz == cz:
+            return value
+        outside = math.sqrt((ix-cx)**2 + (iy-cy)**2 + (iz-cz)**2) * h
+        return max(outside,value - outside)
+
+    def trace_ray(self,origin,direction,max_distance:float,max_steps:int=64,
+                  eps:Optional[float]=None) -> Tuple[bool,float,np.ndarray]:
+        '''单根射线的球追踪（标量版 sphere_trace），返回 (是否命中, 距离, 命中点/停止点)'''
+        ox,oy,oz = (float(v) for v in origin)
+        norm = math.hypot(*direction)
+        dx,dy,dz = (float(v) / norm for v in direction)
+        if eps is None:
+            eps = 0.05 * self.spacing
+        t_lo = t = 0.0
+        d_lo = self.point_distance(ox,oy,oz)
+        t_hi = d_hi = None
+        hit = d_lo < 0
+        for _ in range(0 if hit else max_steps):
+            d = self.point_distance(ox + dx*t,oy + dy*t,oz + dz*t)
+            if abs(d) < eps:
+                hit = True
+                break
+            if d > 0:
+                t_lo,d_lo = t,d
+            else:
+                t_hi,d_hi = t,d
+            if t_hi is None:
+                t = t + d
+                if t > max_distance:
+                    break
+            else:
+                # 已越过表面：在 [t_lo, t_hi] 内按线性插值逼近，不会来回振荡
+                t = t_lo + (t_hi - t_lo) * d_lo / (d_lo - d_hi)
+                if t_hi - t_lo < eps:
+                    hit = True
+                    break
+        else:
+            hit = hit or t_hi is not None
+        return hit,t,np.array([ox + dx*t,oy + dy*t,oz + dz*t])
+
+    def sphere_trace(self,origins:np.ndarray,directions:np.ndarray,max_distance:float,
+                     max_steps:int=64,eps:Optional[float]=None) -> TraceResult:
+        '''
+        向量化球追踪：每一步沿射线前进当前点的距离值，|距离| < eps 视为命中。
+        插值后的距离场在表面附近可能略大于真实距离，越过表面（距离为负）后在最后一个正值和负值之间按线性插值逼近；
+        起点在牙齿内部时直接在起点命中。
+        origins、directions 为 (N,3)，方向不要求单位长度；max_distance 为沿射线的最远距离，eps 默认取网格间距的 5%
+        '''
+        origins = np.atleast_2d(np.asarray(origins,dtype=np.float64))
+        directions = np.atleast_2d(np.asarray(directions,dtype=np.float64))
+        directions = directions / np.linalg.norm(directions,axis=1,keepdims=True)
+        if eps is None:
+            eps = 0.05 * self.spacing
+        n = len(origins)
+        t = np.zeros(n)
+        t_lo, d_lo = np.zeros(n), self.distance(origins)
+        t_hi, d_hi = np.full(n,np.inf), np.zeros(n)
+        hit = d_lo < 0
+        active = ~hit
+        for _ in range(max_steps):
+            if not active.any():
+                break
+            idx = np.flatnonzero(active)
+            d = self.distance(origins[idx] + directions[idx] * t[idx,None])
+            converged = np.abs(d) < eps
+            positive = d > 0
+            t_lo[idx] = np.where(positive,t[idx],t_lo[idx])
+            d_lo[idx] = np.where(positive,d,d_lo[idx])
+            t_hi[idx] = np.where(positive,t_hi[idx],t[idx])
+            d_hi[idx] = np.where(positive,d_hi[idx],d)
+            bracketed = np.isfinite(t_hi[idx])
+            with np.errstate(invalid='ignore'):
+                secant = t_lo[idx] + (t_hi[idx] - t_lo[idx]) * d_lo[idx] / (d_lo[idx] - d_hi[idx])
+            step = np.where(bracketed,secant,t[idx] + d)
+            converged |= bracketed & (t_hi[idx] - t_lo[idx] < eps)
+            t[idx] = np.where(converged,t[idx],step)
+            hit[idx[converged]] = True
+            active[idx] = ~converged & (bracketed | (t[idx] <= max_distance))
+        hit |= active & np.isfinite(t_hi)
+        return TraceResult(hit,t,origins + directions * t[:,None])
@@ -0,0 +1,167 @@
+'''
+会话日志：每帧的序号、时间戳、检测结果、角点、rvec/tvec、重投影误差和 pyrender 位姿，以定长结构化记录追加写入二进制文件。
+渲染线程只把数值填进预分配的记录块，写文件由后台线程完成，没有文本格式化，可以一直开着。
+文件没有文件头，是记录的简单拼接，同名 .json 记录 dtype 和会话参数，可以直接用 np.memmap 打开：
+    log = load_session('../temp/sessions/session_20260101_120000.poselog')
+    poses = session_poses(log)      # 检测成功帧的 pose_pyrender，可交给 offline_renderer.render_trajectory 重新渲染
+'''
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+LOG_VERSION = 1
+LOG_EXTENSION = '.poselog'
+
+
+def record_dtype(n_corners: int) -> np.dtype:
+    '''一帧的记录格式，角点数在会话开始时固定（取当时的 selected_indices 数量）'''
+    return np.dtype([
+        ('seq', '<u8'),                     # 采集序号
+        ('t_capture_ns', '<i8'),            # 采集时刻 perf_counter_ns
+        ('t_logged_ns', '<i8'),             # 写入日志时刻（位姿求解完成）
+        ('detected', 'u1'),                 # 是否求得位姿
+        ('n_cameras', 'u1'),                # 参与融合的相机数（单相机为 1）
+        ('n_corners', '<u2'),               # corners 中有效的角点数
+        ('error', '<f4'),                   # 重投影误差(像素)，未检测到时为 NaN
+        ('corners', '<f4', (n_corners, 2)), # 参考相机的角点像素坐标，未检测到时为 NaN
+        ('rvec', '<f8', (3,)),              # 标定板 -> 参考相机 (OpenCV)
+        ('tvec', '<f8', (3,)),
+        ('pose', '<f8', (4, 4)),            # pose_pyrender，未检测到时为 NaN
+    ])
+
+
+def _dtype_from_json(descr) -> np.dtype:
+    '''JSON 中的 dtype.descr：元组变成了列表，子数组形状需要还原为元组'''
+    return np.dtype([(field[0], field[1]) if len(field) == 2 else (field[0], field[1], tuple(field[2]))
+                     for field in descr])
+
+
+def load_session(path: str, mode: str = 'r') -> np.memmap:
+    '''按 .json 中的 dtype 内存映射日志文件；末尾不完整的记录（写入中途退出）被忽略'''
+    with open(f"{os.path.splitext(path)[0]}.json", 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    dtype = _dtype_from_json(meta['dtype'])
+    count = os.path.getsize(path) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, shape=(count,))
+
+
+def session_poses(log: np.ndarray) -> np.ndarray:
+    '''检测成功的帧的 pose_pyrender，(N,4,4)'''
+    return np.asarray(log['pose'][log['detected'] == 1])
+
+
+class SessionLog:
+    '''
+    后台写入的会话日志。append 在渲染线程调用，只做数值赋值；记录块写满或超过 flush_interval 秒时由写线程写出，
+    写出后的块回收复用，稳定运行时不分配内存
+    '''
+    def __init__(self, path: str, n_corners: int, meta: Optional[dict] = None,
+                 block_size: int = 256, flush_interval: float = 1.0):
+        self.path = path
+        self.dtype = record_dtype(n_corners)
+        self.n_corners = n_corners
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.count = 0              # 已追加的记录数
+        self.dropped = 0            # 写线程跟不上、空闲块用完时丢弃的记录数
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(f"{os.path.splitext(path)[0]}.json", 'w', encoding='utf-8') as f:
+            json.dump({'version': LOG_VERSION, 'dtype': self.dtype.descr, 'record_size': self.dtype.itemsize,
+                       'start_time': time.strftime('%Y-%m-%dT%H:%M:%S'), **(meta or {})}, f, indent=2)
+        self._file = open(path, 'wb')
+        self._lock = threading.Lock()
+        self._free: 'queue.Queue' = queue.Queue()
+        for _ in range(4):
+            self._free.put(np.zeros(block_size, dtype=self.dtype))
+        self._full: 'queue.Queue' = queue.Queue()
+        self._block = self._free.get()
+        self._fill = 0
+        self._block_started = time.monotonic()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='session-log', daemon=True)
+        self._thread.start()
+
+    def append(self, seq: int, t_capture_ns: int, detected: bool, corners: Optional[np.ndarray] = None,
+               rvec: Optional[np.ndarray] = None, tvec: Optional[np.ndarray] = None, error: float = np.nan,
+               pose: Optional[np.ndarray] = None, n_cameras: int = 1) -> None:
+        '''追加一帧；未检测到时只需给出序号和时间戳，其余字段为 NaN。close 之后调用时什么也不做'''
+        with self._lock:
+            if self._closed:
+                return
+            if self._block is None:
+                self.dropped += 1
+                return
+            record = self._block[self._fill]
+            record['seq'] = seq
+            record['t_capture_ns'] = t_capture_ns
+            record['t_logged_ns'] = time.perf_counter_ns()
+            record['detected'] = detected
+            record['n_cameras'] = n_cameras if detected else 0
+            record['error'] = error
+            if corners is not None:
+                corners = corners.reshape(-1, 2)
+                n = min(len(corners), self.n_corners)   # selected_indices 在会话中途改变时截断
+                record['corners'][:n] = corners[:n]
+                record['corners'][n:] = np.nan
+                record['n_corners'] = n
+            else:
+                record['corners'] = np.nan
+                record['n_corners'] = 0
+            record['rvec'] = np.nan if rvec is None else rvec.reshape(3)
+            record['tvec'] = np.nan if tvec is None else tvec.reshape(3)
+            record['pose'] = np.nan if pose is None else pose
+            self._fill += 1
+            self.count += 1
+            if self._fill == self.block_size:
+                self._hand_off()
+
+    def _hand_off(self) -> None:
+        '''把当前块交给写线程并换一个空闲块，调用时持有锁'''
+        self._full.put((self._block, self._fill))
+        try:
+            self._block = self._free.get_nowait()
+        except queue.Empty:
+            self._block = None      # 写线程还没写完，append 暂时丢弃记录
+        self._fill = 0
+        self._block_started = time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                block, fill = self._full.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # 记录很少时也定期写出，异常退出时最多丢失 flush_interval 秒
+                with self._lock:
+                    if self._fill > 0 and self._block is not None and time.monotonic() - self._block_started >= self.flush_interval:
+                        self._hand_off()
+                continue
+            if block is None:   # close
+                break
+            self._file.write(block[:fill].tobytes())
+            self._file.flush()
+            with self._lock:
+                if self._block is None and not self._closed:
+                    self._block = block
+                else:
+                    self._free.put(block)
+
+    def close(self) -> None:
+        '''写出剩余记录并关闭文件，重复调用无效'''
+        with self._lock:
+            if self._closed:
+                return
+            if self._fill > 0 and self._block is not None:
+                self._hand_off()
+            self._block = None      # 之后的 append 不再记录
+            self._closed = True
+            self._full.put((None, 0))
+        self._thread.join()
+        self._file.close()